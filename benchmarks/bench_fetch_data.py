@@ -0,0 +1,168 @@
+"""
+=====[ tinySA Ultra / Serial Framing Benchmark ]================================
+
+Compares the original byte-at-a-time '_fetch_data' reader with the buffered,
+prompt delimited reader in 'tinysa_ultra.py'.
+
+No hardware is needed, the serial port is replaced with an in memory port
+that answers each command with a canned tinySA style response. The inter
+command delays are set to zero so only the framing / parsing cost is measured.
+
+Usage:
+    python benchmarks/bench_fetch_data.py [--repeat N]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tinysa_ultra as tsa  # noqa: E402
+
+
+POINTS = 450
+USB_PACKET_SIZE = 64
+
+
+# * ===== Canned Serial Port ===================================================
+class CannedSerial:
+    """Minimal in memory stand-in for 'serial.Serial'.
+
+    Each command line written is answered with: command echo, canned response and the
+    'ch> ' prompt. Responses are keyed by the exact command, or '<cmd> *' to match any arguments.
+    The response becomes readable in USB CDC sized packets, like the real port.
+    """
+    def __init__(self, responses: dict[str, str | bytes]):
+        self.responses = responses
+        self.pending = bytearray()
+
+    @property
+    def in_waiting(self) -> int:
+        return min(len(self.pending), USB_PACKET_SIZE)
+
+    def write(self, data: bytes) -> int:
+        # A transaction writes several command lines at once
+        for cmd in data.decode().split("\r"):
+            cmd = cmd.strip()
+            if not cmd:
+                continue
+            self.pending += (cmd + "\r\n").encode()
+            # Exact command match first, then '<cmd> *' for commands with any arguments
+            response = self.responses.get(cmd)
+            if response is None:
+                response = self.responses.get(cmd.split(" ")[0] + " *", "")
+            self.pending += response.encode() if isinstance(response, str) else response
+            self.pending += b"ch> "
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        chunk = bytes(self.pending[:size])
+        del self.pending[:size]
+        return chunk
+
+    def readline(self) -> bytes:
+        i = self.pending.find(b"\n")
+        return self.read(len(self.pending) if i < 0 else i + 1)
+
+    def close(self) -> None:
+        pass
+
+
+def canned_responses() -> dict[str, str]:
+    amps = "".join(f"{-80.0 - (i % 17) * 0.37:.6e}\r\n" for i in range(POINTS))
+    freqs = "".join(f"{10_001_000 + i * 4:d}\r\n" for i in range(POINTS))
+    return {
+        "data 2": amps,
+        "frequencies": freqs,
+        "marker 1": "1 225 10000000 -1.23e+01\r\n",
+        "sweep": "10001000 10003000 450\r\n",
+        "version": "tinySA4_v1.4-156-g4eb315d\r\nHW Version:V0.4.5.1.1\r\n",
+    }
+
+
+# * ===== Legacy Reader ========================================================
+class LegacyTinySA(tsa.tinySA):
+    """The driver as it was before the buffered reader, kept for comparison."""
+
+    def _write_command(self, cmd) -> None:
+        # The echo is read straight from the port, the receive buffer of the new reader is never used
+        self.serial.write(cmd.encode())
+        time.sleep(tsa.INTER_CMD_DELAY)
+        _ = self.serial.readline()  # discard empty line
+        time.sleep(tsa.INTER_CMD_DELAY)
+
+    def _send_command(self, cmd, timeout: float = tsa.COMMAND_TIMEOUT) -> None:
+        self._write_command(cmd)
+
+    def _fetch_data(self) -> str:
+        result = ""
+        line = ""
+        time_start = time.time()
+        while True:
+            c = self.serial.read().decode("utf-8")
+            if c == chr(13):
+                continue  # ignore CR
+            line += c
+            if c == chr(10):
+                result += line
+                line = ""
+                continue
+            if line.endswith("ch>"):
+                # stop on prompt
+                break
+            delta_time = time.time() - time_start
+            if delta_time > tsa.FETCH_DATA_TIMEOUT:
+                break
+        time.sleep(tsa.INTER_CMD_DELAY)
+        return result
+
+
+# * ===== Benchmark ============================================================
+COMMANDS = {
+    "data 2": lambda sa: sa.get_amp_data(),
+    "frequencies": lambda sa: sa._fetch_frequencies(),     # get_freq_data() is computed from the sweep cache
+    "marker 1": lambda sa: sa.get_marker_value(),
+    "sweep": lambda sa: sa.get_sweep(),
+    "version": lambda sa: sa.get_version(),
+}
+
+
+def run(driver_class, repeat: int) -> dict[str, tuple[float, float]]:
+    responses = canned_responses()
+    sa = driver_class(dev='canned')
+    sa.serial = CannedSerial(responses)
+
+    results = {}
+    for name, func in COMMANDS.items():
+        time_start = time.perf_counter()
+        for _ in range(repeat):
+            func(sa)
+        elapsed = time.perf_counter() - time_start
+        # Bytes per command = echo + response + prompt
+        n_bytes = repeat * (len(name) + 2 + len(responses[name]) + 4)
+        results[name] = (elapsed / repeat, n_bytes / elapsed)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='tinySA serial framing benchmark')
+    parser.add_argument('--repeat', type=int, default=50, help='Repetitions per command')
+    args = parser.parse_args()
+
+    tsa.INTER_CMD_DELAY = 0.0
+
+    legacy = run(LegacyTinySA, args.repeat)
+    buffered = run(tsa.tinySA, args.repeat)
+
+    print(f'{"Command":<14}{"Legacy ms":>12}{"Buffered ms":>14}{"Legacy kB/s":>14}{"Buffered kB/s":>16}{"Speedup":>10}')
+    for name in COMMANDS:
+        l_lat, l_rate = legacy[name]
+        b_lat, b_rate = buffered[name]
+        print(f'{name:<14}{l_lat*1e3:>12.3f}{b_lat*1e3:>14.3f}{l_rate/1e3:>14.1f}{b_rate/1e3:>16.1f}{l_lat/b_lat:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
+
+# ----- Fini -----
@@ -0,0 +1,126 @@
+"""
+=====[ tinySA Ultra / App Import Time Profile ]=================================
+
+Measures how long importing the GUI app takes, i.e. the time before the
+window can show, with 'python -X importtime' in a fresh interpreter.
+
+The app only imports the GUI toolkit at startup, everything heavy is
+imported where it is first used (see the top of the app). This profile
+guards that: the checked in 'import_profile.json' has the cold start budget
+and the modules that must not be imported at startup.
+
+Usage:
+    python benchmarks/bench_import_time.py              Profile, top imports
+    python benchmarks/bench_import_time.py --check      Exit 1 if over budget or a deferred module is imported
+    python benchmarks/bench_import_time.py --write      Update the profile in 'import_profile.json'
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+PROFILE_FILE = os.path.join(HERE, 'import_profile.json')
+
+APP_MODULE = 'tinysa_ultra_phase_noise_app'
+
+# Defaults for a new profile file, the checked in file has the values in use
+BUDGET_MS = 250.0
+DEFERRED_MODULES = ['numpy', 'matplotlib', 'serial', 'asyncio', 'sqlite3',
+                    'phase_noise', 'tinysa_ultra', 'live_plot', 'pn_analysis']
+
+
+def import_times(module: str) -> list[tuple[str, int, float, float]]:
+    """Imports 'module' in a fresh interpreter.
+
+    Returns:
+        list[tuple[str, int, float, float]]: (Module, nesting level, self ms, cumulative ms) per import.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=SRC, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), level, int(self_us) / 1e3, int(cumulative_us) / 1e3))
+    return times
+
+
+def profile(repeat: int) -> tuple[float, list[tuple[str, int, float, float]]]:
+    """Best of 'repeat' runs, the app's cumulative ms and the imports it made in that run."""
+    best = None
+    for _ in range(repeat):
+        times = import_times(APP_MODULE)
+        # -X importtime lists the imports of a module just before the module itself
+        end = next(i for i, t in enumerate(times) if t[0] == APP_MODULE and t[1] == 0)
+        start = end
+        while start > 0 and times[start - 1][1] > 0:
+            start -= 1
+        if best is None or times[end][3] < best[0]:
+            best = (times[end][3], times[start:end])
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='App import time profile')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs, the fastest is used')
+    parser.add_argument('--top', type=int, default=15, help='Slowest top level imports to list')
+    parser.add_argument('--check', action='store_true', help='Check against the budget in the profile file')
+    parser.add_argument('--write', action='store_true', help='Write the profile file')
+    args = parser.parse_args()
+
+    saved = {'budget_ms': BUDGET_MS, 'deferred_modules': DEFERRED_MODULES}
+    if os.path.exists(PROFILE_FILE):
+        with open(PROFILE_FILE, encoding='utf-8') as f:
+            saved = json.load(f)
+
+    total, times = profile(args.repeat)
+    imported = {name for name, *_ in times}
+    deferred = [m for m in saved['deferred_modules']
+                if m in imported or any(name.startswith(m + '.') for name in imported)]
+    top = sorted((t for t in times if t[1] == 1), key=lambda t: t[3], reverse=True)[:args.top]
+
+    print(f'{APP_MODULE} import: {total:.1f} ms (budget {saved["budget_ms"]:.0f} ms), {len(times)} modules')
+    for name, _, _, cumulative in top:
+        print(f'  {cumulative:8.1f} ms  {name}')
+
+    if args.write:
+        saved.update({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'import_ms': round(total, 1),
+            'modules': len(times),
+            'top_imports_ms': {name: round(cumulative, 1) for name, _, _, cumulative in top},
+        })
+        with open(PROFILE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(saved, f, indent=2)
+            f.write('\n')
+        print(f'Profile written to: {PROFILE_FILE}')
+
+    if args.check:
+        failed = False
+        if deferred:
+            print(f'FAIL: imported at startup, should be deferred: {", ".join(deferred)}')
+            failed = True
+        if total > saved['budget_ms']:
+            print(f'FAIL: {total:.1f} ms is over the {saved["budget_ms"]:.0f} ms budget')
+            failed = True
+        if not failed:
+            print('OK')
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# ----- Fini -----
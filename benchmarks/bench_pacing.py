@@ -0,0 +1,57 @@
+"""
+=====[ tinySA Ultra / Command Pacing Timing Report ]============================
+
+Runs the full 'phase_noise.run_phase_noise' offset sweep against an instantly
+answering in memory tinySA, once with the legacy fixed delay pacing and once
+with the prompt driven command completion.
+
+Since the port answers instantly, the time reported is the time the driver
+spends pacing itself, that is the time the new engine saves per run.
+
+Usage:
+    python benchmarks/bench_pacing.py [--average off|aver4|aver16] [--recenter]
+"""
+import time
+import argparse
+
+from bench_fetch_data import CannedSerial, canned_responses
+
+import tinysa_ultra as tsa
+import phase_noise
+
+
+class NullWindow:
+    """Stands in for the GUI window, progress messages are dropped."""
+    def write_event_value(self, key, value) -> None:
+        pass
+
+
+def run(legacy_pacing: bool) -> float:
+    phase_noise.sa = tsa.tinySA(legacy_pacing=legacy_pacing, transport=CannedSerial(canned_responses()))
+    time_start = time.perf_counter()
+    phase_noise.run_phase_noise(NullWindow())
+    return time.perf_counter() - time_start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='tinySA command pacing timing report')
+    parser.add_argument('--average', default='off', choices=['off', 'aver4', 'aver16'])
+    parser.add_argument('--recenter', action='store_true', help='Recenter after each band')
+    args = parser.parse_args()
+
+    phase_noise.PN_AVERAGE = args.average
+    phase_noise.PN_RECENTER = args.recenter
+
+    legacy = run(True)
+    prompt = run(False)
+
+    print(f'Offset sweep, average = {args.average}, recenter = {args.recenter}')
+    print(f'  Legacy pacing        : {legacy:8.3f} s')
+    print(f'  Prompt driven        : {prompt:8.3f} s')
+    print(f'  Saved per run        : {legacy - prompt:8.3f} s')
+
+
+if __name__ == '__main__':
+    main()
+
+# ----- Fini -----
@@ -0,0 +1,181 @@
+"""
+=====[ tinySA Ultra / Phase Noise Pipeline Benchmark ]==========================
+
+Times each stage of the acquisition and analysis pipeline separately against
+the simulated tinySA, and writes the results as JSON so runs can be compared
+across versions.
+
+Stages:
+    command_roundtrip       'sweep' query
+    fetch_amp_text          'data 2' transfer and parse
+    fetch_freq_text         'frequencies' transfer and parse
+    freq_axis_cached        get_freq_data, computed from the cached sweep settings
+    fetch_scanraw           binary 'scanraw' transfer and decode
+    reconfigure_single      recenter settings (calc, center / span, start / stop), a round trip each
+    reconfigure_batched     the same in one transaction, one burst
+    take_sweep_<mode>       phase_noise._take_sweep for each averaging mode
+    amp_correction          phase_noise._make_amp_correction, one band
+    freq_correction         phase_noise._make_freq_correction, one band
+    savitzky_golay          601 point smoothing of a merged 6 band trace
+    csv_write               app.save_to_csv of a merged trace
+    plot_prepare            app.plot of a merged trace (Agg backend, not shown)
+
+A stage that fails is recorded with its error instead of a timing.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--repeat N] [--time-scale S] [--output FILE]
+
+    --time-scale 0 (default) turns the simulated sweep / serial delays off,
+    so only the host side cost is measured.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np  # noqa: E402
+
+import tinysa_ultra as tsa  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+import phase_noise  # noqa: E402
+import savitzky_golay_filter as sgf  # noqa: E402
+
+
+BAND_POINTS = 450
+
+
+def time_stage(func, repeat: int, setup=None) -> dict:
+    """Runs 'func' 'repeat' times and returns its timing statistics, in seconds."""
+    times = []
+    try:
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            time_start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - time_start)
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+
+    return {
+        'repeat': repeat,
+        'mean_s': statistics.fmean(times),
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'max_s': max(times),
+    }
+
+
+def merged_trace() -> tuple[np.ndarray, np.ndarray]:
+    """A 6 band merged offset trace like 'run_phase_noise' produces."""
+    freq = np.concatenate([np.linspace(start, stop, BAND_POINTS)
+                           for (start, stop, _) in phase_noise.FREQUENCY_OFFSET_LIST])
+    amp = -90.0 - 15.0 * np.log10(freq / 1e3) + np.random.default_rng(1).normal(0, 2, len(freq))
+    return (freq, amp)
+
+
+def run(repeat: int, time_scale: float) -> dict:
+    device = sim.SimulatedTinySA()
+    sa = tsa.tinySA(transport=sim.SimulatedSerial(device, time_scale=time_scale))
+    sa.open()
+    sa.set_start_stop(device.carrier_frequency + 1e3, device.carrier_frequency + 3e3)
+    sa.wait()
+
+    stages = {}
+    stages['command_roundtrip'] = time_stage(sa.get_sweep, repeat)
+    stages['fetch_amp_text'] = time_stage(sa.get_amp_data, repeat)
+    stages['fetch_freq_text'] = time_stage(sa._fetch_frequencies, repeat)
+    stages['freq_axis_cached'] = time_stage(sa.get_freq_data, repeat)
+    stages['fetch_scanraw'] = time_stage(
+        lambda: sa.get_raw_scan(device.carrier_frequency + 1e3, device.carrier_frequency + 3e3, BAND_POINTS), repeat)
+
+    def reconfigure():
+        sa.calc('off')
+        sa.set_center_span(device.carrier_frequency, 2e3)
+        sa.calc('off')
+        sa.set_start_stop(device.carrier_frequency + 1e3, device.carrier_frequency + 3e3)
+
+    def reconfigure_batched():
+        with sa.transaction():
+            reconfigure()
+
+    stages['reconfigure_single'] = time_stage(reconfigure, repeat)
+    stages['reconfigure_batched'] = time_stage(reconfigure_batched, repeat)
+
+    for mode in ('off', 'aver4', 'aver16'):
+        sa.calc(mode)
+        stages[f'take_sweep_{mode}'] = time_stage(lambda: phase_noise._take_sweep(sa, mode), max(1, repeat // 4))
+    sa.calc('off')
+
+    amp = sa.get_amp_data()
+    freq = sa.get_freq_data()
+    stages['amp_correction'] = time_stage(lambda: phase_noise._make_amp_correction(amp, 26.6, -10.0), repeat)
+    stages['freq_correction'] = time_stage(lambda: phase_noise._make_freq_correction(freq, device.carrier_frequency), repeat)
+
+    x_data, y_data = merged_trace()
+    stages['savitzky_golay'] = time_stage(lambda: sgf.savitzky_golay(y_data, 601, 3), repeat)
+
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        import tinysa_ultra_phase_noise_app as app
+    except Exception as e:
+        stages['csv_write'] = stages['plot_prepare'] = {'error': f'{type(e).__name__}: {e}'}
+    else:
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                stages['csv_write'] = time_stage(lambda: app.save_to_csv(x_data, y_data, 'bench'), repeat)
+            finally:
+                os.chdir(cwd)
+        stages['plot_prepare'] = time_stage(lambda: app.plot(x_data, y_data, 'bench', 10e6, 800, 600),
+                                            max(1, repeat // 4), setup=lambda: plt.close('all'))
+        plt.close('all')
+
+    sa.close()
+    return stages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Phase noise pipeline benchmark')
+    parser.add_argument('--repeat', type=int, default=20, help='Repetitions per stage')
+    parser.add_argument('--time-scale', type=float, default=0.0, help='Simulated delay multiplier')
+    parser.add_argument('--output', default='bench_results.json', help='JSON results file')
+    args = parser.parse_args()
+
+    stages = run(args.repeat, args.time_scale)
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'driver_version': tsa.VERSION,
+        'app_version': phase_noise.VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'time_scale': args.time_scale,
+        'stages': stages,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    for name, r in stages.items():
+        if 'error' in r:
+            print(f'{name:<20} ERROR {r["error"]}')
+        else:
+            print(f'{name:<20} {r["median_s"]*1e3:10.3f} ms')
+    print(f'Results written to: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
+
+# ----- Fini -----
@@ -0,0 +1,65 @@
+"""
+=====[ tinySA Ultra / Binary 'scanraw' Benchmark ]==============================
+
+Compares fetching one offset band as text ('data 2' + 'frequencies')
+with the binary 'scanraw' transfer in 'tinySA.get_raw_scan'.
+
+Reports bytes on the wire and host side decode time per band, using the same
+in memory serial port as 'bench_fetch_data.py'.
+
+Usage:
+    python benchmarks/bench_scanraw.py [--repeat N]
+"""
+import time
+import argparse
+
+import numpy as np
+
+from bench_fetch_data import CannedSerial, canned_responses, POINTS, tsa
+
+
+def scanraw_response() -> bytes:
+    amps = -80.0 - (np.arange(POINTS) % 17) * 0.37
+    raw = np.zeros(POINTS, dtype=tsa.SCANRAW_DTYPE)
+    raw["marker"] = ord("x")
+    raw["value"] = np.round((amps + tsa.SCANRAW_OFFSET) * 32.0)
+    return b"{" + raw.tobytes() + b"}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='tinySA text vs scanraw benchmark')
+    parser.add_argument('--repeat', type=int, default=50, help='Repetitions per mode')
+    args = parser.parse_args()
+
+    tsa.INTER_CMD_DELAY = 0.0
+    tsa.FREQUENCY_CHANGE_DELAY = 0.0
+    tsa.WAIT_DELAY = 0.0
+
+    responses = canned_responses()
+    responses["scanraw *"] = scanraw_response()
+    sa = tsa.tinySA(dev='canned')
+    sa.serial = CannedSerial(responses)
+
+    text_bytes = len(responses["data 2"]) + len(responses["frequencies"])
+    time_start = time.perf_counter()
+    for _ in range(args.repeat):
+        amp = sa.get_amp_data()
+        freq = sa.get_freq_data()
+    text_time = (time.perf_counter() - time_start) / args.repeat
+
+    raw_bytes = len(responses["scanraw *"])
+    time_start = time.perf_counter()
+    for _ in range(args.repeat):
+        freq, amp = sa.get_raw_scan(10_001_000, 10_003_000, POINTS)
+    raw_time = (time.perf_counter() - time_start) / args.repeat
+
+    print(f'{"Mode":<10}{"Bytes/band":>12}{"ms/band":>10}')
+    print(f'{"text":<10}{text_bytes:>12d}{text_time*1e3:>10.3f}')
+    print(f'{"scanraw":<10}{raw_bytes:>12d}{raw_time*1e3:>10.3f}')
+    print(f'Transfer reduced {text_bytes/raw_bytes:.1f}x, time reduced {text_time/raw_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
+
+# ----- Fini -----
@@ -0,0 +1,208 @@
+"""
+=====[ tinySA Ultra / Driver Instrumentation ]=================================
+
+Counters for the serial driver, to find out where the time of a slow run
+went: a sweep 'wait' that ran into SWEEP_WAIT_TIMEOUT, a response that ran
+into FETCH_DATA_TIMEOUT, marker reads that needed retries, or traces with
+points that could not be parsed.
+
+Per command (the first word of the command line, e.g. 'data', 'wait'):
+    count, latency from the write to the 'ch>' prompt (total, max and a
+    histogram with LATENCY_BUCKETS bounds), timeouts, bytes sent and received.
+Per driver:
+    retries and give ups of the retry loops, NaN points per command.
+
+snapshot() returns all of it as a dict of plain numbers and lists, ready
+for json.dumps(). With a trace file every completed command and every
+retry / timeout event is also appended to it as one JSON line.
+
+Instrumentation is off unless asked for, the drivers then keep
+'stats = None' and the only cost is one 'is not None' test per read.
+
+Usage:
+    sa = tinySA(instrument=True)          or tinySA(trace_file='driver_trace.jsonl')
+    ... measure ...
+    print(sa.stats.report())
+    json.dumps(sa.snapshot())
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import json
+import time
+import bisect
+import threading
+
+VERSION = str(0.1)
+
+# Upper bounds of the latency histogram buckets in seconds, the last bucket is everything above
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0)
+
+
+class DriverStats:
+    """Command counters and latency histograms of one driver, optionally traced to a file.
+
+    Safe to read (snapshot(), report()) from another thread while the driver runs.
+
+    Args:
+        trace_file (str, optional): JSON-lines file every command is appended to.
+        name (str, optional): Added to every trace line as 'device', e.g. the port name.
+    """
+    def __init__(self, trace_file: str | None = None, name: str | None = None):
+        self.name = name
+        self.trace_file = trace_file
+        self._trace = None      # Opened on the first record, again after close()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Clears all counters, the trace file is kept."""
+        with self._lock:
+            self._time_start = time.time()
+            self._commands: dict[str, dict] = {}
+            self._retries: dict[str, int] = {}
+            self._failures: dict[str, int] = {}
+            self._nan_points: dict[str, int] = {}
+            self._current = None    # [name, wall time, perf_counter, sent, received, timed out]
+
+    def close(self) -> None:
+        """Closes the trace file, a later record appends to it again."""
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+    def _write_trace(self, record: dict) -> None:
+        if self._trace is None:
+            self._trace = open(self.trace_file, 'a', encoding='utf-8', buffering=1)
+        if self.name is not None:
+            record['device'] = self.name
+        self._trace.write(json.dumps(record) + '\n')
+
+    def _command(self, name: str) -> dict:
+        entry = self._commands.get(name)
+        if entry is None:
+            entry = self._commands[name] = {'count': 0, 'timeouts': 0, 'latency_total': 0.0, 'latency_max': 0.0,
+                                            'histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+                                            'bytes_sent': 0, 'bytes_received': 0}
+        return entry
+
+    # * ===== Driver Hooks =====================================================
+    def begin(self, cmd: str, sent: int) -> None:
+        """A command line was written, 'sent' bytes. Ends a command that never saw its prompt."""
+        with self._lock:
+            if self._current is not None:
+                self._finish()
+            words = cmd.split()
+            self._current = [words[0] if words else '', time.time(), time.perf_counter(), sent, 0, False]
+
+    def received(self, count: int) -> None:
+        with self._lock:
+            if self._current is not None:
+                self._current[4] += count
+            else:
+                self._command('')['bytes_received'] += count
+
+    def end(self) -> None:
+        """The prompt ending the current command was read (or timed out)."""
+        with self._lock:
+            if self._current is not None:
+                self._finish()
+
+    def _finish(self) -> None:
+        name, t_wall, t_start, sent, received, timed_out = self._current
+        self._current = None
+        latency = time.perf_counter() - t_start
+        entry = self._command(name)
+        entry['count'] += 1
+        entry['timeouts'] += timed_out
+        entry['latency_total'] += latency
+        entry['latency_max'] = max(entry['latency_max'], latency)
+        entry['histogram'][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        entry['bytes_sent'] += sent
+        entry['bytes_received'] += received
+        if self.trace_file:
+            self._write_trace({'t': round(t_wall, 6), 'cmd': name, 'latency': round(latency, 6),
+                               'sent': sent, 'received': received, 'timeout': timed_out})
+
+    def timeout(self) -> None:
+        """A read of the current command timed out."""
+        with self._lock:
+            if self._current is not None:
+                self._current[5] = True
+                name = self._current[0]
+            else:
+                self._command('')['timeouts'] += 1
+                name = ''
+            if self.trace_file:
+                self._write_trace({'t': round(time.time(), 6), 'event': 'timeout', 'cmd': name})
+
+    def retry(self, where: str) -> None:
+        """A retry loop, e.g. 'get_marker_value', tries again."""
+        with self._lock:
+            self._retries[where] = self._retries.get(where, 0) + 1
+            if self.trace_file:
+                self._write_trace({'t': round(time.time(), 6), 'event': 'retry', 'where': where})
+
+    def failure(self, where: str) -> None:
+        """A retry loop gave up and returned NaN."""
+        with self._lock:
+            self._failures[where] = self._failures.get(where, 0) + 1
+            if self.trace_file:
+                self._write_trace({'t': round(time.time(), 6), 'event': 'failure', 'where': where})
+
+    def nan(self, cmd: str, count: int) -> None:
+        """'count' points of the response of command 'cmd' could not be read.
+
+        The command is named by the caller, the points are parsed after its prompt
+        was read, when it is no longer the current command.
+        """
+        if not count:
+            return
+        words = cmd.split()
+        name = words[0] if words else ''
+        with self._lock:
+            self._nan_points[name] = self._nan_points.get(name, 0) + int(count)
+            if self.trace_file:
+                self._write_trace({'t': round(time.time(), 6), 'event': 'nan', 'cmd': name, 'count': int(count)})
+
+    # * ===== Reading ==========================================================
+    def snapshot(self) -> dict:
+        """All counters as plain Python types.
+
+        Returns:
+            dict: 'elapsed', 'commands' (name -> count, timeouts, latency_total / _mean / _max,
+                  histogram, bytes_sent, bytes_received), 'latency_buckets', 'bytes_sent',
+                  'bytes_received', 'timeouts', 'retries', 'failures', 'nan_points'.
+        """
+        with self._lock:
+            commands = {}
+            for name, entry in self._commands.items():
+                commands[name] = {**entry, 'histogram': list(entry['histogram']),
+                                  'latency_mean': entry['latency_total'] / entry['count'] if entry['count'] else 0.0}
+            return {
+                'elapsed': time.time() - self._time_start,
+                'commands': commands,
+                'latency_buckets': list(LATENCY_BUCKETS),
+                'bytes_sent': sum(c['bytes_sent'] for c in commands.values()),
+                'bytes_received': sum(c['bytes_received'] for c in commands.values()),
+                'timeouts': sum(c['timeouts'] for c in commands.values()),
+                'retries': dict(self._retries),
+                'failures': dict(self._failures),
+                'nan_points': dict(self._nan_points),
+            }
+
+    def report(self) -> str:
+        """One line summary, e.g. for a progress message."""
+        snap = self.snapshot()
+        commands = snap['commands']
+        count = sum(c['count'] for c in commands.values())
+        msg = (f"Driver: {count} commands, {snap['bytes_sent']} bytes sent, {snap['bytes_received']} received, "
+               f"{snap['timeouts']} timeouts, {sum(snap['retries'].values())} retries, "
+               f"{sum(snap['nan_points'].values())} NaN points")
+        if commands:
+            name = max(commands, key=lambda c: commands[c]['latency_total'])
+            msg += f", most time in '{name}' {commands[name]['latency_total']:.1f} s"
+        return msg
+
+# ----- Fini -----
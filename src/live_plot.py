@@ -0,0 +1,112 @@
+"""
+=====[ tinySA Ultra / Phase Noise Live Plot ]==================================
+
+Shows the phase noise trace band by band while the measurement runs, so a
+bad setup is seen after the first band instead of at the end of the run.
+
+The measurement thread puts every finished band into a queue.Queue, the GUI
+thread drains it with LivePlot.update_from(). Each band is a new line on
+fixed log axes, drawn with blitting: the static background (axes, grid,
+labels) is rendered once and cached, an update only restores it and draws
+the band lines on top. The whole figure is only redrawn when a band falls
+outside the amplitude range, or the window is resized.
+
+Usage:
+    band_queue = queue.Queue()
+    live = LivePlot('DUT 1', 800, 600)
+    ... measurement thread: band_queue.put((band, freq, amp))
+    ... GUI event loop:     live.update_from(band_queue)
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import queue
+import numpy as np
+import matplotlib.pyplot as plt
+
+VERSION = str(0.1)
+
+# Initial axes, the amplitude range grows if a band does not fit
+LIVE_F_START = 1e3
+LIVE_F_STOP = 1e6
+LIVE_AMP_RANGE = (-150.0, -60.0)
+LIVE_AMP_MARGIN = 5.0   # dB
+
+
+class LivePlot:
+    """A matplotlib window that phase noise bands are appended to as they are measured.
+
+    Args:
+        title (str): Plot title.
+        width (int): Window width in pixels.
+        height (int): Window height in pixels.
+    """
+    def __init__(self, title: str, width: int, height: int):
+        px = 1/plt.rcParams['figure.dpi']  # pixel in inches
+        self.fig, self.ax = plt.subplots(figsize=(width*px, height*px))
+        self.ax.semilogx()
+        self.ax.set_xlim(LIVE_F_START, LIVE_F_STOP)
+        self.ax.set_ylim(*LIVE_AMP_RANGE)
+        self.ax.grid(which='both')
+        self.ax.set_xlabel('Frequency Offset [Hz]')
+        self.ax.set_ylabel('Phase Noise [dBc/Hz]')
+        self.fig.suptitle(title)
+        self.ax.set_title('Measuring...')
+        self.lines = []
+        self._background = None
+
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        plt.show(block=False)
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    def _on_draw(self, event) -> None:
+        """After any full redraw (first show, resize, rescale) the background is cached again."""
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+
+    def add_band(self, band: int, freq: np.ndarray, amp: np.ndarray) -> None:
+        """Appends one band, dBc/Hz vs offset Hz."""
+        line, = self.ax.plot(freq, amp, animated=True, color='C0')
+        self.lines.append(line)
+
+        valid = amp[~np.isnan(amp)]
+        low, high = self.ax.get_ylim()
+        if len(valid) and (valid.min() < low or valid.max() > high):
+            # Does not fit: rescale, the full redraw caches a new background
+            self.ax.set_ylim(min(low, valid.min() - LIVE_AMP_MARGIN), max(high, valid.max() + LIVE_AMP_MARGIN))
+            self.fig.canvas.draw()
+        else:
+            self._blit()
+
+    def _blit(self) -> None:
+        if self._background is None:
+            self.fig.canvas.draw()
+            return
+        self.fig.canvas.restore_region(self._background)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        self.fig.canvas.blit(self.fig.bbox)
+        self.fig.canvas.flush_events()
+
+    def update_from(self, band_queue: queue.Queue) -> int:
+        """Adds every band waiting in the queue, call it from the GUI thread.
+
+        Returns:
+            int: Number of bands added.
+        """
+        added = 0
+        while True:
+            try:
+                band, freq, amp = band_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.add_band(band, freq, amp)
+            added += 1
+        return added
+
+    def close(self) -> None:
+        plt.close(self.fig)
+
+# ----- Fini -----
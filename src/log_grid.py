@@ -0,0 +1,126 @@
+"""
+=====[ Log Frequency Grid Resampling ]=========================================
+
+The merged offset data comes from six bands that each have the same number
+of linearly spaced points, so on the log frequency axis the point density
+jumps at every band seam. A fixed width smoothing filter then spans a decade
+in one place and a sliver in another.
+
+resample_log() puts the data onto a log spaced grid with a fixed number of
+points per decade, averaging all the points that fall into each grid bin in
+the power domain. Smoothing on that grid is uniform on the plot axis, and the
+result is an order of magnitude smaller than the raw data.
+
+decimate_log() is for plotting: it keeps the lowest and highest point of
+each log spaced bucket, with one bucket per pixel of plot width. Spurs and
+the noise spread stay visible exactly as in the raw data, but matplotlib
+never gets more than two points per pixel, however many runs are overlaid.
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import numpy as np
+
+VERSION = str(0.1)
+
+POINTS_PER_DECADE = 100
+
+
+def log_bin_edges(f_start: float, f_stop: float, points_per_decade: int = POINTS_PER_DECADE) -> np.ndarray:
+    """Bin edges of a log spaced grid from 'f_start' to 'f_stop' Hz."""
+    decades = np.log10(f_stop / f_start)
+    bins = max(1, int(np.ceil(decades * points_per_decade - 1e-9)))
+    return np.logspace(np.log10(f_start), np.log10(f_stop), bins + 1)
+
+
+def resample_log(freq: np.ndarray, amp_db: np.ndarray, points_per_decade: int = POINTS_PER_DECADE,
+                 f_start: float | None = None, f_stop: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Resamples a dB trace onto a log spaced frequency grid.
+
+    All points inside a bin are power averaged, the bin frequency is the
+    geometric bin center. Bins without any points are left out. NaN points,
+    and zero or negative frequencies, are ignored.
+
+    Args:
+        freq (np.ndarray): Frequencies (offsets) in Hz.
+        amp_db (np.ndarray): Amplitudes in dB (dBm, dBc/Hz, ...).
+        points_per_decade (int, optional): Grid density. Defaults to POINTS_PER_DECADE.
+        f_start (float, optional): Grid start in Hz. Defaults to the lowest frequency.
+        f_stop (float, optional): Grid stop in Hz. Defaults to the highest frequency.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (Grid frequencies Hz, Averaged amplitudes dB)
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    amp_db = np.asarray(amp_db, dtype=np.float64)
+    valid = (freq > 0) & ~np.isnan(freq) & ~np.isnan(amp_db)
+    freq = freq[valid]
+    amp_db = amp_db[valid]
+    if len(freq) == 0:
+        return (np.empty(0), np.empty(0))
+
+    f_start = freq.min() if f_start is None else f_start
+    f_stop = freq.max() if f_stop is None else f_stop
+    if f_stop <= f_start:
+        return (freq[:1].copy(), amp_db[:1].copy())
+    edges = log_bin_edges(f_start, f_stop, points_per_decade)
+
+    # Bin index of every point, the top edge belongs to the last bin
+    index = np.searchsorted(edges, freq, side='right') - 1
+    index[freq == edges[-1]] = len(edges) - 2
+    inside = (index >= 0) & (index < len(edges) - 1)
+    index = index[inside]
+
+    bins = len(edges) - 1
+    counts = np.bincount(index, minlength=bins)
+    power = np.bincount(index, weights=np.power(10.0, amp_db[inside] / 10.0), minlength=bins)
+
+    filled = counts > 0
+    centers = np.sqrt(edges[:-1] * edges[1:])
+    return (centers[filled], 10.0 * np.log10(power[filled] / counts[filled]))
+
+
+def decimate_log(freq: np.ndarray, amp_db: np.ndarray, buckets: int,
+                 f_start: float | None = None, f_stop: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Min / max preserving decimation on a log frequency axis, for plotting.
+
+    The axis is split into 'buckets' log spaced buckets, usually the plot width
+    in pixels, and only the lowest and highest point of every bucket are kept,
+    in frequency order. Traces that already have no more than two points per
+    bucket are returned unchanged. NaN points and zero or negative frequencies
+    are left out.
+
+    Args:
+        freq (np.ndarray): Frequencies (offsets) in Hz.
+        amp_db (np.ndarray): Amplitudes in dB.
+        buckets (int): Number of buckets, e.g. the plot width in pixels.
+        f_start (float, optional): Axis start in Hz. Defaults to the lowest frequency.
+        f_stop (float, optional): Axis stop in Hz. Defaults to the highest frequency.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (Frequencies Hz, Amplitudes dB), at most 2 * buckets points.
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    amp_db = np.asarray(amp_db, dtype=np.float64)
+    valid = (freq > 0) & ~np.isnan(amp_db)
+    freq = freq[valid]
+    amp_db = amp_db[valid]
+    if len(freq) <= 2 * buckets:
+        return (freq, amp_db)
+
+    f_start = freq.min() if f_start is None else f_start
+    f_stop = freq.max() if f_stop is None else f_stop
+    edges = np.logspace(np.log10(f_start), np.log10(f_stop), buckets + 1)
+    index = np.clip(np.searchsorted(edges, freq, side='right') - 1, 0, buckets - 1)
+
+    # Sorted by bucket, then amplitude: the first point of a bucket is its min, the last its max
+    order = np.lexsort((amp_db, index))
+    bucket_sorted = index[order]
+    first = np.flatnonzero(np.r_[True, bucket_sorted[1:] != bucket_sorted[:-1]])
+    last = np.r_[first[1:], len(order)] - 1
+
+    keep = np.unique(np.concatenate((order[first], order[last])))
+    keep = keep[np.argsort(freq[keep], kind='stable')]
+    return (freq[keep], amp_db[keep])
+
+# ----- Fini -----
@@ -0,0 +1,135 @@
+"""
+=====[ tinySA Ultra / Multiple Analyzer Runner ]===============================
+
+Runs phase noise jobs on several tinySA Ultras at the same time, one thread
+per analyzer. The serial I/O and sweeps are all waiting time, so the threads
+overlap almost completely and throughput scales with the number of analyzers.
+
+Jobs with a 'device' are pinned to that serial port, since usually each
+analyzer has its own DUT connected. Jobs without one go into a shared queue
+that any analyzer takes work from when it is free.
+
+Usage:
+    registry = DeviceRegistry.discover()
+    results = run_jobs_parallel(registry, jobs, output_dir='results')
+
+    Or from the command line: python pn_cli.py jobs.json --all-devices
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tinysa_ultra as tsa
+import phase_noise
+import pn_cli
+
+VERSION = str(0.1)
+
+
+class DeviceRegistry:
+    """One tinySA driver per serial port.
+
+    Args:
+        devices (dict[str, tsa.tinySA]): Port name -> driver.
+    """
+    def __init__(self, devices: dict[str, tsa.tinySA]):
+        self.devices = devices
+
+    @classmethod
+    def discover(cls, **driver_args) -> 'DeviceRegistry':
+        """Registry of every connected tinySA Ultra, 'driver_args' are passed to each 'tinySA'.
+
+        Raises:
+            OSError: When no tinySA Ultra is connected.
+        """
+        ports = tsa.getports()
+        if not ports:
+            raise OSError("Could not find any tinySA Ultra.\nConnect the tinySA Ultra and try again.")
+        return cls({port: tsa.tinySA(dev=port, **driver_args) for port in ports})
+
+    @classmethod
+    def simulated(cls, count: int, time_scale: float = 0.0, **driver_args) -> 'DeviceRegistry':
+        """Registry of 'count' simulated tinySA's, named 'sim0', 'sim1', ..."""
+        import tinysa_simulator as sim
+        devices = {}
+        for i in range(count):
+            sa = tsa.tinySA(transport=sim.SimulatedSerial(sim.SimulatedTinySA(seed=i + 1), time_scale=time_scale),
+                            **driver_args)
+            if sa.stats is not None:
+                sa.stats.name = f'sim{i}'   # Tells the devices apart in a shared trace file
+            devices[f'sim{i}'] = sa
+        return cls(devices)
+
+    @property
+    def ports(self) -> list[str]:
+        return list(self.devices)
+
+
+def run_jobs_parallel(registry: DeviceRegistry, jobs: list[phase_noise.PhaseNoiseJob],
+                      output_dir: str = '.', progress=print,
+                      csv: bool = True, archive=None) -> dict[str, list[phase_noise.PhaseNoiseResult]]:
+    """Runs the jobs on all analyzers of the registry concurrently.
+
+    Each result is written to 'output_dir' as it finishes, like 'pn_cli.run_jobs'.
+    Progress messages are prefixed with the port name.
+
+    Returns:
+        dict[str, list[phase_noise.PhaseNoiseResult]]: Port name -> results measured on it.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    pinned: dict[str, list[phase_noise.PhaseNoiseJob]] = {port: [] for port in registry.ports}
+    shared: queue.Queue = queue.Queue()
+    for job in jobs:
+        if not job.device:
+            shared.put(job)
+        elif job.device in pinned:
+            pinned[job.device].append(job)
+        else:
+            progress(f'Job {job.test_name} skipped: no tinySA on {job.device}')
+
+    write_lock = threading.Lock()
+    results: dict[str, list[phase_noise.PhaseNoiseResult]] = {port: [] for port in registry.ports}
+
+    def worker(port: str, sa: tsa.tinySA) -> None:
+        def device_progress(msg: str) -> None:
+            progress(f'[{port}] {msg}')
+
+        def run_one(job: phase_noise.PhaseNoiseJob) -> None:
+            device_progress(f'Job: {job.test_name}')
+            if sa.stats is not None:
+                sa.stats.reset()
+            try:
+                result = phase_noise.measure_phase_noise(sa, job, device_progress)
+            except (OSError, ValueError) as e:
+                device_progress(f'Job {job.test_name} failed: {e}')
+                return
+            finally:
+                if sa.stats is not None:
+                    device_progress(sa.stats.report())
+            with write_lock:
+                result_file = pn_cli.write_result(result, output_dir, csv, archive, sa.snapshot())
+            device_progress(f'Result written to: {result_file}')
+            results[port].append(result)
+
+        for job in pinned[port]:
+            run_one(job)
+        while True:
+            try:
+                job = shared.get_nowait()
+            except queue.Empty:
+                break
+            run_one(job)
+
+    with ThreadPoolExecutor(max_workers=len(registry.devices)) as executor:
+        futures = [executor.submit(worker, port, sa) for port, sa in registry.devices.items()]
+        for future in futures:
+            future.result()
+
+    return results
+
+# ----- Fini -----
@@ -27,8 +27,21 @@ Version:
 
 """
 
+import os
+import json
 import time
+import queue
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+import numpy as np
 import tinysa_ultra as tsa
+import trace_averaging as tav
+import pn_spurs
+
+if TYPE_CHECKING:       # Only for the annotations, asyncio is not imported until it is used
+    import tinysa_ultra_async as tsa_async
 
 VERSION = str(0.1)
 
@@ -49,6 +62,22 @@ VERSION = str(0.1)
 #   We are measuring noise, so for the best plot quality AVERAGE = 'aver16' is suggested.
 #   If your center frequency drifts a 'small' amount then set RECENTER = True,
 #   to recenter the center frequency after each offset band is measured.
+#   With AVERAGE = 'off' setting ACQUISITION = 'scanraw' fetches the traces with the
+#   binary transfer, which is faster. The tinySA trace averaging does not apply to 'scanraw'.
+#   AVERAGE = 'host4' or 'host16' fetches every sweep and power averages it in the app.
+#   A band stops early when its noise floor 95% confidence interval is within HOST_CI_TARGET dB,
+#   the per point uncertainty ends up in PN_AMP_UNCERTAINTY. 'scanraw' works with these modes.
+#   AVERAGE = 'adaptive' is host averaging with up to ADAPTIVE_MAX_SWEEPS per band, each band
+#   stops at HOST_CI_TARGET, or when its share of TIME_BUDGET seconds is used up (0 = no budget).
+#   Fast, smooth bands then take few sweeps and the slow close in bands get the time.
+#   The sweeps each band used are in PN_BAND_SWEEPS.
+#   PIPELINED = True corrects and merges each band on a worker thread while the tinySA
+#   already sweeps the next band. The time spent on the instrument, on transfers and
+#   on the host is reported at the end of every run either way.
+#   With CHECKPOINT set to a file name (e.g. CHECKPOINT_FILE) each completed band is saved
+#   to it together with the carrier reference, it is off by default.
+#   If a run is interrupted (USB hiccup, timeout) set RESUME = True and run again: the tinySA
+#   is set back to the carrier, the carrier is checked, and only the missing bands are measured.
 #   A CSV file of the measured data will automatically be put in the directory where you ran
 #   this program. The CSV file will be named the Plot Title with the current date and time added.
 #   This way, every time you make a run a new CSV file will be created with a unique name.
@@ -68,13 +97,35 @@ VERSION = str(0.1)
 # * ===== App Control Settings =================================================
 PN_TEST_NAME = 'Phase Noise Test'
 PN_RECENTER = False
-PN_AVERAGE = 'aver16'  # Valid values: 'off', 'aver4', 'aver16'
+PN_AVERAGE = 'aver16'  # Valid values: 'off', 'aver4', 'aver16', 'host4', 'host16', 'adaptive'
+PN_ACQUISITION = 'text'  # Valid values: 'text', 'scanraw' (binary, only used when not 'aver4' / 'aver16')
+PN_HOST_CI_TARGET = 2.0  # dB, early stop for 'host' and 'adaptive' averaging
+PN_ADAPTIVE_MAX_SWEEPS = 32
+PN_TIME_BUDGET = 0.0  # Seconds for all bands in 'adaptive' averaging, 0 = no limit
+PN_PIPELINED = False  # Process each band on a worker thread while the next band sweeps
+PN_CHECKPOINT = ''  # Completed bands are saved to this file, '' = off, e.g. CHECKPOINT_FILE
+PN_RESUME = False  # Resume the run in PN_CHECKPOINT, only the missing bands are measured
+PN_SPURS = False  # Find the spurs in every band as it is processed, see 'pn_spurs.py'
+
+# Checkpoint file of the GUI, in the directory the app runs in
+CHECKPOINT_FILE = 'phase_noise_checkpoint.jsonl'
+
+# Resuming needs the carrier within these of the checkpoint carrier reference
+RESUME_FREQUENCY_TOLERANCE = 100.0   # Hz
+RESUME_AMPLITUDE_TOLERANCE = 3.0     # dB
 
 
 # * ===== Resultant Trace Data =================================================
-PN_AMP_DATA: list[float] = []
-PN_FREQ_DATA: list[float] = []
+PN_AMP_DATA: np.ndarray = np.empty(0)
+PN_FREQ_DATA: np.ndarray = np.empty(0)
+PN_AMP_UNCERTAINTY: np.ndarray = np.empty(0)    # dB, 95% confidence, 'host' averaging only, else NaN
+PN_BAND_SWEEPS: list[int] = []          # Sweeps averaged in each band
 PN_CENTER_FREQUENCY: float = 0.0
+PN_RESULT = None                        # The whole PhaseNoiseResult, for the result file
+PN_SPUR_TABLE: np.ndarray = np.empty(0, pn_spurs.SPUR_DTYPE)   # With PN_SPURS, see 'pn_spurs.SPUR_DTYPE'
+PN_SPUR_MASK: np.ndarray = np.empty(0, dtype=bool)            # With PN_SPURS, True at the spur points
+PN_BAND_QUEUE = None                    # queue.Queue, if set every finished band is put in it as
+                                        # (band, offset freq Hz, dBc/Hz), e.g. for a live plot
 
 # Noise Measurement Correction factor notes:
 # Actual (measured) RBW filter EQNBW factors
@@ -96,18 +147,335 @@ FREQUENCY_OFFSET_LIST = [(1e3, 3e3, 26.6), (3e3, 10e3, 26.6), (10e3, 30e3, 26.6)
                          ]
 
 
+# * ===== Python API =============================================================
+#   The measurement itself does not need the GUI, scripts can use it directly,
+#       sa = tsa.tinySA()
+#       result = measure_phase_noise(sa, PhaseNoiseJob(test_name='DUT 1', average='aver4'))
+#   See 'pn_cli.py' for a command line / job file runner.
+#   measure_phase_noise_async() is the same measurement on a 'tinysa_ultra_async.AsyncTinySA',
+#   so one event loop can measure on several tinySA's at once.
+
+@dataclass
+class PhaseNoiseJob:
+    """Settings for one phase noise measurement.
+
+    center_frequency = 0 measures the carrier the tinySA is already set to,
+    otherwise the tinySA is set to it with a 2 kHz span and 'settle_sweeps'
+    sweeps are taken to let the AGC settle before the measurement starts.
+    'device' pins the job to one serial port when several tinySA's are used,
+    '' = any (see 'multi_analyzer.py'). 'pipelined' processes every band on a
+    worker thread while the next band is swept.
+    With a 'checkpoint' file name every completed band is saved to it, 'resume'
+    continues the run saved there (see Checkpoint). It is removed once the run completes.
+    'spurs' finds the spurs in every band as it is processed (see 'pn_spurs.py').
+    """
+    test_name: str = 'Phase Noise Test'
+    device: str = ''
+    center_frequency: float = 0.0
+    average: str = 'aver16'
+    recenter: bool = False
+    acquisition: str = 'text'
+    host_ci_target: float = 2.0
+    adaptive_max_sweeps: int = 32
+    time_budget: float = 0.0
+    settle_sweeps: int = 3
+    pipelined: bool = False
+    checkpoint: str = ''
+    resume: bool = False
+    spurs: bool = False
+    offsets: list[tuple[float, float, float]] = field(default_factory=lambda: list(FREQUENCY_OFFSET_LIST))
+
+
+@dataclass
+class PhaseNoiseResult:
+    """Result of one phase noise measurement, trace data is in dBc/Hz vs offset Hz."""
+    job: PhaseNoiseJob
+    center_frequency: float
+    center_amplitude: float
+    freq: np.ndarray
+    amp: np.ndarray
+    uncertainty: np.ndarray
+    band_sweeps: list[int]
+    center_drift: list[float]               # Hz per band, NaN if not recentered after it in this session
+    time_start: float
+    elapsed: float
+    timing: dict[str, float] = field(default_factory=dict)  # Seconds per StageTimer stage
+    band_points: list[int] = field(default_factory=list)    # Points of each band in freq / amp
+    spurs: np.ndarray = field(default_factory=lambda: np.empty(0, pn_spurs.SPUR_DTYPE))  # With 'job.spurs'
+    spur_mask: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=bool))       # True at the spurs
+
+
+def job_from_settings() -> PhaseNoiseJob:
+    """A PhaseNoiseJob from the module 'App Control Settings'."""
+    return PhaseNoiseJob(test_name=PN_TEST_NAME, average=PN_AVERAGE, recenter=PN_RECENTER,
+                         acquisition=PN_ACQUISITION, host_ci_target=PN_HOST_CI_TARGET,
+                         adaptive_max_sweeps=PN_ADAPTIVE_MAX_SWEEPS, time_budget=PN_TIME_BUDGET,
+                         pipelined=PN_PIPELINED, checkpoint=PN_CHECKPOINT, resume=PN_RESUME, spurs=PN_SPURS,
+                         offsets=list(FREQUENCY_OFFSET_LIST))
+
+
+class Checkpoint:
+    """Completed bands of a run, saved as they finish so an interrupted run can be resumed.
+
+    A JSON lines file: the first line is the run, its settings and the carrier
+    reference, every further line one corrected band with the carrier reference
+    it was measured with. Each line is flushed to disk when written, a line cut
+    short by a crash is ignored when the file is read back.
+
+    Args:
+        file_name (str): The checkpoint file.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.run = None
+        self.bands: dict[int, dict] = {}
+
+    @staticmethod
+    def _settings(job: PhaseNoiseJob) -> dict:
+        """The job settings a resumed run has to match."""
+        return {'average': job.average, 'acquisition': job.acquisition,
+                'offsets': [list(band) for band in job.offsets]}
+
+    def _append(self, record: dict, mode: str = 'a') -> None:
+        with open(self.file_name, mode, encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self, job: PhaseNoiseJob, center_frequency: float, center_amplitude: float,
+              points: int, time_start: float) -> None:
+        """Starts a new checkpoint file, replacing any old one."""
+        self.run = {'test_name': job.test_name, 'settings': self._settings(job), 'points': points,
+                    'center_frequency': center_frequency, 'center_amplitude': center_amplitude,
+                    'time_start': time_start}
+        self.bands = {}
+        self._append(self.run, 'w')
+
+    def add_band(self, band: int, sweeps: int, center_frequency: float, center_amplitude: float,
+                 freq: np.ndarray, amp: np.ndarray, uncertainty: np.ndarray) -> None:
+        record = {'band': band, 'sweeps': sweeps, 'center_frequency': center_frequency,
+                  'center_amplitude': center_amplitude,
+                  'freq': freq.tolist(), 'amp': amp.tolist(), 'uncertainty': uncertainty.tolist()}
+        self._append(record)
+        self.bands[band] = record
+
+    def load(self, job: PhaseNoiseJob) -> bool:
+        """Reads the checkpoint file back for resuming 'job'.
+
+        Raises:
+            ValueError: If the checkpoint was made with other settings.
+
+        Returns:
+            bool: False if there is no checkpoint file, a new run is needed.
+        """
+        try:
+            with open(self.file_name, encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return False
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+        if not records:
+            return False
+        if records[0].get('settings') != self._settings(job):
+            raise ValueError(f'Checkpoint {self.file_name} was made with other measurement settings.')
+
+        self.run = records[0]
+        self.bands = {r['band']: r for r in records[1:]}
+        return True
+
+    def carrier_reference(self) -> tuple[float, float]:
+        """(amplitude dBm, frequency Hz) of the carrier when the last saved band was measured."""
+        last = self.bands[max(self.bands)] if self.bands else self.run
+        return (last['center_amplitude'], last['center_frequency'])
+
+    def check_carrier(self, center_amplitude: float, center_frequency: float) -> None:
+        """Raises ValueError if the carrier is not where the checkpoint left it."""
+        ref_amplitude, ref_frequency = self.carrier_reference()
+        if (not abs(center_frequency - ref_frequency) <= RESUME_FREQUENCY_TOLERANCE
+                or not abs(center_amplitude - ref_amplitude) <= RESUME_AMPLITUDE_TOLERANCE):
+            raise ValueError(f'Can not resume, the carrier is at {center_frequency} Hz, {center_amplitude} dBm '
+                             f'but was at {ref_frequency} Hz, {ref_amplitude} dBm.')
+
+    def remove(self) -> None:
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+
+
 # * ===== Instantiate Device(s) ==================================================
-sa = tsa.tinySA()
+# Made on the first run, so importing this module never touches the serial ports
+sa: tsa.tinySA | None = None
 
 
 # * ===== Local Functions ======================================================
 
+class StageTimer:
+    """Adds up the time spent in each stage of a run.
+
+    Stages: 'instrument' = configuring and sweeping the tinySA (a 'scanraw'
+    sweep and its transfer count here too), 'transfer' = fetching trace data,
+    'host' = correcting and merging the bands.
+
+    Pipelined, the acquisition thread and the band worker both add to it,
+    so the totals are only changed under a lock.
+    """
+    STAGES = ('instrument', 'transfer', 'host')
+
+    def __init__(self):
+        self.totals = dict.fromkeys(self.STAGES, 0.0)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def __call__(self, stage: str):
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - time_start
+            with self._lock:
+                self.totals[stage] += elapsed
+
+    def report(self, wall: float) -> str:
+        with self._lock:
+            totals = dict(self.totals)
+        busy = sum(totals.values())
+        text = ', '.join(f'{stage} {t:.1f} s' for stage, t in totals.items())
+        return f'Time spent: {text}, elapsed {wall:.1f} s (overlap {max(0.0, busy - wall):.1f} s)'
+
+
+class _BandProcessor:
+    """Corrects each measured band into its slice of the merged trace.
+
+    With 'pipelined' the bands are processed on a worker thread, in order,
+    while the main thread goes on to sweep the next band. Otherwise submit()
+    processes the band straight away.
+
+    Args:
+        points (int): Points per band, each band owns one slice of that size.
+        bands (int): Number of bands.
+        timer (StageTimer): The processing time is added to its 'host' stage.
+        pipelined (bool): Process the bands on a worker thread.
+        on_band (callable, optional): Called after each band with
+            (band, freq, amp, uncertainty) of the corrected slice, e.g. to write it to disk.
+        checkpoint (Checkpoint, optional): Each processed band is added to it.
+        spurs (bool, optional): Find the spurs of each band, into 'spur_table' and 'spur_mask'.
+    """
+    def __init__(self, points: int, bands: int, timer: StageTimer, pipelined: bool, on_band=None,
+                 checkpoint=None, spurs: bool = False):
+        self.points = points
+        self.timer = timer
+        self.on_band = on_band
+        self.checkpoint = checkpoint
+        self.spurs = spurs
+        total_points = bands * points
+        # Any points a band does not fill stay NaN
+        self.amp_data = np.full(total_points, np.nan)
+        self.freq_data = np.full(total_points, np.nan)
+        self.amp_uncertainty = np.full(total_points, np.nan)
+        self.spur_mask = np.zeros(total_points, dtype=bool)
+        self.spur_table = np.empty(0, pn_spurs.SPUR_DTYPE)
+        self._band_spurs = {}
+        self.band_points = [0] * bands
+        self._error = None
+        self._queue = None
+        self._thread = None
+        if pipelined:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._worker, daemon=True)
+            self._thread.start()
+
+    def submit(self, band: int, freq_array, amp_array, uncertainty, rbw_correction: float,
+               center_amplitude: float, center_frequency: float, sweeps: int) -> None:
+        item = (band, freq_array, amp_array, uncertainty, rbw_correction, center_amplitude, center_frequency, sweeps)
+        if self._queue is None:
+            self._process(*item)
+        else:
+            self._queue.put(item)
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                try:
+                    self._process(*item)
+                except Exception as e:
+                    self._error = e
+
+    def restore(self, band: int, record: dict, rbw_correction: float = 0.0) -> None:
+        """Puts a band saved in a checkpoint back into the merged trace."""
+        n = min(len(record['freq']), self.points)
+        band_slice = slice(band * self.points, band * self.points + n)
+        self.freq_data[band_slice] = record['freq'][:n]
+        self.amp_data[band_slice] = record['amp'][:n]
+        self.amp_uncertainty[band_slice] = record['uncertainty'][:n]
+        self._find_spurs(band, band_slice, rbw_correction)
+
+    def _find_spurs(self, band: int, band_slice: slice, rbw_correction: float) -> None:
+        if self.spurs:
+            self._band_spurs[band], self.spur_mask[band_slice] = pn_spurs.find_spurs(
+                self.freq_data[band_slice], self.amp_data[band_slice], rbw_correction)
+
+    def _process(self, band, freq_array, amp_array, uncertainty,
+                 rbw_correction, center_amplitude, center_frequency, sweeps) -> None:
+        with self.timer('host'):
+            n = min(len(amp_array), len(freq_array), self.points)
+            band_slice = slice(band * self.points, band * self.points + n)
+            self.amp_data[band_slice] = _make_amp_correction(amp_array[:n], rbw_correction, center_amplitude)
+            self.freq_data[band_slice] = _make_freq_correction(freq_array[:n], center_frequency)
+            if uncertainty is not None:
+                self.amp_uncertainty[band_slice] = uncertainty[:n]
+            self._find_spurs(band, band_slice, rbw_correction)
+            if self.checkpoint is not None:
+                self.checkpoint.add_band(band, sweeps, center_frequency, center_amplitude,
+                                         self.freq_data[band_slice], self.amp_data[band_slice],
+                                         self.amp_uncertainty[band_slice])
+            if self.on_band is not None:
+                self.on_band(band, self.freq_data[band_slice], self.amp_data[band_slice],
+                             self.amp_uncertainty[band_slice])
+
+    def stop(self) -> None:
+        """Lets the worker finish the queued bands and ends it."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def finish(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Waits for the worker and returns the merged (freq, amp, uncertainty) of the filled points,
+        the points each band kept are then in 'band_points'. With 'spurs' the spurs of all bands
+        are then in 'spur_table' and 'spur_mask' matches the returned points.
+
+        Raises:
+            Exception: Whatever the processing of a band raised.
+        """
+        self.stop()
+        if self._error is not None:
+            raise self._error
+
+        filled = ~np.isnan(self.freq_data)
+        self.band_points = filled.reshape(len(self.band_points), self.points).sum(axis=1).tolist()
+        if self._band_spurs:
+            self.spur_table = np.concatenate([self._band_spurs[band] for band in sorted(self._band_spurs)])
+        if filled.all():
+            return (self.freq_data, self.amp_data, self.amp_uncertainty)
+        self.spur_mask = self.spur_mask[filled]
+        return (self.freq_data[filled], self.amp_data[filled], self.amp_uncertainty[filled])
+
+
+
 def _print_message(window, msg) -> None:
     print(msg)
     window.write_event_value('-THREADMESSAGE-', msg)
 
-def _take_sweep(aver: str) -> None:
-
+def _averaged_sweeps(aver: str) -> int:
+    """Number of sweeps the tinySA 'calc' averaging mode uses."""
     sweeps = 1
     if 'aver16' in aver:
         sweeps = 16
@@ -115,102 +483,472 @@ def _take_sweep(aver: str) -> None:
     if 'aver4' in aver:
         sweeps = 4
 
-    for _ in range(sweeps):
-        sa.wait()
-        print('.', end='', flush=True)
+    return sweeps
 
-    print('')
 
+def _take_sweep(sa: tsa.tinySA, aver: str) -> None:
 
-def _find_carrier_center() -> tuple[float, float]:
+    for _ in range(_averaged_sweeps(aver)):
+        sa.wait()
+
+
+def _host_sweeps(job: PhaseNoiseJob) -> int:
+    """Maximum number of sweeps for the 'host' averaging modes, 0 if not a 'host' mode."""
+    if 'adaptive' in job.average:
+        return job.adaptive_max_sweeps
+    if 'host16' in job.average:
+        return 16
+    if 'host4' in job.average:
+        return 4
+    return 0
+
+
+def _instrument_calc(job: PhaseNoiseJob) -> str:
+    """The tinySA 'calc' mode to use, 'host' averaging needs the plain trace."""
+    return 'off' if _host_sweeps(job) else job.average
+
+
+def _make_scheduler(job: PhaseNoiseJob, bands: int | None = None) -> tav.AveragingScheduler:
+    time_budget = job.time_budget if 'adaptive' in job.average else 0.0
+    bands = len(job.offsets) if bands is None else bands
+    return tav.AveragingScheduler(bands, _host_sweeps(job), job.host_ci_target, time_budget)
+
+
+def _add_host_sweep(stats: tav.TraceStatistics | None, amp_array, scheduler: tav.AveragingScheduler,
+                    timer: StageTimer) -> tuple[tav.TraceStatistics, bool]:
+    """Adds one sweep to the host average of a band.
+
+    Returns:
+        tuple[tav.TraceStatistics, bool]: (The band statistics, True if the scheduler wants another sweep)
+    """
+    with timer('host'):
+        if stats is None:
+            stats = tav.TraceStatistics(len(amp_array))
+        stats.update(amp_array)
+    return (stats, scheduler.keep_going(stats))
+
+
+def _take_host_average(sa: tsa.tinySA, start: float, stop: float, scheduler: tav.AveragingScheduler,
+                       use_scanraw: bool, points: int,
+                       timer: StageTimer) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fetches every sweep of a band and power averages them on the host,
+    for as many sweeps as the scheduler asks for.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: (Frequency Hz, Averaged amplitude dBm, Uncertainty dB)
+    """
+    if not use_scanraw:
+        with timer('instrument'):
+            sa.set_start_stop(start, stop)
+
+    stats, more = None, True
+    scheduler.start_band()
+    while more:
+        if use_scanraw:
+            with timer('instrument'):
+                freq_array, amp_array = sa.get_raw_scan(start, stop, points)
+        else:
+            with timer('instrument'):
+                sa.wait()
+            with timer('transfer'):
+                amp_array = sa.get_amp_data()
+        stats, more = _add_host_sweep(stats, amp_array, scheduler, timer)
+
+    scheduler.end_band(stats)
+    if not use_scanraw:
+        with timer('transfer'):
+            freq_array = sa.get_freq_data()
+
+    return (freq_array, stats.mean_dbm, stats.uncertainty_db())
+
+
+def _find_carrier_center(sa: tsa.tinySA) -> tuple[float, float]:
     sa.wait()
     center_amplitude, center_frequency = sa.get_marker_value()
     return (center_amplitude, center_frequency)
 
 
-def _make_amp_correction(amp_list: list[float], rbw_correction: float, center_amp: float) -> list[float]:
-    corrected_list: list[float] = []
-
-    for amp in amp_list:
-        corrected_list.append((amp - rbw_correction) - center_amp)
-
-    return corrected_list
-
-
-def _make_freq_correction(freq_array: list[float], center_frequency: float) -> list[float]:
-    corrected_list: list[float] = []
-
-    for freq in freq_array:
-        corrected_list.append(freq - center_frequency)
-
-    return corrected_list
+def _make_amp_correction(amp_array: np.ndarray, rbw_correction: float, center_amp: float) -> np.ndarray:
+    return (np.asarray(amp_array, dtype=np.float64) - rbw_correction) - center_amp
+
+
+def _make_freq_correction(freq_array: np.ndarray, center_frequency: float) -> np.ndarray:
+    return np.asarray(freq_array, dtype=np.float64) - center_frequency
+
+
+def _open_checkpoint(job: PhaseNoiseJob, progress) -> Checkpoint | None:
+    """The job's checkpoint, read back if the job resumes, None without a checkpoint file name."""
+    if not job.checkpoint:
+        return None
+    checkpoint = Checkpoint(job.checkpoint)
+    if job.resume and checkpoint.load(job):
+        progress(f'Resuming, {len(checkpoint.bands)} of {len(job.offsets)} bands were saved.')
+    return checkpoint
+
+
+def _resume_target(job: PhaseNoiseJob, checkpoint: Checkpoint | None) -> float:
+    """Center frequency to set the tinySA to, the saved carrier when resuming, 0 = as it is."""
+    if checkpoint is not None and checkpoint.run is not None:
+        return checkpoint.carrier_reference()[1]
+    return job.center_frequency
+
+
+def _begin_checkpoint(job: PhaseNoiseJob, checkpoint: Checkpoint | None, processor: _BandProcessor,
+                      band_sweeps: list[int], center_amplitude: float, center_frequency: float,
+                      points: int, time_start: float) -> float:
+    """Checks the carrier and restores the saved bands when resuming, else starts the checkpoint file.
+
+    Raises:
+        ValueError: If the carrier moved or the number of points changed since the checkpoint.
+
+    Returns:
+        float: The start time of the run.
+    """
+    if checkpoint is None:
+        return time_start
+    if checkpoint.run is None:
+        checkpoint.start(job, center_frequency, center_amplitude, points, time_start)
+        return time_start
+
+    checkpoint.check_carrier(center_amplitude, center_frequency)
+    if checkpoint.run['points'] != points:
+        raise ValueError(f'Can not resume, the tinySA sweeps {points} points, '
+                         f'the checkpoint was made with {checkpoint.run["points"]}.')
+    for band, record in checkpoint.bands.items():
+        processor.restore(band, record, job.offsets[band][2])
+        band_sweeps[band] = record['sweeps']
+    return checkpoint.run['time_start']
+
+
+class _PhaseNoiseRun:
+    """The bookkeeping of one measurement: checkpoint, band processing, sweep counts,
+    drift and progress messages. measure_phase_noise() and measure_phase_noise_async()
+    share it and only do the tinySA I/O themselves.
+
+    Args:
+        job (PhaseNoiseJob): Measurement settings.
+        progress (callable): Called with a status message string.
+        on_band (callable, optional): See measure_phase_noise().
+    """
+    def __init__(self, job: PhaseNoiseJob, progress, on_band=None):
+        self.job = job
+        self.progress = progress
+        self.on_band = on_band
+        self.band_sweeps = [0] * len(job.offsets)
+        self.center_drift = [float('nan')] * len(job.offsets)
+        self.timer = StageTimer()
+        self.time_start = time.time()
+        self.processor = None
+        self.checkpoint = _open_checkpoint(job, progress)
+        self.center_target = _resume_target(job, self.checkpoint)
+        self.calc = _instrument_calc(job)
+        self.host_sweeps = _host_sweeps(job)
+        self.use_scanraw = job.acquisition == 'scanraw' and self.calc == 'off'
+
+    def carrier_found(self, center_amplitude: float, center_frequency: float) -> None:
+        self.center_amplitude, self.center_frequency = center_amplitude, center_frequency
+        self.first_center_frequency = center_frequency
+        self.progress(f'Center Frequency = {center_frequency} Hz    Amplitude = {center_amplitude} dBm')
+
+    def start_bands(self, points: int) -> None:
+        """Starts the band processing once the sweep points are known, restores the saved bands when resuming.
+
+        Raises:
+            ValueError: If the carrier moved or the number of points changed since the checkpoint.
+        """
+        job, checkpoint = self.job, self.checkpoint
+        self.points = points
+        self.processor = _BandProcessor(points, len(job.offsets), self.timer, job.pipelined, self.on_band,
+                                        checkpoint, job.spurs)
+        self.time_start = _begin_checkpoint(job, checkpoint, self.processor, self.band_sweeps,
+                                            self.center_amplitude, self.center_frequency, points, self.time_start)
+        if checkpoint is not None and checkpoint.bands:
+            self.first_center_frequency = checkpoint.run['center_frequency']
+        self.scheduler = _make_scheduler(job, len(job.offsets) - len(checkpoint.bands if checkpoint else {}))
+
+    def bands(self):
+        """Yields (band, start Hz, stop Hz) of every band still to measure, around the current center."""
+        for band, (start, stop, _) in enumerate(self.job.offsets):
+            if self.checkpoint is not None and band in self.checkpoint.bands:
+                continue
+            self.progress(f'Measuring offset = {start/1e3} kHz.')
+            yield (band, self.center_frequency + start, self.center_frequency + stop)
+
+    def band_measured(self, band: int, freq_array, amp_array, uncertainty, sweeps: int) -> None:
+        """Hands a measured band to the processor, pipelined it is corrected while the next band is swept."""
+        self.band_sweeps[band] = sweeps
+        self.progress(f'{sweeps} sweeps.')
+        self.processor.submit(band, freq_array, amp_array, uncertainty, self.job.offsets[band][2],
+                              self.center_amplitude, self.center_frequency, sweeps)
+
+    def recentered(self, band: int, center_amplitude: float, center_frequency: float) -> None:
+        self.center_drift[band] = self.center_frequency - center_frequency
+        self.center_amplitude, self.center_frequency = center_amplitude, center_frequency
+
+    def finish(self) -> None:
+        """Merges the bands, drops the checkpoint and reports the run."""
+        # Drops any unfilled points of short bands
+        self.freq_data, self.amp_data, self.amp_uncertainty = self.processor.finish()
+        if self.checkpoint is not None:
+            self.checkpoint.remove()
+
+        if self.job.recenter is True:
+            self.progress(f'Center Frequency Drift was = {self.center_drift} Hz')
+
+        self.progress(f'Sweeps averaged per band = {self.band_sweeps}')
+
+        self.progress(f'Finished. Elapsed time = {(time.time() - self.time_start)/60.0:.1f} Minutes')
+        self.progress(self.timer.report(time.time() - self.time_start))
+
+    def stop(self) -> None:
+        if self.processor is not None:
+            self.processor.stop()
+
+    def result(self) -> PhaseNoiseResult:
+        processor = self.processor
+        return PhaseNoiseResult(job=self.job, center_frequency=self.first_center_frequency,
+                                center_amplitude=self.center_amplitude,
+                                freq=self.freq_data, amp=self.amp_data, uncertainty=self.amp_uncertainty,
+                                band_sweeps=self.band_sweeps, center_drift=self.center_drift,
+                                time_start=self.time_start, elapsed=time.time() - self.time_start,
+                                timing=dict(self.timer.totals), band_points=list(processor.band_points),
+                                spurs=processor.spur_table, spur_mask=processor.spur_mask)
 
 
 # * ===== Main P Measure Code =================================================
-def run_phase_noise(window) -> None:
-    global PN_AMP_DATA, PN_FREQ_DATA, PN_CENTER_FREQUENCY
-    PN_AMP_DATA = []
-    PN_FREQ_DATA = []
-    center_drift = []
-
-    time_start = time.time()
+def measure_phase_noise(sa: tsa.tinySA, job: PhaseNoiseJob, progress=print, on_band=None) -> PhaseNoiseResult:
+    """Runs one phase noise measurement, no GUI needed.
+
+    Args:
+        sa (tsa.tinySA): The tinySA to measure with, it is opened and closed here.
+        job (PhaseNoiseJob): Measurement settings.
+        progress (callable, optional): Called with a status message string. Defaults to print.
+        on_band (callable, optional): Called with (band, freq, amp, uncertainty) of every corrected
+                                      band, on the worker thread when 'job.pipelined'.
+
+    Returns:
+        PhaseNoiseResult: The merged, corrected phase noise trace and run information.
+    """
+    run = _PhaseNoiseRun(job, progress, on_band)
+    timer = run.timer
 
     # *----- Setup tinySA -----
     sa.open()
-    sa.set_rbw(0)
-    sa.calc('off')
-    sa.pause()
-
-    # *----- Get carrier info -----
-    _print_message(window, 'Measuring Center Frequency and Amplitude.')
-
-    center_amplitude, center_frequency = _find_carrier_center()
-    PN_CENTER_FREQUENCY = center_frequency
-    print(f'Center Frequency = {center_frequency} Hz    Amplitude = {center_amplitude} dBm')
-
-    sa.calc(PN_AVERAGE)
-
-    # *----- Loop through offsets -----
-    for (start, stop, rbw_correction) in FREQUENCY_OFFSET_LIST:
-
-        _print_message(window, f'Measuring offset = {start/1e3} kHz.')
-        sa.set_start_stop(center_frequency + start, center_frequency + stop)
-
-        _take_sweep(PN_AVERAGE)
-
-        amp_array = sa.get_amp_data()
-        amplitude_corrected = _make_amp_correction(amp_array, rbw_correction, center_amplitude)
-
-        PN_AMP_DATA.extend(amplitude_corrected)
-
-        freq_array = sa.get_freq_data()
-        freq_corrected = _make_freq_correction(freq_array, center_frequency)
-        PN_FREQ_DATA.extend(freq_corrected)
-
-        if PN_RECENTER is True:
-            _print_message(window, 'Re-Measuring Center Frequency.')
-            old = center_frequency
+    try:
+        # The settings go out in one burst, up to the first query
+        with timer('instrument'), sa.transaction():
+            sa.set_rbw(0)
             sa.calc('off')
-            sa.set_center_span(center_frequency, 2000)
-            center_amplitude, center_frequency = _find_carrier_center()
-            sa.calc(PN_AVERAGE)
-            center_delta = old - center_frequency
-            center_drift.append(center_delta)
-
-    if PN_RECENTER is True:
-        print(f'Center Frequency Drift was = {center_drift} Hz')
-
-    _print_message(window, f'Finished. Elapsed time = {(time.time() - time_start)/60.0:.1f} Minutes')
+            sa.pause()
+
+            if run.center_target > 0:
+                progress(f'Setting Center Frequency to {run.center_target} Hz.')
+                sa.set_center_span(run.center_target, 2e3)
+                for _ in range(job.settle_sweeps):
+                    sa.wait()
+
+            # *----- Get carrier info -----
+            progress('Measuring Center Frequency and Amplitude.')
+            run.carrier_found(*_find_carrier_center(sa))
+
+            sa.calc(run.calc)
+            _, _, points = sa.get_sweep()
+
+        run.start_bands(points)
+
+        # *----- Loop through offsets -----
+        # Pipelined, band N is corrected on the worker while band N + 1 is swept here
+        for band, start, stop in run.bands():
+            uncertainty = None
+            if run.host_sweeps:
+                freq_array, amp_array, uncertainty = _take_host_average(
+                    sa, start, stop, run.scheduler, run.use_scanraw, points, timer)
+                sweeps = run.scheduler.band_sweeps[-1]
+            elif run.use_scanraw:
+                with timer('instrument'):
+                    freq_array, amp_array = sa.get_raw_scan(start, stop, points)
+                sweeps = 1
+            else:
+                with timer('instrument'):
+                    sa.set_start_stop(start, stop)
+                    _take_sweep(sa, job.average)
+                sweeps = _averaged_sweeps(job.average)
+                with timer('transfer'):
+                    amp_array = sa.get_amp_data()
+                    freq_array = sa.get_freq_data()
+            run.band_measured(band, freq_array, amp_array, uncertainty, sweeps)
+
+            if job.recenter is True:
+                progress('Re-Measuring Center Frequency.')
+                with timer('instrument'), sa.transaction():
+                    sa.calc('off')
+                    sa.set_center_span(run.center_frequency, 2000)
+                    center = _find_carrier_center(sa)
+                    sa.calc(run.calc)
+                run.recentered(band, *center)
+
+        run.finish()
+
+        # *----- Clean up tinySA -----
+        with sa.transaction():
+            sa.calc('off')
+            sa.set_center_span(run.center_frequency, 2e3)
+            sa.resume()
 
+    # *----- Exit -----
+    finally:
+        run.stop()
+        sa.close()
+
+    return run.result()
+
+# * ===== asyncio Measure Code ==================================================
+async def _take_host_average_async(sa: 'tsa_async.AsyncTinySA', start: float, stop: float,
+                                   scheduler: tav.AveragingScheduler, use_scanraw: bool,
+                                   points: int, timer: StageTimer) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """_take_host_average() on an AsyncTinySA."""
+    if not use_scanraw:
+        with timer('instrument'):
+            await sa.set_start_stop(start, stop)
+
+    stats, more = None, True
+    scheduler.start_band()
+    while more:
+        if use_scanraw:
+            with timer('instrument'):
+                freq_array, amp_array = await sa.get_raw_scan(start, stop, points)
+        else:
+            with timer('instrument'):
+                await sa.wait()
+            with timer('transfer'):
+                amp_array = await sa.get_amp_data()
+        stats, more = _add_host_sweep(stats, amp_array, scheduler, timer)
+
+    scheduler.end_band(stats)
+    if not use_scanraw:
+        with timer('transfer'):
+            freq_array = await sa.get_freq_data()
+
+    return (freq_array, stats.mean_dbm, stats.uncertainty_db())
+
+
+async def _find_carrier_center_async(sa: 'tsa_async.AsyncTinySA') -> tuple[float, float]:
+    await sa.wait()
+    return await sa.get_marker_value()
+
+
+async def measure_phase_noise_async(sa: 'tsa_async.AsyncTinySA', job: PhaseNoiseJob,
+                                    progress=print, on_band=None) -> PhaseNoiseResult:
+    """measure_phase_noise() on an AsyncTinySA, the event loop keeps running
+    other tasks during every sweep and transfer. 'job.pipelined' works the same.
+
+    Args:
+        sa (tsa_async.AsyncTinySA): The tinySA to measure with, it is opened and closed here.
+        job (PhaseNoiseJob): Measurement settings.
+        progress (callable, optional): Called with a status message string. Defaults to print.
+        on_band (callable, optional): See measure_phase_noise().
+
+    Returns:
+        PhaseNoiseResult: The merged, corrected phase noise trace and run information.
+    """
+    run = _PhaseNoiseRun(job, progress, on_band)
+    timer = run.timer
 
+    sa.open()
+    try:
+        with timer('instrument'):
+            async with sa.transaction():
+                await sa.set_rbw(0)
+                await sa.calc('off')
+                await sa.pause()
+
+                if run.center_target > 0:
+                    progress(f'Setting Center Frequency to {run.center_target} Hz.')
+                    await sa.set_center_span(run.center_target, 2e3)
+                    for _ in range(job.settle_sweeps):
+                        await sa.wait()
+
+                progress('Measuring Center Frequency and Amplitude.')
+                run.carrier_found(*await _find_carrier_center_async(sa))
+
+                await sa.calc(run.calc)
+                _, _, points = await sa.get_sweep()
+
+        run.start_bands(points)
+
+        for band, start, stop in run.bands():
+            uncertainty = None
+            if run.host_sweeps:
+                freq_array, amp_array, uncertainty = await _take_host_average_async(
+                    sa, start, stop, run.scheduler, run.use_scanraw, points, timer)
+                sweeps = run.scheduler.band_sweeps[-1]
+            elif run.use_scanraw:
+                with timer('instrument'):
+                    freq_array, amp_array = await sa.get_raw_scan(start, stop, points)
+                sweeps = 1
+            else:
+                with timer('instrument'):
+                    await sa.set_start_stop(start, stop)
+                    for _ in range(_averaged_sweeps(job.average)):
+                        await sa.wait()
+                sweeps = _averaged_sweeps(job.average)
+                with timer('transfer'):
+                    amp_array = await sa.get_amp_data()
+                    freq_array = await sa.get_freq_data()
+            run.band_measured(band, freq_array, amp_array, uncertainty, sweeps)
+
+            if job.recenter is True:
+                progress('Re-Measuring Center Frequency.')
+                with timer('instrument'):
+                    async with sa.transaction():
+                        await sa.calc('off')
+                        await sa.set_center_span(run.center_frequency, 2000)
+                        center = await _find_carrier_center_async(sa)
+                        await sa.calc(run.calc)
+                run.recentered(band, *center)
+
+        run.finish()
+
+        async with sa.transaction():
+            await sa.calc('off')
+            await sa.set_center_span(run.center_frequency, 2e3)
+            await sa.resume()
+
+    finally:
+        run.stop()
+        sa.close()
+
+    return run.result()
 
-    # *----- Clean up tinySA -----
-    sa.calc('off')
-    sa.set_center_span(center_frequency, 2e3)
-    sa.resume()
 
-    # *----- Exit -----
-    sa.close()
+def run_phase_noise(window) -> None:
+    """GUI thread entry, runs with the 'App Control Settings' and reports through 'window' events."""
+    global PN_AMP_DATA, PN_FREQ_DATA, PN_AMP_UNCERTAINTY, PN_BAND_SWEEPS, PN_CENTER_FREQUENCY, PN_RESULT
+    global PN_SPUR_TABLE, PN_SPUR_MASK, sa
+
+    if sa is None:
+        sa = tsa.tinySA()
+
+    band_queue = PN_BAND_QUEUE
+
+    def on_band(band, freq, amp, uncertainty) -> None:
+        if band_queue is not None:
+            band_queue.put((band, freq.copy(), amp.copy()))
+
+    try:
+        result = measure_phase_noise(sa, job_from_settings(), lambda msg: _print_message(window, msg), on_band)
+    except (OSError, ValueError) as e:
+        window.write_event_value('-THREADERROR-', str(e))
+        return
+
+    PN_AMP_DATA = result.amp
+    PN_FREQ_DATA = result.freq
+    PN_AMP_UNCERTAINTY = result.uncertainty
+    PN_BAND_SWEEPS = result.band_sweeps
+    PN_CENTER_FREQUENCY = result.center_frequency
+    PN_RESULT = result
+    PN_SPUR_TABLE = result.spurs
+    PN_SPUR_MASK = result.spur_mask
 
     window.write_event_value('-THREADCOMPLETED-', 'PN App code is finished')
 
@@ -0,0 +1,319 @@
+"""
+=====[ tinySA Ultra / Phase Noise Analysis ]===================================
+
+The figures a phase noise curve is usually accepted on, computed from the
+merged offset trace (dBc/Hz vs offset Hz) and the carrier frequency:
+
+    Integrated SSB phase noise    A = integral of L(f) from f_low to f_high, dBc
+    RMS phase                     sqrt(2 * A) rad, both sidebands
+    RMS jitter                    RMS phase / (2 * pi * carrier frequency) s
+    Residual FM                   sqrt(2 * integral of L(f) * f^2) Hz rms
+    Spot noise                    L(f) at fixed offsets, dBc/Hz
+
+Between two trace points L(f) is taken as a straight line on the log-log
+plot, i.e. a power law, and each segment is integrated exactly. That is
+what 'log-log trapezoidal' integration means, and it is accurate with far
+fewer points than a linear trapezoid on a 1/f^n curve.
+
+Everything is numpy on whole arrays. 'amp' can also be a 2D array of many
+runs on one frequency axis (one row per run) with an array of carrier
+frequencies, then every figure comes back as an array with one value per
+run, so a whole archive is analyzed in one pass (see analyze_runs()).
+
+Usage:
+    figures = analyze(phase_noise.PN_FREQ_DATA, phase_noise.PN_AMP_DATA,
+                      phase_noise.PN_CENTER_FREQUENCY, f_low=1e3, f_high=100e3)
+    print(figures.summary())
+
+    Command line:
+    python pn_analysis.py results/*.pnr [--from 1e3] [--to 1e6]
+    python pn_analysis.py --archive pn_archive --name "DUT X" [--csv figures.csv]
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import sys
+import argparse
+from dataclasses import dataclass, field
+import numpy as np
+
+VERSION = str(0.1)
+
+# Default integration limits, Hz offset
+F_LOW = 1e3
+F_HIGH = 1e6
+
+# Spot noise offsets, Hz
+SPOT_OFFSETS = (1e3, 10e3, 100e3, 1e6)
+
+# Width of the window power averaged for a spot value in decades, 0 = interpolate only
+SPOT_WIDTH = 0.05
+
+# Power law exponents closer than this to -1 are integrated as 1/f (log)
+_LOG_EXPONENT = 1e-9
+
+
+@dataclass
+class PhaseNoiseFigures:
+    """Integrated figures of one run (floats) or many runs (arrays, one value per run)."""
+    center_frequency: float | np.ndarray
+    f_low: float                            # Integration limits actually used, Hz
+    f_high: float
+    integrated_dbc: float | np.ndarray      # Integrated SSB phase noise, dBc
+    rms_phase_rad: float | np.ndarray
+    rms_phase_deg: float | np.ndarray
+    rms_jitter_s: float | np.ndarray
+    residual_fm_hz: float | np.ndarray
+    spot: dict = field(default_factory=dict)   # Offset Hz -> dBc/Hz
+
+    def summary(self) -> str:
+        """Readable summary of a single run."""
+        lines = [f'Integrated {self.f_low:g} Hz to {self.f_high:g} Hz at {self.center_frequency:.0f} Hz carrier:',
+                 f'  Phase noise  = {self.integrated_dbc:.1f} dBc',
+                 f'  RMS phase    = {self.rms_phase_deg:.4g} deg ({self.rms_phase_rad * 1e3:.4g} mrad)',
+                 f'  RMS jitter   = {self.rms_jitter_s * 1e15:.4g} fs',
+                 f'  Residual FM  = {self.residual_fm_hz:.4g} Hz rms']
+        lines += [f'  Spot {offset:>9g} Hz = {dbc:.1f} dBc/Hz' for offset, dbc in self.spot.items()]
+        return '\n'.join(lines)
+
+
+# * ===== Trace Preparation ====================================================
+def _prepare(freq: np.ndarray, amp: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Sorts by offset, drops repeated offsets (band seams) and fills NaN points by
+    interpolation, so every segment can be integrated.
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    amp = np.asarray(amp, dtype=np.float64)
+    freq, first = np.unique(freq, return_index=True)
+    amp = amp[..., first]
+    keep = freq > 0
+    freq, amp = freq[keep], amp[..., keep]
+
+    bad = np.isnan(amp)
+    if bad.any():
+        amp = amp.copy()
+        rows = amp.reshape(-1, len(freq))
+        log_f = np.log10(freq)
+        for row, row_bad in zip(rows, bad.reshape(-1, len(freq))):
+            if row_bad.all():
+                continue
+            if row_bad.any():
+                row[row_bad] = np.interp(log_f[row_bad], log_f[~row_bad], row[~row_bad])
+    return (freq, amp)
+
+
+def log_interp(freq: np.ndarray, amp: np.ndarray, f: np.ndarray) -> np.ndarray:
+    """dB values at the offsets 'f', straight lines on the log frequency axis.
+
+    'freq' must be sorted. 'amp' may be 2D (one run per row), the result then has one row per run.
+    Offsets outside 'freq' get the end values.
+    """
+    f = np.clip(np.asarray(f, dtype=np.float64), freq[0], freq[-1])
+    i = np.clip(np.searchsorted(freq, f), 1, len(freq) - 1)
+    log_f0, log_f1 = np.log10(freq[i - 1]), np.log10(freq[i])
+    w = (np.log10(f) - log_f0) / (log_f1 - log_f0)
+    return amp[..., i - 1] * (1.0 - w) + amp[..., i] * w
+
+
+def _limit(freq: np.ndarray, amp: np.ndarray, f_low: float, f_high: float) -> tuple[np.ndarray, np.ndarray]:
+    """The trace from f_low to f_high with interpolated end points, limits clipped to the trace."""
+    f_low, f_high = max(f_low, freq[0]), min(f_high, freq[-1])
+    if f_high <= f_low:
+        raise ValueError(f'No trace between {f_low:g} Hz and {f_high:g} Hz')
+    inside = (freq > f_low) & (freq < f_high)
+    ends = log_interp(freq, amp, np.array([f_low, f_high]))
+    f = np.concatenate(([f_low], freq[inside], [f_high]))
+    a = np.concatenate((ends[..., :1], amp[..., inside], ends[..., 1:]), axis=-1)
+    return (f, a)
+
+
+# * ===== Integration ==========================================================
+def _power_law_integral(f: np.ndarray, amp_db: np.ndarray, weight_exponent: int = 0) -> np.ndarray:
+    """Integral of L(f) * f^weight_exponent, L as a power law between each pair of points.
+
+    On a segment L(f) = L1 * (f / f1)^b with b the log-log slope, so the integral
+    of L(f) * f^k from f1 to f2 is L1 * f1^(k+1) * ((f2/f1)^(b+k+1) - 1) / (b+k+1),
+    or L1 * f1^(k+1) * ln(f2/f1) when b+k+1 is 0.
+    """
+    f1, f2 = f[:-1], f[1:]
+    l1, l2 = amp_db[..., :-1], amp_db[..., 1:]
+    ratio = f2 / f1
+    log_ratio = np.log10(ratio)
+    e = (l2 - l1) / (10.0 * log_ratio) + weight_exponent + 1.0
+    scale = np.power(10.0, l1 / 10.0) * np.power(f1, weight_exponent + 1.0)
+    log_segment = np.abs(e) < _LOG_EXPONENT
+    with np.errstate(divide='ignore', invalid='ignore'):
+        segment = np.where(log_segment, scale * np.log(ratio), scale * (np.power(ratio, e) - 1.0) / e)
+    return segment.sum(axis=-1)
+
+
+def integrated_noise(freq: np.ndarray, amp: np.ndarray, f_low: float = F_LOW, f_high: float = F_HIGH) -> np.ndarray:
+    """Integrated SSB phase noise from f_low to f_high, linear (rad^2 / 2).
+
+    Args:
+        freq (np.ndarray): Offsets Hz.
+        amp (np.ndarray): dBc/Hz, or a 2D array with one run per row.
+        f_low (float, optional): Lower limit Hz, clipped to the trace.
+        f_high (float, optional): Upper limit Hz, clipped to the trace.
+
+    Raises:
+        ValueError: If the trace does not overlap the limits.
+
+    Returns:
+        np.ndarray: Integrated noise, one value per run.
+    """
+    freq, amp = _prepare(freq, amp)
+    f, a = _limit(freq, amp, f_low, f_high)
+    return _power_law_integral(f, a)
+
+
+def spot_noise(freq: np.ndarray, amp: np.ndarray, offsets=SPOT_OFFSETS, width: float = SPOT_WIDTH) -> np.ndarray:
+    """Phase noise at the offsets, power averaged over +/- width / 2 decades around each.
+    Where the window has no points, or 'width' is 0, the trace is interpolated.
+
+    Returns:
+        np.ndarray: dBc/Hz, shape (len(offsets),) or (runs, len(offsets)), NaN outside the trace.
+    """
+    freq, amp = _prepare(freq, amp)
+    offsets = np.asarray(offsets, dtype=np.float64)
+    if len(freq) == 0:
+        return np.full(amp.shape[:-1] + offsets.shape, np.nan)
+    spot = log_interp(freq, amp, offsets)
+    if width > 0:
+        # Window sums of the linear power from a running sum, all offsets at once
+        lo = np.searchsorted(freq, offsets * 10.0 ** (-width / 2), side='left')
+        hi = np.searchsorted(freq, offsets * 10.0 ** (width / 2), side='right')
+        cum = np.concatenate((np.zeros(amp.shape[:-1] + (1,)), np.cumsum(np.power(10.0, amp / 10.0), axis=-1)), axis=-1)
+        count = hi - lo
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = (cum[..., hi] - cum[..., lo]) / count
+            spot = np.where(count > 0, 10.0 * np.log10(mean), spot)
+    outside = (offsets < freq[0]) | (offsets > freq[-1])
+    return np.where(outside, np.nan, spot)
+
+
+def analyze(freq: np.ndarray, amp: np.ndarray, center_frequency, f_low: float = F_LOW, f_high: float = F_HIGH,
+            spot_offsets=SPOT_OFFSETS) -> PhaseNoiseFigures:
+    """All figures of one run, or of many runs on one frequency axis.
+
+    Args:
+        freq (np.ndarray): Offsets Hz, e.g. 'phase_noise.PN_FREQ_DATA'.
+        amp (np.ndarray): dBc/Hz, e.g. 'phase_noise.PN_AMP_DATA', or one run per row.
+        center_frequency (float | np.ndarray): Carrier Hz, one per run for 2D 'amp'.
+        f_low, f_high (float, optional): Integration limits Hz, clipped to the trace.
+        spot_offsets (optional): Offsets Hz for the spot noise.
+
+    Raises:
+        ValueError: If the trace does not overlap the limits.
+
+    Returns:
+        PhaseNoiseFigures: Floats for one run, arrays for many.
+    """
+    freq, amp = _prepare(freq, amp)
+    f, a = _limit(freq, amp, f_low, f_high)
+    noise = _power_law_integral(f, a)
+    fm_variance = 2.0 * _power_law_integral(f, a, weight_exponent=2)
+    phase = np.sqrt(2.0 * noise)
+    center = np.asarray(center_frequency, dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        jitter = phase / (2.0 * np.pi * center)
+        dbc = 10.0 * np.log10(noise)
+    spots = spot_noise(freq, amp, spot_offsets)
+
+    def out(x):
+        return float(x) if np.ndim(x) == 0 else x
+
+    return PhaseNoiseFigures(center_frequency=out(center), f_low=float(f[0]), f_high=float(f[-1]),
+                             integrated_dbc=out(dbc), rms_phase_rad=out(phase), rms_phase_deg=out(np.degrees(phase)),
+                             rms_jitter_s=out(jitter), residual_fm_hz=out(np.sqrt(fm_variance)),
+                             spot={float(o): out(spots[..., i]) for i, o in enumerate(np.asarray(spot_offsets))})
+
+
+def analyze_result(result, f_low: float = F_LOW, f_high: float = F_HIGH, spot_offsets=SPOT_OFFSETS) -> PhaseNoiseFigures:
+    """Figures of a 'phase_noise.PhaseNoiseResult' or an open 'pn_results.ResultFile'."""
+    return analyze(result.freq, result.amp, result.center_frequency, f_low, f_high, spot_offsets)
+
+
+def analyze_runs(archive, run_ids: list[int], f_low: float = F_LOW, f_high: float = F_HIGH,
+                 spot_offsets=SPOT_OFFSETS) -> dict[int, PhaseNoiseFigures]:
+    """Figures of archived runs. Runs measured on the same offset axis, usually all of them,
+    are stacked and analyzed together in one vectorized pass.
+
+    Args:
+        archive (pn_archive.RunArchive): The archive.
+        run_ids (list[int]): Runs to analyze.
+
+    Returns:
+        dict[int, PhaseNoiseFigures]: Run id -> figures.
+    """
+    groups: dict[bytes, tuple[np.ndarray, list]] = {}
+    for run_id in run_ids:
+        with archive.load(run_id) as rf:
+            freq = np.array(rf.freq)
+            groups.setdefault(freq.tobytes(), (freq, []))[1].append((run_id, np.array(rf.amp), rf.center_frequency))
+
+    figures = {}
+    for freq, runs in groups.values():
+        batch = analyze(freq, np.stack([amp for _, amp, _ in runs]), np.array([c for _, _, c in runs]),
+                        f_low, f_high, spot_offsets)
+        for i, (run_id, _, _) in enumerate(runs):
+            figures[run_id] = PhaseNoiseFigures(
+                center_frequency=float(batch.center_frequency[i]), f_low=batch.f_low, f_high=batch.f_high,
+                integrated_dbc=float(batch.integrated_dbc[i]), rms_phase_rad=float(batch.rms_phase_rad[i]),
+                rms_phase_deg=float(batch.rms_phase_deg[i]), rms_jitter_s=float(batch.rms_jitter_s[i]),
+                residual_fm_hz=float(batch.residual_fm_hz[i]),
+                spot={offset: float(dbc[i]) for offset, dbc in batch.spot.items()})
+    return figures
+
+
+# * ===== Command Line =========================================================
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Integrated phase noise, jitter, residual FM and spot noise')
+    parser.add_argument('files', nargs='*', help='Binary result files (.pnr)')
+    parser.add_argument('--archive', default=None, help='Analyze the runs of this archive directory')
+    parser.add_argument('--name', default=None, help='Archive test name')
+    parser.add_argument('--center', type=float, default=None, help='Archive center frequency Hz')
+    parser.add_argument('--since', default=None, help="Archive runs since 'YYYY-MM-DD'")
+    parser.add_argument('--from', dest='f_low', type=float, default=F_LOW, help='Integrate from, Hz offset')
+    parser.add_argument('--to', dest='f_high', type=float, default=F_HIGH, help='Integrate to, Hz offset')
+    parser.add_argument('--csv', default=None, help='Also write the figures to this CSV file')
+    args = parser.parse_args(argv)
+
+    import pn_results
+    rows = []   # (name, figures)
+    try:
+        for file_name in args.files:
+            with pn_results.ResultFile(file_name) as rf:
+                rows.append((file_name, analyze_result(rf, args.f_low, args.f_high)))
+        if args.archive:
+            import pn_archive
+            with pn_archive.RunArchive(args.archive) as archive:
+                runs = archive.query(test_name=args.name, center_frequency=args.center, since=args.since)
+                figures = analyze_runs(archive, [run['id'] for run in runs], args.f_low, args.f_high)
+            rows += [(f'{run["id"]} {run["test_name"]}', figures[run['id']]) for run in runs]
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    header = ['run', 'center_hz', 'integrated_dbc', 'rms_phase_deg', 'rms_jitter_fs', 'residual_fm_hz'] + \
+             [f'spot_{offset:g}_hz' for offset in SPOT_OFFSETS]
+    table = [[name, f'{fig.center_frequency:.0f}', f'{fig.integrated_dbc:.2f}', f'{fig.rms_phase_deg:.5g}',
+              f'{fig.rms_jitter_s * 1e15:.5g}', f'{fig.residual_fm_hz:.5g}'] +
+             [f'{dbc:.1f}' for dbc in fig.spot.values()] for name, fig in rows]
+
+    print(f'Integrated {args.f_low:g} Hz to {args.f_high:g} Hz offset')
+    print('  '.join(header))
+    for line in table:
+        print('  '.join(line))
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8') as f:
+            f.write(','.join(header) + '\n')
+            f.writelines(','.join(f'"{line[0]}"' if i == 0 else v for i, v in enumerate(line)) + '\n'
+                         for line in table)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# ----- Fini -----
@@ -0,0 +1,350 @@
+"""
+=====[ tinySA Ultra / Phase Noise Run Archive ]================================
+
+An archive directory of phase noise runs with a SQLite index, so finding
+"all runs of DUT X at 10 MHz last month" is one indexed query instead of
+globbing and parsing every CSV file.
+
+    <archive>/index.sqlite      One row per run: test name, center frequency,
+                                averaging, timestamps and spot noise at SPOT_OFFSETS
+                                (the 'pn_analysis.py' spot offsets and spot_noise())
+    <archive>/traces/<id>.pnr   The trace data, binary result files (see 'pn_results.py')
+
+Queries and trends only touch the index, a trace is only opened (memory
+mapped) when it is asked for.
+
+Usage:
+    archive = RunArchive('pn_archive')
+    archive.add(result)
+    runs = archive.query(test_name='DUT X', center_frequency=10e6, since='2024-04-01')
+    times, dbc = archive.trend(10e3, test_name='DUT X')
+    with archive.load(runs[0]['id']) as rf:
+        ...
+
+    Command line:
+    python pn_archive.py pn_archive --name "DUT X" --center 10e6 --since 2024-04-01 [--trend 10k]
+    python pn_archive.py pn_archive --import results/*.pnr
+    python pn_archive.py pn_archive --name "DUT X" --overlay   (plot the traces of all matching runs)
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+import numpy as np
+
+import pn_results
+import pn_analysis
+import log_grid
+
+VERSION = str(0.1)
+
+INDEX_FILE = 'index.sqlite'
+TRACE_DIR = 'traces'
+
+# Center frequencies are matched within this fraction, the carrier is measured
+CENTER_TOLERANCE = 1e-4
+
+# Overlay plot offset axis and default width in pixels, each trace is decimated to the width
+OVERLAY_F_START = 1e3
+OVERLAY_F_STOP = 1e6
+OVERLAY_WIDTH = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    test_name TEXT NOT NULL,
+    center_frequency REAL NOT NULL,
+    center_amplitude REAL,
+    average TEXT,
+    acquisition TEXT,
+    recenter INTEGER,
+    time_start REAL NOT NULL,
+    elapsed REAL,
+    points INTEGER,
+    file TEXT,
+    {spot_columns}
+);
+CREATE INDEX IF NOT EXISTS runs_name_time ON runs (test_name, time_start);
+CREATE INDEX IF NOT EXISTS runs_center ON runs (center_frequency);
+CREATE INDEX IF NOT EXISTS runs_time ON runs (time_start);
+"""
+
+
+def _spot_column(offset: float) -> str:
+    """Index column of a spot offset, e.g. 10e3 -> 'spot_10k'."""
+    for scale, suffix in ((1e6, 'm'), (1e3, 'k')):
+        if offset >= scale:
+            return f'spot_{offset / scale:g}{suffix}'.replace('.', '_')
+    return f'spot_{offset:g}'.replace('.', '_')
+
+
+# Offsets (Hz) whose phase noise is kept in the index, column name -> offset
+SPOT_OFFSETS = {_spot_column(offset): offset for offset in pn_analysis.SPOT_OFFSETS}
+
+
+def _epoch(t) -> float | None:
+    """Epoch seconds from None, a number or a 'YYYY-MM-DD[ HH:MM]' local time string."""
+    if t is None or isinstance(t, (int, float)):
+        return t
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(t, fmt))
+        except ValueError:
+            pass
+    raise ValueError(f"Bad time '{t}', use 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM'")
+
+
+class RunArchive:
+    """A run archive directory, created if it does not exist.
+
+    Safe to share between threads, e.g. with 'multi_analyzer.py'.
+
+    Args:
+        directory (str): The archive directory.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, TRACE_DIR), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, INDEX_FILE), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA.format(spot_columns=', '.join(f'{c} REAL' for c in SPOT_OFFSETS)))
+        # An archive made with other spot offsets gets the missing columns, older runs have NULL there
+        existing = {row['name'] for row in self._db.execute('PRAGMA table_info(runs)')}
+        for column in SPOT_OFFSETS:
+            if column not in existing:
+                self._db.execute(f'ALTER TABLE runs ADD COLUMN {column} REAL')
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> 'RunArchive':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # * ===== Adding Runs ======================================================
+    def _insert(self, row: dict, freq: np.ndarray, amp: np.ndarray, write_trace) -> int:
+        """Indexes a run and stores its trace as 'traces/<id>.pnr' in one transaction."""
+        spots = pn_analysis.spot_noise(freq, amp, list(SPOT_OFFSETS.values()))
+        row.update((column, float(spot)) for column, spot in zip(SPOT_OFFSETS, spots))
+        columns = ', '.join(row)
+        with self._lock, self._db:
+            run_id = self._db.execute(f'INSERT INTO runs ({columns}) VALUES ({", ".join("?" * len(row))})',
+                                      list(row.values())).lastrowid
+            file = os.path.join(TRACE_DIR, f'{run_id:06d}.{pn_results.RESULT_EXTENSION}')
+            write_trace(os.path.join(self.directory, file))
+            self._db.execute('UPDATE runs SET file = ? WHERE id = ?', (file, run_id))
+        return run_id
+
+    def add(self, result) -> int:
+        """Archives a 'phase_noise.PhaseNoiseResult'.
+
+        Returns:
+            int: The run id.
+        """
+        job = result.job
+        row = {'test_name': job.test_name, 'center_frequency': result.center_frequency,
+               'center_amplitude': result.center_amplitude, 'average': job.average,
+               'acquisition': job.acquisition, 'recenter': int(job.recenter),
+               'time_start': result.time_start, 'elapsed': result.elapsed, 'points': len(result.freq)}
+        return self._insert(row, result.freq, result.amp,
+                            lambda file_name: pn_results.write_result_file(file_name, result))
+
+    def import_file(self, file_name: str) -> int:
+        """Archives a copy of an existing binary result file.
+
+        Raises:
+            ValueError: If it is not a result file.
+
+        Returns:
+            int: The run id.
+        """
+        with pn_results.ResultFile(file_name) as rf:
+            row = {'test_name': rf.test_name, 'center_frequency': rf.center_frequency,
+                   'center_amplitude': rf.center_amplitude, 'average': rf.average,
+                   'acquisition': rf.acquisition, 'recenter': int(rf.recenter),
+                   'time_start': rf.time_start, 'elapsed': rf.elapsed, 'points': len(rf.freq)}
+            freq, amp = np.array(rf.freq), np.array(rf.amp)
+        with open(file_name, 'rb') as f:
+            data = f.read()
+
+        def copy(dest: str) -> None:
+            with open(dest, 'wb') as f:
+                f.write(data)
+        return self._insert(row, freq, amp, copy)
+
+    # * ===== Queries ==========================================================
+    @staticmethod
+    def _where(test_name=None, center_frequency=None, average=None, since=None, until=None) -> tuple[str, list]:
+        terms, args = [], []
+        if test_name is not None:
+            terms.append('test_name = ?')
+            args.append(test_name)
+        if center_frequency is not None:
+            terms.append('center_frequency BETWEEN ? AND ?')
+            args += [center_frequency * (1 - CENTER_TOLERANCE), center_frequency * (1 + CENTER_TOLERANCE)]
+        if average is not None:
+            terms.append('average = ?')
+            args.append(average)
+        if since is not None:
+            terms.append('time_start >= ?')
+            args.append(_epoch(since))
+        if until is not None:
+            terms.append('time_start < ?')
+            args.append(_epoch(until))
+        return ((' WHERE ' + ' AND '.join(terms)) if terms else '', args)
+
+    def query(self, test_name: str | None = None, center_frequency: float | None = None,
+              average: str | None = None, since=None, until=None, limit: int | None = None) -> list[dict]:
+        """Index rows of the matching runs, oldest first. All filters are optional.
+
+        Args:
+            test_name (str, optional): Exact test name.
+            center_frequency (float, optional): Carrier Hz, matched within CENTER_TOLERANCE.
+            average (str, optional): Averaging mode.
+            since, until (optional): Epoch seconds or a 'YYYY-MM-DD[ HH:MM]' local time.
+            limit (int, optional): Most rows to return.
+
+        Returns:
+            list[dict]: One dict of the index columns per run. A spot value is None
+                        where the run's trace does not reach the offset.
+        """
+        where, args = self._where(test_name, center_frequency, average, since, until)
+        sql = f'SELECT * FROM runs{where} ORDER BY time_start'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, args)]
+
+    def trend(self, offset: float, **filters) -> tuple[np.ndarray, np.ndarray]:
+        """Spot phase noise at one of the SPOT_OFFSETS over time, for the runs matching 'filters' (see query()).
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (Start times epoch s, dBc/Hz), NaN where a run has no spot value.
+        """
+        column = next((c for c, f in SPOT_OFFSETS.items() if f == offset), None)
+        if column is None:
+            raise ValueError(f'No spot value kept at {offset} Hz, use one of {list(SPOT_OFFSETS.values())}')
+        where, args = self._where(**filters)
+        with self._lock:
+            rows = self._db.execute(f'SELECT time_start, {column} FROM runs{where} ORDER BY time_start',
+                                    args).fetchall()
+        # A NULL spot (trace short of the offset) becomes NaN
+        data = np.array([(t, np.nan if dbc is None else dbc) for t, dbc in rows], dtype=np.float64).reshape(-1, 2)
+        return (data[:, 0], data[:, 1])
+
+    def load(self, run_id: int) -> pn_results.ResultFile:
+        """Opens the trace of a run (memory mapped).
+
+        Raises:
+            KeyError: If there is no such run.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT file FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None or row['file'] is None:
+            raise KeyError(run_id)
+        return pn_results.ResultFile(os.path.join(self.directory, row['file']))
+
+    def overlay(self, run_ids: list[int], buckets: int = OVERLAY_WIDTH) -> list[tuple[int, np.ndarray, np.ndarray]]:
+        """Traces of several runs ready to overlay on one plot, each decimated to
+        a min / max pair per bucket (see 'log_grid.decimate_log'), so the plot
+        stays fast however many runs or points there are.
+
+        Args:
+            run_ids (list[int]): Runs to load.
+            buckets (int, optional): Buckets on the offset axis, usually the plot width in pixels.
+
+        Returns:
+            list[tuple[int, np.ndarray, np.ndarray]]: (Run id, Offsets Hz, dBc/Hz) per run.
+        """
+        traces = []
+        for run_id in run_ids:
+            with self.load(run_id) as rf:
+                freq, amp = log_grid.decimate_log(rf.freq, rf.amp, buckets, OVERLAY_F_START, OVERLAY_F_STOP)
+            traces.append((run_id, freq, amp))
+        return traces
+
+
+# * ===== Command Line =========================================================
+def _offset(text: str) -> float:
+    """'10k', '1M', '1e3' -> Hz"""
+    scale = {'k': 1e3, 'm': 1e6}.get(text[-1:].lower(), 1.0)
+    return float(text[:-1] if scale != 1.0 else text) * scale
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Phase noise run archive')
+    parser.add_argument('archive', help='Archive directory')
+    parser.add_argument('--import', dest='import_files', nargs='+', metavar='PNR', help='Add result files')
+    parser.add_argument('--name', default=None, help='Test name')
+    parser.add_argument('--center', type=float, default=None, help='Center frequency Hz')
+    parser.add_argument('--average', default=None, help='Averaging mode')
+    parser.add_argument('--since', default=None, help="'YYYY-MM-DD'")
+    parser.add_argument('--until', default=None, help="'YYYY-MM-DD'")
+    parser.add_argument('--trend', type=_offset, default=None, help="Plot the spot noise at an offset, e.g. '10k'")
+    parser.add_argument('--overlay', action='store_true', help='Plot the traces of the matching runs on one plot')
+    parser.add_argument('--width', type=int, default=OVERLAY_WIDTH, help='Overlay plot width in pixels')
+    args = parser.parse_args(argv)
+
+    with RunArchive(args.archive) as archive:
+        for file_name in args.import_files or []:
+            try:
+                print(f'{file_name} -> run {archive.import_file(file_name)}')
+            except (OSError, ValueError) as e:
+                print(f'{file_name} not imported: {e}', file=sys.stderr)
+
+        filters = dict(test_name=args.name, center_frequency=args.center, average=args.average,
+                       since=args.since, until=args.until)
+        try:
+            runs = archive.query(**filters)
+            if args.trend is not None:
+                times, dbc = archive.trend(args.trend, **filters)
+            if args.overlay:
+                traces = archive.overlay([run['id'] for run in runs], args.width)
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    for run in runs:
+        spots = '  '.join(f'{run[c]:7.1f}' if run[c] is not None else f'{"-":>7}' for c in SPOT_OFFSETS)
+        print(f'{run["id"]:6d}  {time.strftime("%Y-%m-%d %H:%M", time.localtime(run["time_start"]))}  '
+              f'{run["test_name"]:<24.24}  {run["center_frequency"]:14.0f} Hz  {run["average"]:<8}  {spots}')
+    print(f'{len(runs)} runs, dBc/Hz at offsets {", ".join(SPOT_OFFSETS)}')
+
+    if args.trend is not None and len(times):
+        import matplotlib.pyplot as plt
+        plt.plot(times.astype('datetime64[s]'), dbc, 'o-')
+        plt.grid(which='both')
+        plt.ylabel(f'Phase Noise at {args.trend:g} Hz [dBc/Hz]')
+        plt.title(args.name or 'All runs')
+        plt.show()
+
+    if args.overlay and traces:
+        import matplotlib.pyplot as plt
+        px = 1/plt.rcParams['figure.dpi']  # pixel in inches
+        plt.subplots(figsize=(args.width*px, args.width*0.75*px))
+        for run_id, freq, amp in traces:
+            plt.plot(freq, amp, linewidth=0.8, label=str(run_id))
+        plt.semilogx()
+        plt.grid(which='both')
+        plt.xlim(OVERLAY_F_START, OVERLAY_F_STOP)
+        plt.xlabel('Frequency Offset [Hz]')
+        plt.ylabel('Phase Noise [dBc/Hz]')
+        plt.title(args.name or 'All runs')
+        if len(traces) <= 10:
+            plt.legend(title='Run')
+        plt.show()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# ----- Fini -----
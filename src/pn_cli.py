@@ -0,0 +1,242 @@
+"""
+=====[ tinySA Ultra / Phase Noise Command Line Runner ]========================
+
+Runs phase noise measurements without the GUI, one job or a whole job file
+of carriers back to back. Nothing from the GUI or matplotlib is imported,
+so it starts quickly and runs on a headless rack server.
+
+Every finished job is written to the output directory straight away:
+a binary result file with the run metadata (see 'pn_results.py'), a CSV file
+of the trace exported from it, both named like the GUI does, and one summary
+line appended to 'results.jsonl'. With --stats the summary line also has the
+driver counters of the job: command latencies, bytes, timeouts and retries.
+
+Usage:
+    python pn_cli.py --name "DUT 1" --average aver16 [--center 10e6] [--recenter]
+    python pn_cli.py jobs.json [--output-dir results] [--port COM3]
+    python pn_cli.py jobs.json --simulate          (no tinySA needed)
+    python pn_cli.py jobs.json --all-devices       (every connected tinySA at once)
+    python pn_cli.py jobs.json --archive pn_archive (also index every run, see 'pn_archive.py')
+    python pn_cli.py jobs.json --checkpoint-dir ckpt [--resume]  (resume interrupted jobs)
+    python pn_cli.py jobs.json --stats [--trace driver_trace.jsonl]  (driver counters, see 'driver_stats.py')
+
+Job file (JSON), 'defaults' apply to every job, any PhaseNoiseJob field can be used:
+    {
+      "defaults": {"average": "aver4", "recenter": false},
+      "jobs": [
+        {"test_name": "Ref 10 MHz", "center_frequency": 10e6},
+        {"test_name": "LO 1152 MHz", "center_frequency": 1152e6, "average": "adaptive", "time_budget": 300}
+      ]
+    }
+    "offsets" is a list of [start Hz, stop Hz, RBW correction dB] bands, default is the app list.
+    "device" pins a job to a serial port with --all-devices, see 'multi_analyzer.py'.
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import os
+import re
+import math
+import sys
+import json
+import argparse
+import dataclasses
+
+import tinysa_ultra as tsa
+import phase_noise
+import pn_results
+
+VERSION = str(0.1)
+
+SUMMARY_FILE = 'results.jsonl'
+
+
+# * ===== Python API ===========================================================
+def load_jobs(file_name: str) -> list[phase_noise.PhaseNoiseJob]:
+    """Reads a job file.
+
+    Raises:
+        ValueError: On an unknown job setting.
+    """
+    with open(file_name, encoding='utf-8') as f:
+        spec = json.load(f)
+
+    defaults = spec.get('defaults', {})
+    jobs = []
+    for entry in spec.get('jobs', [{}]):
+        settings = {**defaults, **entry}
+        if 'offsets' in settings:
+            settings['offsets'] = [tuple(band) for band in settings['offsets']]
+        try:
+            jobs.append(phase_noise.PhaseNoiseJob(**settings))
+        except TypeError as e:
+            raise ValueError(f'Bad job in {file_name}: {e}') from None
+    return jobs
+
+
+def checkpoint_file_name(job: phase_noise.PhaseNoiseJob, index: int, directory: str) -> str:
+    """Checkpoint file of the job at 'index' in the job list, e.g. '003 Ref 10 MHz.checkpoint.jsonl'.
+
+    The index keeps jobs with the same test name apart, a pinned job also gets its
+    device. Characters that could leave 'directory' or are not allowed in file
+    names are replaced with '_'.
+    """
+    name = f'{index:03d} {job.test_name}' + (f' {job.device}' if job.device else '')
+    name = re.sub(r'[^\w .\-]', '_', name).strip(' .')
+    return os.path.join(directory, name + '.checkpoint.jsonl')
+
+
+def write_result(result: phase_noise.PhaseNoiseResult, output_dir: str, csv: bool = True, archive=None,
+                 driver: dict | None = None) -> str:
+    """Writes the binary result file, the CSV exported from it, and appends the summary line.
+    With a 'pn_archive.RunArchive' the run is archived too. 'driver' is a driver
+    snapshot added to the summary line, see 'tinySA.snapshot'.
+
+    Returns:
+        str: The result file name.
+    """
+    result_file = pn_results.result_file_name(result.job.test_name, pn_results.RESULT_EXTENSION, output_dir)
+    pn_results.write_result_file(result_file, result)
+    csv_file = None
+    if csv:
+        csv_file = os.path.splitext(result_file)[0] + '.csv'
+        with pn_results.ResultFile(result_file) as rf:
+            rf.export_csv(csv_file)
+
+    summary = {
+        'job': dataclasses.asdict(result.job),
+        'result_file': result_file,
+        'csv_file': csv_file,
+        'center_frequency': result.center_frequency,
+        'center_amplitude': result.center_amplitude,
+        'band_sweeps': result.band_sweeps,
+        'center_drift': [None if math.isnan(d) else d for d in result.center_drift],
+        'time_start': result.time_start,
+        'elapsed': result.elapsed,
+        'timing': result.timing,
+        'points': int(len(result.freq)),
+    }
+    if result.job.spurs:
+        summary['spurs'] = [dict(zip(result.spurs.dtype.names, map(float, spur))) for spur in result.spurs]
+    if driver is not None:
+        summary['driver'] = driver
+    with open(os.path.join(output_dir, SUMMARY_FILE), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(summary) + '\n')
+    if archive is not None:
+        archive.add(result)
+    return result_file
+
+
+def run_jobs(sa: tsa.tinySA, jobs: list[phase_noise.PhaseNoiseJob], output_dir: str = '.',
+             progress=print, csv: bool = True, archive=None) -> list[phase_noise.PhaseNoiseResult]:
+    """Runs the jobs back to back on one tinySA, writing each result as it finishes.
+
+    A job that fails with a serial / device error, or can not be resumed, is reported and skipped.
+    With an instrumented driver the counters are cleared before each job and reported after it.
+
+    Returns:
+        list[phase_noise.PhaseNoiseResult]: Results of the jobs that completed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    for i, job in enumerate(jobs):
+        progress(f'Job {i + 1} of {len(jobs)}: {job.test_name}')
+        if sa.stats is not None:
+            sa.stats.reset()
+        try:
+            result = phase_noise.measure_phase_noise(sa, job, progress)
+        except (OSError, ValueError) as e:
+            progress(f'Job {job.test_name} failed: {e}')
+            continue
+        finally:
+            if sa.stats is not None:
+                progress(sa.stats.report())
+        result_file = write_result(result, output_dir, csv, archive, sa.snapshot())
+        progress(f'Result written to: {result_file}')
+        results.append(result)
+    return results
+
+
+# * ===== Command Line =========================================================
+def make_device(port: str | None, simulate: bool, **driver_args) -> tsa.tinySA:
+    if simulate:
+        import tinysa_simulator as sim
+        return tsa.tinySA(transport=sim.SimulatedSerial(time_scale=0.0), **driver_args)
+    return tsa.tinySA(dev=port, **driver_args)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='tinySA Ultra phase noise measurement, no GUI')
+    parser.add_argument('job_file', nargs='?', help='JSON job file, else one job from the options')
+    parser.add_argument('--name', default='Phase Noise Test', help='Test name')
+    parser.add_argument('--center', type=float, default=0.0, help='Carrier Hz, 0 = as set on the tinySA')
+    parser.add_argument('--average', default='aver16',
+                        choices=['off', 'aver4', 'aver16', 'host4', 'host16', 'adaptive'])
+    parser.add_argument('--acquisition', default='text', choices=['text', 'scanraw'])
+    parser.add_argument('--recenter', action='store_true', help='Recenter after each band')
+    parser.add_argument('--pipelined', action='store_true', help='Process each band while the next one sweeps')
+    parser.add_argument('--spurs', action='store_true', help='Find the spurs in every band, listed in the summary')
+    parser.add_argument('--time-budget', type=float, default=0.0, help="Seconds, 'adaptive' averaging")
+    parser.add_argument('--output-dir', default='.', help='Where results are written')
+    parser.add_argument('--csv', action=argparse.BooleanOptionalAction, default=True,
+                        help='Also export each result as CSV')
+    parser.add_argument('--archive', default=None, help='Also add every run to this archive directory')
+    parser.add_argument('--checkpoint-dir', default=None, help='Save completed bands of every job here')
+    parser.add_argument('--resume', action='store_true', help='Resume the jobs saved in --checkpoint-dir')
+    parser.add_argument('--stats', action='store_true', help='Report driver counters and latencies per job')
+    parser.add_argument('--trace', default=None, help='Append every driver command to this JSON-lines file')
+    parser.add_argument('--port', default=None, help='Serial port, default is found by USB ID')
+    parser.add_argument('--simulate', action='store_true', help='Use the tinySA simulator')
+    parser.add_argument('--all-devices', action='store_true', help='Run on every connected tinySA at once')
+    parser.add_argument('--devices', type=int, default=2, help='Number of simulators for --all-devices --simulate')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.job_file:
+            jobs = load_jobs(args.job_file)
+        else:
+            jobs = [phase_noise.PhaseNoiseJob(test_name=args.name, center_frequency=args.center,
+                                              average=args.average, acquisition=args.acquisition,
+                                              recenter=args.recenter, time_budget=args.time_budget,
+                                              pipelined=args.pipelined, spurs=args.spurs)]
+    except (OSError, ValueError) as e:
+        print(f'Could not read the job file: {e}', file=sys.stderr)
+        return 2
+
+    if args.checkpoint_dir:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+        for index, job in enumerate(jobs):
+            job.checkpoint = job.checkpoint or checkpoint_file_name(job, index, args.checkpoint_dir)
+            job.resume = job.resume or args.resume
+
+    driver_args = dict(instrument=args.stats, trace_file=args.trace)
+
+    archive = None
+    if args.archive:
+        import pn_archive
+        archive = pn_archive.RunArchive(args.archive)
+
+    if args.all_devices:
+        import multi_analyzer
+        try:
+            if args.simulate:
+                registry = multi_analyzer.DeviceRegistry.simulated(args.devices, **driver_args)
+            else:
+                registry = multi_analyzer.DeviceRegistry.discover(**driver_args)
+        except OSError as e:
+            print(e, file=sys.stderr)
+            return 1
+        by_device = multi_analyzer.run_jobs_parallel(registry, jobs, args.output_dir, csv=args.csv, archive=archive)
+        completed = sum(len(r) for r in by_device.values())
+    else:
+        completed = len(run_jobs(make_device(args.port, args.simulate, **driver_args), jobs, args.output_dir,
+                                 csv=args.csv, archive=archive))
+    if archive is not None:
+        archive.close()
+    return 0 if completed == len(jobs) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# ----- Fini -----
@@ -0,0 +1,157 @@
+"""
+=====[ tinySA Ultra / Phase Noise Result Files ]===============================
+
+Writing of phase noise results to disk, shared by the GUI app and the
+command line runner, with no GUI or plotting imports.
+
+Result file ('.pnr'), little endian, the band table and data blocks are 8 byte aligned:
+    Header      RESULT_HEADER, 256 bytes: run metadata, packed (its doubles start at byte 20)
+    Band table  'bands' records of BAND_DTYPE: offsets, RBW correction, drift, sweeps, points
+    Data        float64 [total points] frequency offset Hz, then the same for
+                amplitude dBc/Hz and uncertainty dB. Each band is a contiguous
+                slice of 'points' of every block, in band order.
+
+ResultFile opens it with numpy.memmap, so nothing is read or copied until the
+data is used. CSV files are a derived view, see ResultFile.export_csv().
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import os
+import time
+import struct
+import numpy as np
+
+VERSION = str(0.1)
+
+RESULT_MAGIC = b'TSA-PNR\0'
+RESULT_VERSION = 1
+RESULT_EXTENSION = 'pnr'
+
+# magic, version, header size, bands, total points, center Hz, center dBm, start time (epoch s),
+# elapsed s, host CI target dB, averaging, acquisition, flags, test name (UTF-8), reserved.
+# Packed, not aligned: read it with RESULT_HEADER.unpack, not as a numpy record. It is 256
+# bytes, so the band table and data that follow are 8 byte aligned.
+RESULT_HEADER = struct.Struct('<8sHHIIddddd16s16sI128s32x')
+FLAG_RECENTER = 0x1
+FLAG_PIPELINED = 0x2
+
+BAND_DTYPE = np.dtype([('start', '<f8'), ('stop', '<f8'), ('rbw_correction', '<f8'),
+                       ('center_drift', '<f8'), ('sweeps', '<i8'), ('points', '<i8')])
+
+
+def result_file_name(title: str, extension: str = 'csv', directory: str = '') -> str:
+    """File name made of the test title and the current date and time, so every run is unique.
+    If that file already exists (same title within a minute) a ' #2', ' #3', ... is added.
+
+    Returns:
+        str: e.g. 'Phase Noise Test (2024-04-30 1405).csv'
+    """
+    dt = time.strftime("%Y-%m-%d %H%M")
+    base = os.path.join(directory, title + ' (' + dt + ')')
+    file_name = base + '.' + extension
+    n = 1
+    while os.path.exists(file_name):
+        n += 1
+        file_name = f'{base} #{n}.{extension}'
+    return file_name
+
+
+def write_csv(file_name: str, x_data: np.ndarray, y_data: np.ndarray) -> None:
+    """Writes 'frequency, amplitude' rows.
+
+    Raises:
+        OSError: If the file could not be created or written.
+    """
+    with open(file_name, 'w', newline='', encoding='utf-8') as csvfile:
+        np.savetxt(csvfile, np.column_stack((x_data, y_data)), fmt='%.12g', delimiter=',')
+
+
+def write_result_file(file_name: str, result) -> None:
+    """Writes a 'phase_noise.PhaseNoiseResult' as a binary result file.
+
+    Raises:
+        OSError: If the file could not be created or written.
+    """
+    job = result.job
+    bands = len(job.offsets)
+    band_points = list(result.band_points) or [len(result.freq)] + [0] * (bands - 1)
+
+    table = np.zeros(bands, dtype=BAND_DTYPE)
+    table['start'], table['stop'], table['rbw_correction'] = np.array(job.offsets, dtype=np.float64).reshape(-1, 3).T
+    # Drift is per band, NaN where the run did not recenter after the band (or it was resumed)
+    drift = np.asarray(result.center_drift, dtype=np.float64)[:bands]
+    table['center_drift'] = np.nan
+    table['center_drift'][:len(drift)] = drift
+    table['sweeps'][:len(result.band_sweeps)] = result.band_sweeps[:bands]
+    table['points'] = band_points
+
+    flags = (FLAG_RECENTER if job.recenter else 0) | (FLAG_PIPELINED if getattr(job, 'pipelined', False) else 0)
+    header = RESULT_HEADER.pack(RESULT_MAGIC, RESULT_VERSION, RESULT_HEADER.size, bands, len(result.freq),
+                                result.center_frequency, result.center_amplitude, result.time_start,
+                                result.elapsed, job.host_ci_target, job.average.encode()[:16],
+                                job.acquisition.encode()[:16], flags, job.test_name.encode('utf-8')[:128])
+
+    with open(file_name, 'wb') as f:
+        f.write(header)
+        f.write(table.tobytes())
+        for data in (result.freq, result.amp, result.uncertainty):
+            f.write(np.ascontiguousarray(data, dtype='<f8').tobytes())
+
+
+class ResultFile:
+    """A binary result file, opened with numpy.memmap.
+
+    'freq', 'amp' and 'uncertainty' are read only memmaps of the merged trace,
+    'bands' the band table (BAND_DTYPE), band(i) the views of one band.
+
+    Raises:
+        ValueError: If the file is not a result file or is truncated.
+        OSError: If it could not be opened.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            raw = f.read(RESULT_HEADER.size)
+        if len(raw) < RESULT_HEADER.size or raw[:8] != RESULT_MAGIC:
+            raise ValueError(f'{file_name} is not a phase noise result file')
+        (_, self.version, header_size, band_count, total_points, self.center_frequency,
+         self.center_amplitude, self.time_start, self.elapsed, self.host_ci_target,
+         average, acquisition, flags, test_name) = RESULT_HEADER.unpack(raw)
+        if self.version > RESULT_VERSION:
+            raise ValueError(f'{file_name} is result file version {self.version}, newer than this app')
+
+        self.average = average.rstrip(b'\0').decode()
+        self.acquisition = acquisition.rstrip(b'\0').decode()
+        self.test_name = test_name.rstrip(b'\0').decode('utf-8', errors='replace')
+        self.recenter = bool(flags & FLAG_RECENTER)
+        self.pipelined = bool(flags & FLAG_PIPELINED)
+
+        data_offset = header_size + band_count * BAND_DTYPE.itemsize
+        if os.path.getsize(file_name) < data_offset + 3 * total_points * 8:
+            raise ValueError(f'{file_name} is truncated')
+        self.bands = np.memmap(file_name, dtype=BAND_DTYPE, mode='r', offset=header_size, shape=(band_count,))
+        data = np.memmap(file_name, dtype='<f8', mode='r', offset=data_offset, shape=(3, total_points))
+        self.freq, self.amp, self.uncertainty = data
+        self._band_start = np.concatenate(([0], np.cumsum(self.bands['points'])))
+
+    def band(self, i: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(Frequency offset Hz, Amplitude dBc/Hz, Uncertainty dB) views of band 'i'."""
+        band_slice = slice(self._band_start[i], self._band_start[i + 1])
+        return (self.freq[band_slice], self.amp[band_slice], self.uncertainty[band_slice])
+
+    def export_csv(self, file_name: str) -> None:
+        """Writes the merged trace as a CSV file, like the app always did."""
+        write_csv(file_name, self.freq, self.amp)
+
+    def close(self) -> None:
+        """Drops the memmaps, so the file can be moved or deleted (Windows)."""
+        self.bands = self.freq = self.amp = self.uncertainty = None
+
+    def __enter__(self) -> 'ResultFile':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+# ----- Fini -----
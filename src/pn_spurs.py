@@ -0,0 +1,221 @@
+"""
+=====[ tinySA Ultra / Phase Noise Spur Detection ]=============================
+
+Finds discrete spurs in a phase noise band: narrow peaks that stand well
+above the local noise floor. Left in, a spur pulls the smoothed curve up
+over the width of the smoothing window, and adds its power to integrated
+noise figures (see 'pn_analysis.py').
+
+A spur is as wide as the RBW filter, so all widths are in RBW noise
+bandwidths, from the band's RBW correction (10 * log10(ENBW)):
+
+    Noise floor     The band is detrended with a straight line on the log
+                    frequency axis, then a rolling median over SPUR_WINDOW
+                    bandwidths, which a spur does not move.
+    Threshold       SPUR_THRESHOLD dB above the floor, or SPUR_SPREAD robust
+                    standard deviations (rolling median absolute deviation)
+                    of the noise if that is more, so single sweep noise
+                    peaks are not taken for spurs.
+    Spur            A run of points above the threshold no wider than
+                    SPUR_MAX_WIDTH bandwidths, wider ones are noise shape.
+    Mask            The spur points plus SPUR_GUARD bandwidths each side for
+                    the filter skirts.
+
+Everything is numpy on the whole band (sliding_window_view for the rolling
+medians, run boundaries from np.diff), a 450 point band takes about a
+millisecond, so it runs inline as every band is processed.
+
+A band is one sweep: linearly spaced points with one RBW. Merged traces are
+split back into their bands with find_spurs_in_trace().
+
+Usage:
+    spurs, mask = find_spurs(freq, amp, rbw_correction=26.6)
+    for spur in spurs:
+        print(spur['offset'], spur['dbc'], spur['width'])
+    amp_clean = remove_spurs(amp, mask)      # NaN at the spurs, before resampling / integration
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+VERSION = str(0.1)
+
+SPUR_THRESHOLD = 10.0   # dB above the noise floor, at least
+SPUR_SPREAD = 3.0       # Robust standard deviations of the noise above the floor, at least
+SPUR_WINDOW = 8.0       # RBW bandwidths, rolling median noise floor
+SPUR_MAX_WIDTH = 4.0    # RBW bandwidths, a wider peak is not a spur
+SPUR_GUARD = 0.5        # RBW bandwidths masked on each side of a spur
+
+_MIN_WINDOW = 15        # Points, shortest median window
+
+# Spur table, one row per spur:
+#   offset  Hz, at the peak
+#   dbc     Spur power in dBc, the dBc/Hz peak with the band's RBW correction added back
+#   width   Hz, of the points above the threshold
+#   height  dB above the noise floor
+SPUR_DTYPE = np.dtype([('offset', '<f8'), ('dbc', '<f8'), ('width', '<f8'), ('height', '<f8')])
+
+
+def _rolling_windows(x: np.ndarray, window: int) -> np.ndarray:
+    """(len(x), window) view of the windows centered on each point, the ends reflected."""
+    window = max(1, min(window, len(x)) // 2 * 2 - 1)       # Odd and shorter than the trace
+    return sliding_window_view(np.pad(x, window // 2, mode='reflect'), window)
+
+
+def noise_floor(freq: np.ndarray, amp: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """Noise floor of a dB band and the robust standard deviation of the noise about it.
+
+    Args:
+        freq (np.ndarray): Offsets Hz.
+        amp (np.ndarray): dB.
+        window (int): Rolling median window, points.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (Floor dB, noise standard deviation dB), per point.
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    amp = np.asarray(amp, dtype=np.float64)
+    valid = ~np.isnan(amp) & (freq > 0)
+    trend = np.zeros(len(amp))
+    if valid.sum() >= 2:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_f = np.log10(freq)
+        slope, intercept = np.polyfit(log_f[valid], amp[valid], 1)
+        trend = np.where(freq > 0, slope * log_f + intercept, 0.0)
+
+    # The floor changes slowly over a window, so long windows are only
+    # evaluated every 'step' points and interpolated in between
+    residual = amp - trend
+    windows = _rolling_windows(residual, window)
+    step = max(1, windows.shape[1] // 16)
+    centers = np.unique(np.append(np.arange(0, len(amp), step), len(amp) - 1))
+    windows = windows[centers]
+    median_of = np.nanmedian if np.isnan(residual).any() else np.median
+    with np.errstate(all='ignore'):
+        median = median_of(windows, axis=-1)
+        spread = 1.4826 * median_of(np.abs(windows - median[:, None]), axis=-1)
+    if step > 1:
+        points = np.arange(len(amp))
+        median = np.interp(points, centers, median)
+        spread = np.interp(points, centers, spread)
+    return (trend + median, spread)
+
+
+def find_spurs(freq: np.ndarray, amp: np.ndarray, rbw_correction: float = 0.0, threshold: float = SPUR_THRESHOLD,
+               spread: float = SPUR_SPREAD, window: float = SPUR_WINDOW, max_width: float = SPUR_MAX_WIDTH,
+               guard: float = SPUR_GUARD) -> tuple[np.ndarray, np.ndarray]:
+    """Finds the spurs in one band.
+
+    Args:
+        freq (np.ndarray): Offsets Hz, linearly spaced.
+        amp (np.ndarray): dBc/Hz.
+        rbw_correction (float, optional): The band's RBW correction dB. Sets the bandwidth the
+                                          widths are in and gives the spur power in dBc.
+                                          0 = widths are in points.
+        threshold (float, optional): dB above the noise floor, at least.
+        spread (float, optional): Noise standard deviations above the noise floor, at least.
+        window (float, optional): Noise floor median window, bandwidths.
+        max_width (float, optional): Widest spur, bandwidths.
+        guard (float, optional): Masked on each side of a spur, bandwidths.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (Spur table of SPUR_DTYPE, boolean mask of the spur points)
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    amp = np.asarray(amp, dtype=np.float64)
+    n = len(amp)
+    if n < 3:
+        return (np.empty(0, SPUR_DTYPE), np.zeros(n, dtype=bool))
+
+    spacing = abs(freq[-1] - freq[0]) / (n - 1) or 1.0
+    bandwidth = 10.0 ** (rbw_correction / 10.0) / spacing if rbw_correction > 0 else 1.0   # Points
+
+    floor, noise = noise_floor(freq, amp, max(_MIN_WINDOW, int(window * bandwidth)))
+    height = amp - floor
+    with np.errstate(invalid='ignore'):
+        above = height > np.maximum(threshold, spread * noise)
+
+    # Runs of points above the threshold, [start, end)
+    edges = np.diff(np.concatenate(([0], above.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    narrow = (ends - starts) <= max(1.0, max_width * bandwidth)
+    starts, ends = starts[narrow], ends[narrow]
+    if len(starts) == 0:
+        return (np.empty(0, SPUR_DTYPE), np.zeros(n, dtype=bool))
+
+    # Peak of each run: its points sorted by run, then by amplitude, highest first
+    index = np.flatnonzero(above)
+    run = np.searchsorted(starts, index, side='right') - 1
+    index, run = index[run >= 0], run[run >= 0]
+    in_run = index < ends[run]
+    index, run = index[in_run], run[in_run]
+    order = np.lexsort((-amp[index], run))
+    first = np.concatenate(([True], run[order][1:] != run[order][:-1]))
+    peak = index[order][first]
+
+    spurs = np.empty(len(peak), SPUR_DTYPE)
+    spurs['offset'] = freq[peak]
+    spurs['dbc'] = amp[peak] + rbw_correction
+    spurs['width'] = (ends - starts) * spacing
+    spurs['height'] = height[peak]
+
+    # Mask from +1 / -1 steps at the guarded run boundaries
+    guard_points = max(1, int(round(guard * bandwidth)))
+    steps = np.zeros(n + 1, dtype=np.int32)
+    np.add.at(steps, np.clip(starts - guard_points, 0, n), 1)
+    np.add.at(steps, np.clip(ends + guard_points, 0, n), -1)
+    mask = np.cumsum(steps[:-1]) > 0
+    return (spurs, mask)
+
+
+def find_spurs_in_trace(freq: np.ndarray, amp: np.ndarray, offsets: list[tuple[float, float, float]],
+                        **options) -> tuple[np.ndarray, np.ndarray]:
+    """find_spurs() on every band of a merged trace.
+
+    Args:
+        freq (np.ndarray): Offsets Hz of the merged trace.
+        amp (np.ndarray): dBc/Hz.
+        offsets (list): The bands, [(start Hz, stop Hz, RBW correction dB), ...],
+                        e.g. 'phase_noise.FREQUENCY_OFFSET_LIST'.
+        options: find_spurs() keyword arguments.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (Spur table of all bands, mask for the whole trace)
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    mask = np.zeros(len(freq), dtype=bool)
+    tables = []
+    taken = np.zeros(len(freq), dtype=bool)
+    for start, stop, rbw_correction in offsets:
+        band = np.flatnonzero((freq >= start) & (freq <= stop) & ~taken)
+        taken[band] = True
+        spurs, band_mask = find_spurs(freq[band], np.asarray(amp)[band], rbw_correction, **options)
+        tables.append(spurs)
+        mask[band] = band_mask
+    return (np.concatenate(tables) if tables else np.empty(0, SPUR_DTYPE), mask)
+
+
+def remove_spurs(amp: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """A copy of the trace with NaN at the spur points.
+
+    'log_grid.resample_log' drops NaN points and 'pn_analysis' interpolates over
+    them, but savitzky_golay() spreads a NaN over its whole window, so resample
+    the trace before smoothing it (as the app plot does).
+    """
+    amp = np.array(amp, dtype=np.float64)
+    amp[mask] = np.nan
+    return amp
+
+
+def format_spurs(spurs: np.ndarray) -> str:
+    """Spur table as text, one line per spur."""
+    if len(spurs) == 0:
+        return 'No spurs found.'
+    lines = [f'{len(spurs)} spurs:   Offset Hz        dBc    Width Hz   Above floor dB']
+    lines += [f'          {s["offset"]:12.1f}  {s["dbc"]:9.1f}  {s["width"]:10.1f}  {s["height"]:9.1f}' for s in spurs]
+    return '\n'.join(lines)
+
+# ----- Fini -----
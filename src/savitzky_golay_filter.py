@@ -1,3 +1,21 @@
+"""
+=====[ Savitzky-Golay Filter ]=================================================
+
+Savitzky-Golay smoothing, with cached coefficients and FFT convolution for
+large windows, for single traces or a 2-D array of traces.
+"""
+from functools import lru_cache
+from math import factorial
+
+import numpy as np
+
+# Windows this size and larger are convolved with an FFT
+FFT_WINDOW_THRESHOLD = 64
+
+# Number of (window_size, order, deriv, rate) coefficient sets kept
+COEFFICIENT_CACHE_SIZE = 32
+
+
 def savitzky_golay(y, window_size, order, deriv=0, rate=1):
     """Smooth (and optionally differentiate) data with a Savitzky-Golay filter.
     The Savitzky-Golay filter removes high frequency noise from data.
@@ -19,6 +37,7 @@ def savitzky_golay(y, window_size, order, deriv=0, rate=1):
     -------
     ys : ndarray, shape (N)
         the smoothed signal (or it's n-th derivative).
+        A 2-D `y` is smoothed row by row, see `savitzky_golay_batch`.
     Notes
     -----
     The Savitzky-Golay is a type of low-pass filter, particularly
@@ -52,10 +71,48 @@ def savitzky_golay(y, window_size, order, deriv=0, rate=1):
 
     See also:
     https://en.wikipedia.org/wiki/Savitzky%E2%80%93Golay_filter
+
+    Implementation Notes
+    --------------------
+    The filter coefficients are cached by (window_size, order, deriv, rate),
+    and windows of FFT_WINDOW_THRESHOLD points or more are convolved with
+    an FFT instead of the O(N * window_size) direct convolution.
     """
-    import numpy as np
-    from math import factorial
+    window_size, order = _check_args(window_size, order)
+    m = _coefficients(window_size, order, deriv, rate)
+    half_window = (window_size - 1) // 2
+    y = np.asarray(y, dtype=np.float64)
+    # pad the signal at the extremes with
+    # values taken from the signal itself
+    first = y[..., :1]
+    last = y[..., -1:]
+    firstvals = first - np.abs(y[..., 1:half_window+1][..., ::-1] - first)
+    lastvals = last + np.abs(y[..., -half_window-1:-1][..., ::-1] - last)
+    y = np.concatenate((firstvals, y, lastvals), axis=-1)
+    return _convolve_valid(y, m[::-1])
+
 
+def savitzky_golay_batch(y, window_size, order, deriv=0, rate=1):
+    """Smooths many traces in one call with the same Savitzky-Golay filter.
+
+    Parameters
+    ----------
+    y : array_like, shape (M, N)
+        M traces of N points each.
+    window_size, order, deriv, rate :
+        as for `savitzky_golay`.
+    Returns
+    -------
+    ys : ndarray, shape (M, N)
+        the smoothed traces.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if y.ndim != 2:
+        raise ValueError("y must be a 2-D array of traces")
+    return savitzky_golay(y, window_size, order, deriv, rate)
+
+
+def _check_args(window_size, order):
     try:
         window_size = np.abs(int(window_size))
         order = np.abs(int(order))
@@ -65,16 +122,30 @@ def savitzky_golay(y, window_size, order, deriv=0, rate=1):
         raise TypeError("window_size size must be a positive odd number")
     if window_size < order + 2:
         raise TypeError("window_size is too small for the polynomials order")
-    order_range = range(order+1)
-    half_window = (window_size -1) // 2
-    # precompute coefficients
-    b = np.mat([[k**i for i in order_range] for k in range(-half_window, half_window+1)])
-    m = np.linalg.pinv(b).A[deriv] * rate**deriv * factorial(deriv)
-    # pad the signal at the extremes with
-    # values taken from the signal itself
-    firstvals = y[0] - np.abs( y[1:half_window+1][::-1] - y[0] )
-    lastvals = y[-1] + np.abs(y[-half_window-1:-1][::-1] - y[-1])
-    y = np.concatenate((firstvals, y, lastvals))
-    return np.convolve( m[::-1], y, mode='valid')
+    return (int(window_size), int(order))
+
+
+@lru_cache(maxsize=COEFFICIENT_CACHE_SIZE)
+def _coefficients(window_size, order, deriv, rate):
+    """Filter coefficients, row 'deriv' of the pseudo inverse of the Vandermonde matrix."""
+    half_window = (window_size - 1) // 2
+    b = np.vander(np.arange(-half_window, half_window+1, dtype=np.float64), order+1, increasing=True)
+    m = np.linalg.pinv(b)[deriv] * rate**deriv * factorial(deriv)
+    m.flags.writeable = False   # shared through the cache
+    return m
+
+
+def _convolve_valid(y, kernel):
+    """'valid' mode convolution of the last axis of 'y' with 'kernel'."""
+    n = y.shape[-1]
+    k = len(kernel)
+    if k < FFT_WINDOW_THRESHOLD:
+        if y.ndim == 1:
+            return np.convolve(kernel, y, mode='valid')
+        return np.array([np.convolve(kernel, row, mode='valid') for row in y])
+
+    nfft = 1 << (n + k - 2).bit_length()
+    full = np.fft.irfft(np.fft.rfft(y, nfft) * np.fft.rfft(kernel, nfft), nfft)
+    return full[..., k-1:n]
 
 # -----[ Fini ]-----
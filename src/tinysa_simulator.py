@@ -0,0 +1,382 @@
+"""
+=====[ tinySA Ultra Simulator ]================================================
+
+Hardware free stand-in for a tinySA Ultra, for benchmarking and regression
+testing the driver, the phase noise measurement loop and the post processing
+on machines without the instrument.
+
+The simulator answers the same shell commands the driver uses,
+    data, frequencies, marker, sweep, wait, calc, rbw, pause, resume,
+    k, vbat, info, version, scanraw, trigger, lna
+with the command echo and 'ch> ' prompt of the real FW. The spectrum is a
+synthetic carrier with a configurable phase noise profile, spurs and a noise
+floor, seen through the tinySA RBW filters. Sweep times and the serial byte
+rate are modelled so benchmarks see realistic timing, 'time_scale' shrinks
+them (0 = as fast as possible).
+
+Usage:
+    import tinysa_ultra as tsa
+    import tinysa_simulator as sim
+
+    sa = tsa.tinySA(transport=sim.SimulatedSerial())
+
+    # Or behind a pseudo terminal (POSIX only), through pyserial
+    sa = tsa.tinySA(dev=sim.serve_pty())
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import os
+import math
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+VERSION = str(0.1)
+
+# Auto RBW steps in Hz and the measured equivalent noise bandwidth of the
+# tinySA RBW filters (see the correction factors in 'phase_noise.py').
+RBW_STEPS = [200, 1e3, 3e3, 10e3, 30e3, 100e3, 300e3, 600e3, 850e3]
+RBW_ENBW_DB = {200: 26.6, 1e3: 30.6, 3e3: 35.3}
+
+SCANRAW_OFFSET = 174.0
+
+# Default carrier phase noise profile, [(offset Hz, dBc/Hz), ...]
+DEFAULT_PN_PROFILE = [(1e3, -95.0), (10e3, -110.0), (100e3, -125.0), (1e6, -140.0)]
+
+
+# * ===== Simulated Instrument =================================================
+class SimulatedTinySA:
+    """Model of the tinySA Ultra signal path and shell.
+
+    Args:
+        carrier_frequency (float): Carrier frequency in Hz.
+        carrier_amplitude (float): Carrier level in dBm.
+        pn_profile (list): Phase noise profile [(offset Hz, dBc/Hz), ...], log-log interpolated.
+        spurs (list): Discrete spurs [(offset Hz, dBc), ...], on both sides of the carrier.
+        noise_floor (float): Analyzer noise floor in dBm/Hz.
+        points (int): Sweep points.
+        sweep_time_per_hz (float): Time per point is this / RBW, in seconds.
+        seed (int): Random seed for the noise.
+    """
+    def __init__(self, carrier_frequency: float = 10e6, carrier_amplitude: float = -10.0,
+                 pn_profile: list[tuple[float, float]] | None = None,
+                 spurs: list[tuple[float, float]] | None = None,
+                 noise_floor: float = -160.0, points: int = 450,
+                 sweep_time_per_hz: float = 3.0, seed: int = 1):
+        self.carrier_frequency = carrier_frequency
+        self.carrier_amplitude = carrier_amplitude
+        self.pn_profile = pn_profile or DEFAULT_PN_PROFILE
+        self.spurs = spurs or []
+        self.noise_floor = noise_floor
+        self.points = points
+        self.sweep_time_per_hz = sweep_time_per_hz
+        self.rng = np.random.default_rng(seed)
+
+        self.start = carrier_frequency - 1e3
+        self.stop = carrier_frequency + 1e3
+        self.rbw = 0.0          # 0 = auto
+        self.calc = 'off'
+        self.paused = False
+        self.measured = np.full(points, -174.0)
+        self.history: deque = deque(maxlen=1)
+        self.display = self.measured.copy()
+
+    # *----- Signal model -----
+    def actual_rbw(self) -> float:
+        """RBW in Hz, in auto mode the largest step below span / 150."""
+        if self.rbw:
+            return self.rbw
+        span = self.stop - self.start
+        rbw = RBW_STEPS[0]
+        for step in RBW_STEPS:
+            if step <= span / 150:
+                rbw = step
+        return rbw
+
+    def sweep_time(self, points: int | None = None) -> float:
+        """Time in seconds for one sweep at the current RBW."""
+        return (points or self.points) * self.sweep_time_per_hz / self.actual_rbw()
+
+    def frequencies(self, start: float | None = None, stop: float | None = None,
+                    points: int | None = None) -> np.ndarray:
+        start = self.start if start is None else start
+        stop = self.stop if stop is None else stop
+        return np.round(np.linspace(start, stop, points or self.points))
+
+    def spectrum(self, freqs: np.ndarray) -> np.ndarray:
+        """One noisy sweep over 'freqs', in dBm."""
+        rbw = self.actual_rbw()
+        enbw = 10 ** (RBW_ENBW_DB.get(rbw, 10 * math.log10(rbw * 1.1)) / 10)
+        sigma = rbw / 2.355     # Gaussian RBW filter with -3 dB width = RBW
+        carrier_mw = 10 ** (self.carrier_amplitude / 10)
+
+        offset = np.abs(freqs - self.carrier_frequency)
+        prof_f = np.log10([p[0] for p in self.pn_profile])
+        prof_l = [p[1] for p in self.pn_profile]
+        pn_dbc = np.interp(np.log10(np.maximum(offset, 1.0)), prof_f, prof_l)
+
+        noise_mw = carrier_mw * 10 ** (pn_dbc / 10) * enbw + 10 ** (self.noise_floor / 10) * enbw
+        # Noise power in a RBW is exponentially distributed from sweep to sweep
+        noise_mw = noise_mw * self.rng.exponential(1.0, len(freqs))
+
+        tone_mw = carrier_mw * np.exp(-0.5 * (offset / sigma) ** 2)
+        for spur_offset, spur_dbc in self.spurs:
+            spur_mw = carrier_mw * 10 ** (spur_dbc / 10)
+            tone_mw += spur_mw * np.exp(-0.5 * ((offset - spur_offset) / sigma) ** 2)
+
+        return 10 * np.log10(noise_mw + tone_mw)
+
+    def do_sweep(self) -> None:
+        """Measures one sweep and updates the display trace with the 'calc' math."""
+        self.measured = self.spectrum(self.frequencies())
+        if len(self.history) and len(self.history[-1]) != len(self.measured):
+            self.history.clear()
+        self.history.append(self.measured)
+        self.display = np.mean(np.array(self.history), axis=0)
+
+    # *----- Shell -----
+    def execute(self, line: str) -> tuple[bytes, float]:
+        """Executes one shell command.
+
+        Returns:
+            tuple[bytes, float]: (Response text without echo or prompt, execution time in seconds)
+        """
+        args = line.split()
+        if not args:
+            return (b'', 0.0)
+        cmd = args[0]
+        handler = getattr(self, '_cmd_' + cmd, None)
+        if handler is None:
+            return (f'{cmd}?\r\n'.encode(), 0.0)
+        return handler(args[1:])
+
+    def _cmd_data(self, args) -> tuple[bytes, float]:
+        array = int(args[0]) if args else 0
+        trace = self.display if array == 2 else self.measured
+        return (''.join(f'{v:.6e}\r\n' for v in trace).encode(), 0.0)
+
+    def _cmd_frequencies(self, args) -> tuple[bytes, float]:
+        return (''.join(f'{int(f)}\r\n' for f in self.frequencies()).encode(), 0.0)
+
+    def _cmd_marker(self, args) -> tuple[bytes, float]:
+        mk_num = int(args[0]) if args else 1
+        i = int(np.argmax(self.display))
+        f = self.frequencies()[i]
+        return (f'{mk_num} {i} {int(f)} {self.display[i]:.3e}\r\n'.encode(), 0.0)
+
+    def _cmd_sweep(self, args) -> tuple[bytes, float]:
+        if not args:
+            return (f'{int(self.start)} {int(self.stop)} {self.points}\r\n'.encode(), 0.0)
+        if len(args) >= 2:
+            value = float(args[1])
+            if args[0] == 'start':
+                self.start = value
+            elif args[0] == 'stop':
+                self.stop = value
+            elif args[0] == 'center':
+                span = self.stop - self.start
+                self.start, self.stop = value - span / 2, value + span / 2
+            elif args[0] == 'span':
+                center = (self.start + self.stop) / 2
+                self.start, self.stop = center - value / 2, center + value / 2
+        return (b'', 0.0)
+
+    def _cmd_wait(self, args) -> tuple[bytes, float]:
+        self.paused = True
+        self.do_sweep()
+        return (b'', self.sweep_time())
+
+    def _cmd_calc(self, args) -> tuple[bytes, float]:
+        self.calc = args[0] if args else 'off'
+        depth = {'aver4': 4, 'aver16': 16}.get(self.calc, 1)
+        self.history = deque(maxlen=depth)
+        return (b'', 0.0)
+
+    def _cmd_rbw(self, args) -> tuple[bytes, float]:
+        if args and args[0] != 'auto':
+            self.rbw = float(args[0]) * 1e3
+        else:
+            self.rbw = 0.0
+        return (b'', 0.0)
+
+    def _cmd_pause(self, args) -> tuple[bytes, float]:
+        self.paused = True
+        return (b'', 0.0)
+
+    def _cmd_resume(self, args) -> tuple[bytes, float]:
+        self.paused = False
+        return (b'', 0.0)
+
+    def _cmd_trigger(self, args) -> tuple[bytes, float]:
+        return (b'', 0.0)
+
+    def _cmd_lna(self, args) -> tuple[bytes, float]:
+        return (b'', 0.0)
+
+    def _cmd_k(self, args) -> tuple[bytes, float]:
+        return (b'35.25\r\n', 0.0)
+
+    def _cmd_vbat(self, args) -> tuple[bytes, float]:
+        return (b'4123 mV\r\n', 0.0)
+
+    def _cmd_info(self, args) -> tuple[bytes, float]:
+        return (b'tinySA ULTRA Simulator\r\nVersion: ' + VERSION.encode() + b'\r\n', 0.0)
+
+    def _cmd_version(self, args) -> tuple[bytes, float]:
+        return (b'tinySA4_v1.4-156-g4eb315d\r\nHW Version:V0.4.5.1.1 (simulated)\r\n', 0.0)
+
+    def _cmd_scanraw(self, args) -> tuple[bytes, float]:
+        # Like the FW, the scan range (and so the auto RBW) becomes the sweep range
+        self.start, self.stop = float(args[0]), float(args[1])
+        points = int(args[2]) if len(args) > 2 else self.points
+        amp = self.spectrum(self.frequencies(self.start, self.stop, points))
+        raw = np.zeros(points, dtype=[("marker", "u1"), ("value", "<u2")])
+        raw["marker"] = ord("x")
+        raw["value"] = np.clip(np.round((amp + SCANRAW_OFFSET) * 32.0), 0, 65535)
+        return (b'{' + raw.tobytes() + b'}', self.sweep_time(points))
+
+
+# * ===== Serial Transport =====================================================
+class SimulatedSerial:
+    """Serial port look-alike that connects the driver to a SimulatedTinySA.
+
+    Implements the parts of 'serial.Serial' the driver uses: write(), read(),
+    readline(), in_waiting, timeout and close(). Responses become readable
+    in USB packets, paced by the command latency, the sweep time and the byte rate.
+
+    Args:
+        device (SimulatedTinySA, optional): Instrument model, a default one is made if None.
+        time_scale (float): Multiplier on all simulated delays, 0 = no delays.
+        byte_rate (float): Serial transfer rate in bytes / second.
+        latency (float): Turn around time of a write in seconds, paid once by the
+                         first command of a write, the others of a burst follow on.
+    """
+    PACKET_SIZE = 64
+
+    def __init__(self, device: SimulatedTinySA | None = None, time_scale: float = 1.0,
+                 byte_rate: float = 100e3, latency: float = 1e-3, timeout: float = 0.1):
+        self.device = device or SimulatedTinySA()
+        self.time_scale = time_scale
+        self.byte_rate = byte_rate
+        self.latency = latency
+        self.timeout = timeout
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self._line = bytearray()
+        self._packets: deque = deque()    # (ready time, bytes)
+        self._ready = bytearray()
+        self._busy_until = 0.0
+
+    def _queue(self, data: bytes, delay: float) -> None:
+        """Queues 'data' to become readable after 'delay' plus its transfer time."""
+        t = max(time.monotonic(), self._busy_until) + delay * self.time_scale
+        per_byte = self.time_scale / self.byte_rate if self.byte_rate else 0.0
+        for i in range(0, len(data), self.PACKET_SIZE):
+            packet = data[i:i + self.PACKET_SIZE]
+            t += len(packet) * per_byte
+            self._packets.append((t, packet))
+        self._busy_until = t
+
+    def _collect(self) -> None:
+        now = time.monotonic()
+        while self._packets and self._packets[0][0] <= now:
+            self._ready += self._packets.popleft()[1]
+
+    def next_ready_time(self) -> float | None:
+        """Time the next queued packet becomes readable, None if nothing is queued."""
+        return self._packets[0][0] if self._packets else None
+
+    @property
+    def in_waiting(self) -> int:
+        self._collect()
+        return len(self._ready)
+
+    def write(self, data: bytes) -> int:
+        self.bytes_written += len(data)
+        self._line += data
+        latency = self.latency
+        while True:
+            i = self._line.find(b'\r')
+            if i < 0:
+                break
+            cmd = self._line[:i].decode(errors='replace')
+            del self._line[:i + 1]
+            self._queue(cmd.encode() + b'\r\n', latency)
+            latency = 0.0
+            response, exec_time = self.device.execute(cmd)
+            self._queue(response + b'ch> ', exec_time)
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = time.monotonic() + (self.timeout if self.timeout is not None else 1e9)
+        while True:
+            self._collect()
+            if len(self._ready) >= size or time.monotonic() >= deadline:
+                break
+            next_time = self.next_ready_time()
+            if next_time is None:
+                time.sleep(max(0.0, min(0.001, deadline - time.monotonic())))
+            else:
+                time.sleep(max(0.0, min(next_time, deadline) - time.monotonic()))
+        data = bytes(self._ready[:size])
+        del self._ready[:size]
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self) -> bytes:
+        line = bytearray()
+        while not line.endswith(b'\n'):
+            c = self.read(1)
+            if not c:
+                break
+            line += c
+        return bytes(line)
+
+    def reset_input_buffer(self) -> None:
+        self._collect()
+        self._ready.clear()
+
+    def close(self) -> None:
+        pass
+
+
+# * ===== Pseudo Terminal ======================================================
+def serve_pty(device: SimulatedTinySA | None = None, **kwargs) -> str:
+    """Serves a simulated tinySA on a pseudo terminal, from a daemon thread (POSIX only).
+
+    Args:
+        device (SimulatedTinySA, optional): Instrument model.
+        **kwargs: Passed on to SimulatedSerial.
+
+    Returns:
+        str: Device name of the pseudo terminal, to be opened with 'serial.Serial' or tinySA(dev=...)
+    """
+    import tty
+    import select
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    port = SimulatedSerial(device, **kwargs)
+
+    def pump() -> None:
+        while True:
+            next_time = port.next_ready_time()
+            wait = 0.1 if next_time is None else max(0.0, next_time - time.monotonic())
+            readable, _, _ = select.select([master], [], [], wait)
+            if readable:
+                try:
+                    data = os.read(master, 4096)
+                except OSError:
+                    return
+                port.write(data)
+            waiting = port.in_waiting
+            if waiting:
+                os.write(master, port.read(waiting))
+
+    threading.Thread(target=pump, daemon=True).start()
+    return os.ttyname(slave)
+
+# ----- Fini -----
@@ -29,105 +29,348 @@ VERSION = str(0.1)
 
 import math
 import time
+import contextlib
 import serial
 from serial.tools import list_ports
 import numpy as np
-import FreeSimpleGUI as ps
+
+import driver_stats
 
 # tinySA Ultra USB Identifiers
 VID = 0x0483  # 1155
 PID = 0x5740  # 22336
 
-SERIAL_PORT_TIMEOUT = 30    # All in Seconds
+SERIAL_PORT_TIMEOUT = 0.1   # All in Seconds, longest single blocking read
 SWEEP_WAIT_TIMEOUT = 30
+COMMAND_TIMEOUT = 2
+FETCH_DATA_TIMEOUT = 10
+
+# Command completion is signalled by the 'ch>' prompt. The fixed delays below
+# are only used in 'legacy pacing' mode, for FW that needs them.
+LEGACY_PACING = False
 INTER_CMD_DELAY = 0.1
 WAIT_DELAY = 0.5
 FREQUENCY_CHANGE_DELAY = 0.5
-FETCH_DATA_TIMEOUT = 10
+
+# The frequency axis is computed from the cached sweep settings, see get_freq_data().
+# FREQUENCY_VALIDATION: 'once' = check it against the tinySA list once per session,
+# 'always' = on every call (slow, for debugging), 'off' = never.
+FREQUENCY_VALIDATION = 'once'
+FREQUENCY_TOLERANCE = 1.0   # Hz
+
+# Command counters and latency histograms, see 'driver_stats.py'. Off by default
+INSTRUMENT = False
+
+# Commands queued in a transaction() are written in bursts of up to
+# TRANSACTION_BURST bytes (one USB full speed packet, which the tinySA
+# shell input buffer always holds), see transaction().
+TRANSACTIONS = True
+TRANSACTION_BURST = 64
+
+# Command prompt, marks the end of every response
+PROMPT = b"ch>"
+
+# 'scanraw' binary transfer: '{' + points * ('x' + uint16 LE) + '}'
+# Each value is (dBm + SCANRAW_OFFSET) * 32, the offset is 174 on the Ultra.
+SCANRAW_OFFSET = 174.0
+SCANRAW_DTYPE = np.dtype([("marker", "u1"), ("value", "<u2")])
+
+
+# Get tinysa device(s) automatically
+def getports() -> list[str]:
+    """Finds every connected tinySA Ultra by its USB VID / PID.
+
+    Returns:
+        list[str]: Serial port names, sorted, may be empty.
+    """
+    return sorted(device.device for device in list_ports.comports()
+                  if device.vid == VID and device.pid == PID)
 
 
-# Get tinysa device automatically
 def getport() -> str:
-    device_list = list_ports.comports()
-    for device in device_list:
-        if device.vid == VID and device.pid == PID:
-            return device.device
-    ps.popup_error('Could not find the tinySA Ultra.\nConnect the tinySA Ultra and try again.')
-    raise OSError("tinySA Ultra device not found.")
+    """Finds the first tinySA Ultra by its USB VID / PID.
+
+    Raises:
+        OSError: When no tinySA Ultra is connected, the caller reports this to the user.
+    """
+    ports = getports()
+    if ports:
+        return ports[0]
+    raise OSError("Could not find the tinySA Ultra.\nConnect the tinySA Ultra and try again.")
 
 
 class tinySA:
     """ TinySA Ultra Driver for Python.
+
+    Args:
+        dev (str, optional): Serial port name. Found with getport() when the port is opened.
+        legacy_pacing (bool, optional): Use the fixed delays between commands.
+        transport (optional): Object used instead of a 'serial.Serial' port, it needs
+                              write(), read(), in_waiting and close(). e.g. a simulator.
+        frequency_validation (str, optional): 'once', 'always' or 'off', see get_freq_data().
+        instrument (bool, optional): Keep command counters in 'stats', see snapshot().
+        trace_file (str, optional): Also append every command to this JSON-lines file, implies 'instrument'.
+        transactions (bool, optional): Batch the commands of a transaction(), False = send them one by one.
     """
-    def __init__(self, dev=None):
-        self.dev = dev or getport()
+    def __init__(self, dev=None, legacy_pacing: bool = LEGACY_PACING, transport=None,
+                 frequency_validation: str = FREQUENCY_VALIDATION,
+                 instrument: bool = INSTRUMENT, trace_file: str | None = None,
+                 transactions: bool = TRANSACTIONS):
+        self.dev = dev
+        self.legacy_pacing = legacy_pacing
+        self.transactions = transactions
+        self.transport = transport
+        self.frequency_validation = frequency_validation
+        self.stats = driver_stats.DriverStats(trace_file, dev) if instrument or trace_file else None
         self.serial = None
+        self._rx_buffer = bytearray()
+        self._pending = None            # [(cmd, timeout), ...] in a transaction, else None
+        self._responses = None
+        self.scanraw_supported = True   # Cleared if the FW rejects 'scanraw'
+        self._reset_sweep_cache()
 
     def __version__(self):
         return VERSION
 
     def open(self) -> None:
         if self.serial is None:
-            self.serial = serial.Serial(self.dev, timeout=SERIAL_PORT_TIMEOUT)
+            if self.transport is not None:
+                self.serial = self.transport
+            else:
+                self.dev = self.dev or getport()
+                self.serial = serial.Serial(self.dev, timeout=SERIAL_PORT_TIMEOUT)
+            self._rx_buffer.clear()
+            self._reset_sweep_cache()
 
     def close(self) -> None:
         if self.serial:
             self.serial.close()
         self.serial = None
+        if self.stats is not None:
+            self.stats.close()
+
+    def snapshot(self) -> dict | None:
+        """Command counters, latencies, bytes, timeouts, retries and NaN points
+        since the driver was made, see 'driver_stats.DriverStats.snapshot'.
+
+        Returns:
+            dict | None: None when the driver is not instrumented.
+        """
+        return self.stats.snapshot() if self.stats is not None else None
+
+    # *===== Sweep Settings Cache =============================================
+    def _reset_sweep_cache(self) -> None:
+        """Forgets the sweep settings, a new session may start with anything set on the tinySA."""
+        self.sweep_start = None
+        self.sweep_stop = None
+        self.sweep_points = None
+        self.frequencies_cached = True     # Cleared for the session if the computed axis is wrong
+        self._frequencies_validated = False
+
+    def _cache_sweep(self, start: float, stop: float, points: int | None = None) -> None:
+        self.sweep_start = float(start)
+        self.sweep_stop = float(stop)
+        if points is not None:
+            self.sweep_points = int(points)
+
+    def _computed_frequencies(self) -> np.ndarray | None:
+        """Frequency axis from the cached sweep settings, None if they are not known."""
+        if not self.frequencies_cached or self.sweep_start is None or not self.sweep_points:
+            return None
+        return np.round(np.linspace(self.sweep_start, self.sweep_stop, self.sweep_points))
 
     # *===== Low Level Commands ===============================================
-    def _send_command(self, cmd) -> None:
-        self.serial.write(cmd.encode())
-        time.sleep(INTER_CMD_DELAY)
-        _ = self.serial.readline()  # discard empty line
-        time.sleep(INTER_CMD_DELAY)
+    def _read_until(self, terminator: bytes, timeout: float) -> bytes:
+        """Reads from the serial port until 'terminator' is seen or 'timeout' expires.
 
-    def _fetch_data(self) -> str:
-        result = ""
-        line = ""
+        Reads are done in bulk (whatever the port has waiting) into a bytearray
+        accumulator and the terminator is searched for over the whole buffer.
+        Any bytes received after the terminator are kept for the next call.
+
+        Args:
+            terminator (bytes): Byte sequence that ends the frame.
+            timeout (float): Maximum time to wait in seconds.
+
+        Returns:
+            bytes: The frame up to (not including) the terminator. On a timeout
+                   whatever was received is returned.
+        """
+        buf = self._rx_buffer
+        search_from = 0
         time_start = time.time()
         while True:
-            c = self.serial.read().decode("utf-8")
-            if c == chr(13):
-                continue  # ignore CR
-            line += c
-            if c == chr(10):
-                result += line
-                line = ""
-                continue
-            if line.endswith("ch>"):
-                # stop on prompt
-                break
-            delta_time = time.time() - time_start
-            if delta_time > FETCH_DATA_TIMEOUT:
-                # print("@@@@@ tinySA DEBUG: Fetch Data Timeout")
+            i = buf.find(terminator, search_from)
+            if i >= 0:
+                frame = bytes(buf[:i])
+                del buf[:i + len(terminator)]
+                if self.stats is not None and terminator == PROMPT:
+                    self.stats.end()
+                return frame
+
+            # The terminator could straddle two reads, so back up a little
+            search_from = max(0, len(buf) - len(terminator) + 1)
+
+            if time.time() - time_start > timeout:
+                if self.stats is not None:
+                    self.stats.timeout()
+                    if terminator == PROMPT:
+                        self.stats.end()
+                frame = bytes(buf)
+                buf.clear()
+                return frame
+
+            data = self.serial.read(self.serial.in_waiting or 1)
+            buf += data
+            if self.stats is not None:
+                self.stats.received(len(data))
+
+    def _read_bytes(self, count: int, timeout: float) -> bytes:
+        """Reads exactly 'count' bytes through the receive buffer, or less on a timeout."""
+        buf = self._rx_buffer
+        time_start = time.time()
+        while len(buf) < count:
+            if time.time() - time_start > timeout:
+                if self.stats is not None:
+                    self.stats.timeout()
                 break
-        time.sleep(INTER_CMD_DELAY)
-        return result
-
-    def _data(self, array=2) -> list[float]:
-        self._send_command("data %d\r" % array)
-        data = self._fetch_data()
-        x = []
-        for line in data.split("\n"):
-            if line:
-                line.strip().split(" ")
+            data = self.serial.read(min(self.serial.in_waiting or 1, count - len(buf)))
+            buf += data
+            if self.stats is not None:
+                self.stats.received(len(data))
+        frame = bytes(buf[:count])
+        del buf[:count]
+        return frame
+
+    def _pace(self, delay: float) -> None:
+        """Fixed delay, only used in legacy pacing mode."""
+        if self.legacy_pacing:
+            time.sleep(delay)
+
+    def _write_command(self, cmd) -> None:
+        """Writes a command and discards its echo, the response is left to be fetched."""
+        if self._pending:
+            self._flush()
+        data = cmd.encode()
+        if self.stats is not None:
+            self.stats.begin(cmd, len(data))
+        self.serial.write(data)
+        self._pace(INTER_CMD_DELAY)
+        _ = self._read_until(b"\n", COMMAND_TIMEOUT)  # discard cmd echo
+        self._pace(INTER_CMD_DELAY)
+
+    def _send_command(self, cmd, timeout: float = COMMAND_TIMEOUT) -> None:
+        """Sends a command that has no response and waits for the 'ch>' prompt,
+        which the tinySA only prints once the command is complete.
+        In a transaction the command is queued instead.
+        """
+        if self._pending is not None:
+            self._pending.append((cmd, timeout))
+            return
+        self._write_command(cmd)
+        _ = self._read_until(PROMPT, timeout)
+
+    # *===== Transactions =====================================================
+    @contextlib.contextmanager
+    def transaction(self):
+        """Batches the commands without a response (settings, 'wait') sent in the block.
+
+        They are queued and written in one burst when the block ends, or before
+        a query in the block, then each echo and response is read up to its own
+        'ch>' prompt. The tinySA runs the commands one after the other as before,
+        but a whole band setup costs one serial round trip instead of one per
+        command. Bursts are split at TRANSACTION_BURST bytes.
+
+        A transaction inside a transaction joins it. With 'legacy_pacing' or
+        'transactions' off the commands are sent one by one as usual. If the
+        block raises, the commands not yet written are dropped.
+
+        Usage:
+            with sa.transaction() as responses:
+                sa.set_rbw(0)
+                sa.calc('off')
+                sa.pause()
+            # responses == ['', '', ''], or the FW error text of a command
+
+        Yields:
+            list[str]: Filled with the response text of each queued command, in order.
+        """
+        if self._pending is not None:
+            yield self._responses
+            return
+        if self.legacy_pacing or not self.transactions:
+            yield []
+            return
+
+        responses = []
+        self._pending, self._responses = [], responses
+        try:
+            yield responses
+            self._flush()
+        finally:
+            self._pending = self._responses = None
+
+    def _flush(self) -> None:
+        """Writes the queued commands in bursts and reads their responses, in order."""
+        pending, self._pending = self._pending, []
+        i = 0
+        while i < len(pending):
+            # As many commands as fit in a burst, at least one
+            size = len(pending[i][0])
+            end = i + 1
+            while end < len(pending) and size + len(pending[end][0]) <= TRANSACTION_BURST:
+                size += len(pending[end][0])
+                end += 1
+            self.serial.write(''.join(cmd for cmd, _ in pending[i:end]).encode())
+
+            # The tinySA echoes each command when it starts it, after the prompt of the one before
+            for cmd, timeout in pending[i:end]:
+                if self.stats is not None:
+                    self.stats.begin(cmd, len(cmd.encode()))
+                _ = self._read_until(b"\n", COMMAND_TIMEOUT)  # discard cmd echo
+                frame = self._read_until(PROMPT, timeout)
+                self._responses.append(frame.decode("utf-8", errors="replace").replace("\r", "").strip())
+            i = end
+
+    def _fetch_data(self) -> str:
+        frame = self._read_until(PROMPT, FETCH_DATA_TIMEOUT)
+        self._pace(INTER_CMD_DELAY)
+        return frame.decode("utf-8", errors="replace").replace("\r", "")
+
+    def _fetch_lines(self) -> list[str]:
+        """Fetches the response up to the prompt and splits it into non-empty lines."""
+        return [line for line in self._fetch_data().split("\n") if line.strip()]
+
+    @staticmethod
+    def _parse_floats(lines: list[str]) -> np.ndarray:
+        """Converts response lines to a float64 array, numpy parses the whole list at once.
+        Only if that fails is it done line by line, with NaN for the bad lines.
+        """
+        try:
+            return np.array(lines, dtype=np.float64)
+        except ValueError:
+            # print("@@@@@ TinySA DEBUG: _parse_floats() read exception!")
+            x = np.full(len(lines), np.nan)
+            for i, line in enumerate(lines):
                 try:
-                    x.append(float(line))
+                    x[i] = float(line)
                 except ValueError:
-                    # print("@@@@@ TinySA DEBUG: _data() read exception!")
-                    x.append(float("nan"))
-        return x
+                    pass
+            return x
 
-    def _fetch_frequencies(self) -> list[float]:
-        self._send_command("frequencies\r")
-        data = self._fetch_data()
-        x = []
-        for line in data.split("\n"):
-            if line:
-                x.append(float(line))
+    def _count_nan(self, x: np.ndarray, cmd: str) -> np.ndarray:
+        """Counts the points of command 'cmd' that could not be read, when instrumented."""
+        if self.stats is not None:
+            self.stats.nan(cmd, np.count_nonzero(np.isnan(x)))
         return x
 
+    def _data(self, array=2) -> np.ndarray:
+        self._write_command("data %d\r" % array)
+        return self._count_nan(self._parse_floats(self._fetch_lines()), "data")
+
+    def _fetch_frequencies(self) -> np.ndarray:
+        self._write_command("frequencies\r")
+        return self._count_nan(self._parse_floats(self._fetch_lines()), "frequencies")
+
     # * ===== My High Level Commands Here Down ====================================
 
     def calc(self, cmd: str) -> None:
@@ -145,11 +388,9 @@ class tinySA:
         Returns:
                 float: temperature in Deg C
         """
-        self._send_command("k\r")
-        data = self._fetch_data()
-        for line in data.split("\n"):
-            if line:
-                return float(line)
+        self._write_command("k\r")
+        for line in self._fetch_lines():
+            return float(line)
         return float('nan')
 
     def get_battery_voltage(self) -> float:
@@ -158,13 +399,11 @@ class tinySA:
         Returns:
                 float: Battery voltage in mV
         """
-        self._send_command("vbat\r")
-        data = self._fetch_data()
-        for line in data.split("\n"):
-            if line:
-                rval = line.replace("m", "")
-                rval = rval.replace("V", "")
-                return float(rval)
+        self._write_command("vbat\r")
+        for line in self._fetch_lines():
+            rval = line.replace("m", "")
+            rval = rval.replace("V", "")
+            return float(rval)
         return float('nan')
 
     def set_rbw(self, rbw: int = 0) -> None:
@@ -212,33 +451,42 @@ class tinySA:
         """Triggers and waits for sweep to finish.
         Puts tinySA Ultra into 'pause' mode as a side effect.
         """
-        self.serial.write('wait\r'.encode())
-        _ = self.serial.readline()  # discard cmd echo
-        time.sleep(INTER_CMD_DELAY)
-
-        time_start = time.time()
-        while True:
-            # Wait until the 'ch>' prompt
-            rval = self.serial.read().decode("utf-8")
-            if '>' in str(rval):
-                break
+        # The 'ch>' prompt comes back when the sweep is done
+        self._send_command('wait\r', SWEEP_WAIT_TIMEOUT)
 
-            delta_time = time.time() - time_start
-            if delta_time > SWEEP_WAIT_TIMEOUT:
-                break
+        # Trace updating takes some extra time too on some FW
+        self._pace(WAIT_DELAY)
 
-        # Trace updating takes some extra time too
-        time.sleep(WAIT_DELAY)
+    def get_freq_data(self) -> np.ndarray:
+        """Gets the current sweep frequency array
 
-    def get_freq_data(self) -> list[float]:
-        """Gets the current sweep frequency array from the tinySA
+        The axis is computed from the cached start / stop frequencies and number
+        of points, which saves transferring and parsing the 'frequencies' list.
+        Once per session ('frequency_validation' = 'once') it is checked against
+        the list from the tinySA. If they differ by more than FREQUENCY_TOLERANCE
+        the cache is dropped and the list is fetched for the rest of the session.
 
         Returns:
-                list[float]: Frequency points in Hz
+                np.ndarray: Frequency points in Hz
         """
-        return self._fetch_frequencies()
-
-    def get_amp_data(self) -> list[float]:
+        if self.frequencies_cached and (self.sweep_start is None or not self.sweep_points):
+            self.get_sweep()
+        freq = self._computed_frequencies()
+        if freq is None:
+            return self._fetch_frequencies()
+
+        if self.frequency_validation == 'always' or (
+                self.frequency_validation == 'once' and not self._frequencies_validated):
+            actual = self._fetch_frequencies()
+            if len(actual) != len(freq) or not np.allclose(actual, freq, rtol=0.0, atol=FREQUENCY_TOLERANCE):
+                # print("@@@@@ tinySA DEBUG: get_freq_data() - Computed frequencies do not match!")
+                self._reset_sweep_cache()
+                self.frequencies_cached = False
+                return actual
+            self._frequencies_validated = True
+        return freq
+
+    def get_amp_data(self) -> np.ndarray:
         """Gets the current amplitude array from the tinySA
 
         Notes:  Data array '0' - Seems like the last measured array without any math.
@@ -247,10 +495,52 @@ class tinySA:
                                 includes trace averaging or other math.
 
         Returns:
-                list[float]: Amplitude points in dBm
+                np.ndarray: Amplitude points in dBm, NaN for any point that could not be read
         """
         return self._data(2)
 
+    def get_raw_scan(self, start: float, stop: float, points: int = 450) -> tuple[np.ndarray, np.ndarray]:
+        """Runs a single sweep and fetches it with the binary 'scanraw' transfer.
+
+        The trace is decoded straight from the received bytes with numpy, which is
+        much less data on the wire and no per point parsing compared to 'data 2'.
+        If the FW does not know 'scanraw' this falls back to a normal sweep
+        and the text transfer, and remembers that for the rest of the session.
+
+        Notes:  'scanraw' returns the measured trace without any trace math,
+                so the tinySA 'calc' averaging is not applied to it.
+
+        Args:
+                start (float): Start Frequency Hz
+                stop (float): Stop Frequency Hz
+                points (int, optional): Number of points. Defaults to 450.
+
+        Returns:
+                tuple[np.ndarray, np.ndarray]: (Frequency points in Hz, Amplitude points in dBm)
+        """
+        if self.scanraw_supported:
+            self._write_command("scanraw %d %d %d\r" % (start, stop, points))
+            frame = self._read_bytes(1, SWEEP_WAIT_TIMEOUT)
+            if frame == b"{":
+                frame = self._read_bytes(points * SCANRAW_DTYPE.itemsize + 1, SWEEP_WAIT_TIMEOUT)
+                _ = self._read_until(PROMPT, FETCH_DATA_TIMEOUT)
+                if len(frame) == points * SCANRAW_DTYPE.itemsize + 1 and frame[-1:] == b"}":
+                    # The FW makes the scan range the sweep range
+                    self._cache_sweep(int(start), int(stop))
+                    raw = np.frombuffer(frame, dtype=SCANRAW_DTYPE, count=points)
+                    amp = raw["value"] / 32.0 - SCANRAW_OFFSET
+                    return (np.linspace(start, stop, points), amp)
+                # print("@@@@@ tinySA DEBUG: get_raw_scan() - Short binary frame!")
+                return (np.linspace(start, stop, points), self._count_nan(np.full(points, np.nan), "scanraw"))
+
+            # Older FW, command not recognised: discard the error message
+            _ = self._read_until(PROMPT, FETCH_DATA_TIMEOUT)
+            self.scanraw_supported = False
+
+        self.set_start_stop(start, stop)
+        self.wait()
+        return (self.get_freq_data(), self.get_amp_data())
+
     def get_marker_value(self, mk_num: int = 1) -> tuple[float, float]:
         """Gets the marker amplitude value specified.
 
@@ -261,24 +551,23 @@ class tinySA:
                 tuple: [MarkerAmpl, MarkerFreq]
         """
         tries = 0
-        while True:
-            self._send_command("marker %d\r" % mk_num)
-            data = self._fetch_data()
-            line = data.split("\n")[0]
-            if line:
-                dl = line.strip().split(" ")
-                if len(dl) >= 4:
-                    d = line.strip().split(" ")
-                    r_tuple = tuple[float, float]
-                    try:
-                        r_tuple = (float(d[3]), float(d[2]))
-                    except ValueError:
-                        tries += 1
-                        if tries > 10:
-                            # print("@@@@@ TinySA DEBUG: get_marker_value() - Too many retries!")
-                            return (float("nan"), float("nan"))
-                        continue
-                    return r_tuple
+        while tries <= 10:
+            self._write_command("marker %d\r" % mk_num)
+            lines = self._fetch_lines()
+            d = lines[0].strip().split(" ") if lines else []
+            if len(d) >= 4:
+                try:
+                    return (float(d[3]), float(d[2]))
+                except ValueError:
+                    pass
+            # Empty, short or unreadable reply
+            tries += 1
+            if self.stats is not None:
+                self.stats.retry('get_marker_value')
+        # print("@@@@@ TinySA DEBUG: get_marker_value() - Too many retries!")
+        if self.stats is not None:
+            self.stats.failure('get_marker_value')
+        return (float("nan"), float("nan"))
 
     def get_marker_peak(self) -> tuple[float, float]:
         """Reads the current amplitude and frequency array then returns a tuple
@@ -291,16 +580,20 @@ class tinySA:
         freq_at_max = 0.0
         tries = 0
         while True:
-            freq = np.array(self.get_freq_data())
-            amp = np.array(self.get_amp_data())
+            freq = self.get_freq_data()
+            amp = self.get_amp_data()
 
             if tries > 10:
                 # print("@@@@@ tinySA DEBUG: get_marker_peak() - Too many retries!")
+                if self.stats is not None:
+                    self.stats.failure('get_marker_peak')
                 return (float("nan"), float("nan"))
             try:
                 i = amp.argmax()
             except ValueError:
                 tries += 1
+                if self.stats is not None:
+                    self.stats.retry('get_marker_peak')
                 continue
 
             max_amp = amp[i]
@@ -308,6 +601,8 @@ class tinySA:
 
             if math.isnan(max_amp) or math.isnan(freq_at_max):
                 tries += 1
+                if self.stats is not None:
+                    self.stats.retry('get_marker_peak')
                 continue
             else:
                 return (max_amp, freq_at_max)
@@ -319,9 +614,11 @@ class tinySA:
                 start (float): Start Frequency Hz
                 stop (float): Stop Frequency Hz
         """
-        self._send_command("sweep start %d\r" % start)
-        self._send_command("sweep stop %d\r" % stop)
-        time.sleep(FREQUENCY_CHANGE_DELAY)
+        with self.transaction():
+            self._send_command("sweep start %d\r" % start)
+            self._send_command("sweep stop %d\r" % stop)
+        self._cache_sweep(int(start), int(stop))
+        self._pace(FREQUENCY_CHANGE_DELAY)
 
     def set_center_span(self, center: float, span: float) -> None:
         """Sets the sweep Center and Span frequencies in Hz
@@ -330,9 +627,11 @@ class tinySA:
                 center (float): Center Frequency in Hz
                 span (float): Span Frequency in Hz
         """
-        self._send_command("sweep center %d\r" % center)
-        self._send_command("sweep span %d\r" % span)
-        time.sleep(FREQUENCY_CHANGE_DELAY)
+        with self.transaction():
+            self._send_command("sweep center %d\r" % center)
+            self._send_command("sweep span %d\r" % span)
+        self._cache_sweep(int(center) - int(span) / 2, int(center) + int(span) / 2)
+        self._pace(FREQUENCY_CHANGE_DELAY)
 
     def get_sweep(self) -> tuple[float, float, int]:
         """Gets current sweep frequencies an number of points.
@@ -340,13 +639,12 @@ class tinySA:
         Returns:
                 tuple[float, float, int]: (Start Frequency Hz, Stop Frequency Hz, Number of Points)
         """
-        self._send_command("sweep\r")
-        time.sleep(INTER_CMD_DELAY)
-        data = self._fetch_data()
-        for line in data.split("\n"):
-            if line:
-                vals = line.split(" ")
-                return (float(vals[0]), float(vals[1]), int(vals[2]))
+        self._write_command("sweep\r")
+        for line in self._fetch_lines():
+            vals = line.split()
+            start, stop, points = (float(vals[0]), float(vals[1]), int(vals[2]))
+            self._cache_sweep(start, stop, points)
+            return (start, stop, points)
         return (0, 0, 0)
 
     def set_lna(self, lna_on=1) -> None:
@@ -380,8 +678,7 @@ class tinySA:
         Returns:
             str: device info string.
         """
-        self._send_command("info\r")
-        time.sleep(INTER_CMD_DELAY)
+        self._write_command("info\r")
         return self._fetch_data()
 
     def get_version(self) -> str:
@@ -390,8 +687,7 @@ class tinySA:
         Returns:
             str: FW ID String
         """
-        self._send_command("version\r")
-        time.sleep(INTER_CMD_DELAY)
+        self._write_command("version\r")
         return self._fetch_data()
 
 # ----- Fini -----
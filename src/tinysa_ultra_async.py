@@ -0,0 +1,480 @@
+"""
+=====[ tinySA Ultra asyncio Serial Driver ]====================================
+
+The same command set as 'tinysa_ultra.tinySA', as coroutines. Nothing ever
+blocks the event loop: the port is opened with a zero timeout and is polled,
+only the bytes already waiting are read and between polls the coroutine
+awaits a short sleep. Polling works the same on Windows, Linux and with the
+simulator, unlike event driven serial I/O.
+
+The poll interval starts at POLL_INTERVAL_MIN and doubles up to
+POLL_INTERVAL_MAX while nothing arrives, so a 20 second sweep 'wait' costs
+almost nothing, while a data transfer is picked up within a millisecond.
+
+One event loop can then drive several tinySA's, a telemetry poller and a
+results writer together, without a thread per device. Every command holds
+the driver lock from its write until its prompt, so tasks sharing one tinySA
+never interleave their commands.
+
+Usage:
+    async def main():
+        sa1 = AsyncTinySA('COM3')
+        sa2 = AsyncTinySA('COM4')
+        jobs = [phase_noise.PhaseNoiseJob(test_name='DUT 1'), phase_noise.PhaseNoiseJob(test_name='DUT 2')]
+        results = await asyncio.gather(phase_noise.measure_phase_noise_async(sa1, jobs[0]),
+                                       phase_noise.measure_phase_noise_async(sa2, jobs[1]))
+
+    asyncio.run(main())
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+VERSION = str(0.1)
+
+
+import math
+import time
+import asyncio
+import contextlib
+import serial
+import numpy as np
+
+import tinysa_ultra as tsa
+import driver_stats
+from tinysa_ultra import (SWEEP_WAIT_TIMEOUT, COMMAND_TIMEOUT, FETCH_DATA_TIMEOUT,
+                          INTER_CMD_DELAY, WAIT_DELAY, FREQUENCY_CHANGE_DELAY, LEGACY_PACING,
+                          FREQUENCY_VALIDATION, FREQUENCY_TOLERANCE, INSTRUMENT,
+                          TRANSACTIONS, TRANSACTION_BURST, PROMPT, SCANRAW_OFFSET, SCANRAW_DTYPE)
+
+# Seconds between polls of the port when nothing has arrived
+POLL_INTERVAL_MIN = 0.001
+POLL_INTERVAL_MAX = 0.02
+
+
+class AsyncTinySA:
+    """ TinySA Ultra asyncio Driver for Python.
+
+    Args:
+        dev (str, optional): Serial port name. Found with getport() when the port is opened.
+        legacy_pacing (bool, optional): Use the fixed delays between commands.
+        transport (optional): Object used instead of a 'serial.Serial' port, it needs
+                              write(), read(), in_waiting and close(). e.g. a simulator.
+                              read() is only called for bytes that are already waiting.
+        frequency_validation (str, optional): 'once', 'always' or 'off', see 'tinySA.get_freq_data'.
+        instrument (bool, optional): Keep command counters in 'stats', see 'tinySA.snapshot'.
+        trace_file (str, optional): Also append every command to this JSON-lines file, implies 'instrument'.
+        transactions (bool, optional): Batch the commands of a transaction(), False = send them one by one.
+    """
+    def __init__(self, dev=None, legacy_pacing: bool = LEGACY_PACING, transport=None,
+                 frequency_validation: str = FREQUENCY_VALIDATION,
+                 instrument: bool = INSTRUMENT, trace_file: str | None = None,
+                 transactions: bool = TRANSACTIONS):
+        self.dev = dev
+        self.legacy_pacing = legacy_pacing
+        self.transactions = transactions
+        self.transport = transport
+        self.frequency_validation = frequency_validation
+        self.stats = driver_stats.DriverStats(trace_file, dev) if instrument or trace_file else None
+        self.serial = None
+        self._rx_buffer = bytearray()
+        self._lock = asyncio.Lock()
+        self._transactions = {}         # Task -> (queued [(cmd, timeout), ...], responses)
+        self.scanraw_supported = True   # Cleared if the FW rejects 'scanraw'
+        self._reset_sweep_cache()
+
+    def __version__(self):
+        return VERSION
+
+    def open(self) -> None:
+        if self.serial is None:
+            if self.transport is not None:
+                self.serial = self.transport
+            else:
+                self.dev = self.dev or tsa.getport()
+                self.serial = serial.Serial(self.dev, timeout=0)
+            self._rx_buffer.clear()
+            self._reset_sweep_cache()
+
+    def close(self) -> None:
+        if self.serial:
+            self.serial.close()
+        self.serial = None
+        if self.stats is not None:
+            self.stats.close()
+
+    # Sweep settings cache and instrumentation, the same as the blocking driver
+    snapshot = tsa.tinySA.snapshot
+    _count_nan = tsa.tinySA._count_nan
+    _reset_sweep_cache = tsa.tinySA._reset_sweep_cache
+    _cache_sweep = tsa.tinySA._cache_sweep
+    _computed_frequencies = tsa.tinySA._computed_frequencies
+
+    # *===== Low Level Commands ===============================================
+    async def _receive(self, timeout: float) -> bool:
+        """Appends whatever the port has waiting to the receive buffer,
+        waiting up to 'timeout' for at least one byte.
+
+        Returns:
+            bool: False if nothing arrived before the timeout.
+        """
+        poll = POLL_INTERVAL_MIN
+        time_start = time.time()
+        while True:
+            waiting = self.serial.in_waiting
+            if waiting:
+                data = self.serial.read(waiting)
+                self._rx_buffer += data
+                if self.stats is not None:
+                    self.stats.received(len(data))
+                return True
+            remaining = timeout - (time.time() - time_start)
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(poll, remaining))
+            poll = min(poll * 2, POLL_INTERVAL_MAX)
+
+    async def _read_until(self, terminator: bytes, timeout: float) -> bytes:
+        """Reads until 'terminator' is seen or 'timeout' expires, see 'tinySA._read_until'.
+
+        Returns:
+            bytes: The frame up to (not including) the terminator. On a timeout
+                   whatever was received is returned.
+        """
+        buf = self._rx_buffer
+        search_from = 0
+        deadline = time.time() + timeout
+        while True:
+            i = buf.find(terminator, search_from)
+            if i >= 0:
+                frame = bytes(buf[:i])
+                del buf[:i + len(terminator)]
+                if self.stats is not None and terminator == PROMPT:
+                    self.stats.end()
+                return frame
+
+            search_from = max(0, len(buf) - len(terminator) + 1)
+
+            if not await self._receive(deadline - time.time()):
+                if self.stats is not None:
+                    self.stats.timeout()
+                    if terminator == PROMPT:
+                        self.stats.end()
+                frame = bytes(buf)
+                buf.clear()
+                return frame
+
+    async def _read_bytes(self, count: int, timeout: float) -> bytes:
+        """Reads exactly 'count' bytes through the receive buffer, or less on a timeout."""
+        buf = self._rx_buffer
+        deadline = time.time() + timeout
+        while len(buf) < count:
+            if not await self._receive(deadline - time.time()):
+                if self.stats is not None:
+                    self.stats.timeout()
+                break
+        frame = bytes(buf[:count])
+        del buf[:count]
+        return frame
+
+    async def _pace(self, delay: float) -> None:
+        """Fixed delay, only used in legacy pacing mode."""
+        if self.legacy_pacing:
+            await asyncio.sleep(delay)
+
+    async def _write_command(self, cmd) -> None:
+        """Writes a command and discards its echo, the response is left to be fetched.
+        The caller must hold the driver lock.
+        """
+        transaction = self._transactions.get(asyncio.current_task())
+        if transaction is not None and transaction[0]:
+            await self._flush(transaction)
+        data = cmd.encode()
+        if self.stats is not None:
+            self.stats.begin(cmd, len(data))
+        self.serial.write(data)
+        await self._pace(INTER_CMD_DELAY)
+        _ = await self._read_until(b"\n", COMMAND_TIMEOUT)  # discard cmd echo
+        await self._pace(INTER_CMD_DELAY)
+
+    async def _fetch_data(self) -> str:
+        frame = await self._read_until(PROMPT, FETCH_DATA_TIMEOUT)
+        await self._pace(INTER_CMD_DELAY)
+        return frame.decode("utf-8", errors="replace").replace("\r", "")
+
+    async def _send_command(self, cmd, timeout: float = COMMAND_TIMEOUT) -> None:
+        """Sends a command that has no response and waits for the 'ch>' prompt.
+        In a transaction of the calling task the command is queued instead.
+        """
+        transaction = self._transactions.get(asyncio.current_task())
+        if transaction is not None:
+            transaction[0].append((cmd, timeout))
+            return
+        async with self._lock:
+            await self._write_command(cmd)
+            _ = await self._read_until(PROMPT, timeout)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Batches the commands without a response sent in the block, see 'tinySA.transaction'.
+
+        Only the calling task's commands are queued, other tasks sharing the
+        tinySA go on sending theirs. A burst holds the driver lock until its
+        last prompt, so they are never interleaved with it.
+
+        Usage:
+            async with sa.transaction() as responses:
+                await sa.calc('off')
+                await sa.set_center_span(center, 2000)
+
+        Yields:
+            list[str]: Filled with the response text of each queued command, in order.
+        """
+        task = asyncio.current_task()
+        if task in self._transactions:
+            yield self._transactions[task][1]
+            return
+        if self.legacy_pacing or not self.transactions:
+            yield []
+            return
+
+        transaction = self._transactions[task] = ([], [])
+        try:
+            yield transaction[1]
+            if transaction[0]:
+                async with self._lock:
+                    await self._flush(transaction)
+        finally:
+            del self._transactions[task]
+
+    async def _flush(self, transaction: tuple[list, list]) -> None:
+        """Writes the queued commands in bursts and reads their responses, in order.
+        The caller must hold the driver lock.
+        """
+        pending, responses = transaction
+        commands = pending[:]
+        pending.clear()
+        i = 0
+        while i < len(commands):
+            size = len(commands[i][0])
+            end = i + 1
+            while end < len(commands) and size + len(commands[end][0]) <= TRANSACTION_BURST:
+                size += len(commands[end][0])
+                end += 1
+            self.serial.write(''.join(cmd for cmd, _ in commands[i:end]).encode())
+
+            for cmd, timeout in commands[i:end]:
+                if self.stats is not None:
+                    self.stats.begin(cmd, len(cmd.encode()))
+                _ = await self._read_until(b"\n", COMMAND_TIMEOUT)  # discard cmd echo
+                frame = await self._read_until(PROMPT, timeout)
+                responses.append(frame.decode("utf-8", errors="replace").replace("\r", "").strip())
+            i = end
+
+    async def _query(self, cmd) -> str:
+        """Sends a command and returns its response text, up to the prompt."""
+        async with self._lock:
+            await self._write_command(cmd)
+            return await self._fetch_data()
+
+    async def _query_lines(self, cmd) -> list[str]:
+        """Sends a command and returns the non-empty lines of its response."""
+        return [line for line in (await self._query(cmd)).split("\n") if line.strip()]
+
+    # * ===== High Level Commands ==================================================
+
+    async def calc(self, cmd: str) -> None:
+        """Sets the tinySA Calc mode
+
+        Args:
+            cmd (str): Valid commands: |off|minh|maxh|maxd|aver4|aver16|quasip|
+        """
+        await self._send_command('calc ' + cmd + '\r')
+
+    async def get_temperature(self) -> float:
+        """Get Device Temperature in Deg C"""
+        for line in await self._query_lines("k\r"):
+            return float(line)
+        return float('nan')
+
+    async def get_battery_voltage(self) -> float:
+        """Get Battery Voltage in mV"""
+        for line in await self._query_lines("vbat\r"):
+            return float(line.replace("m", "").replace("V", ""))
+        return float('nan')
+
+    async def set_rbw(self, rbw: int = 0) -> None:
+        """Sets the tinySA Res BW in Hz, zero selects 'AUTO', see 'tinySA.set_rbw'."""
+        if rbw == 0:
+            await self._send_command("rbw auto\r")
+        elif rbw == 200:
+            await self._send_command("rbw 0.2\r")
+        elif rbw >= 1:
+            await self._send_command("rbw %d\r" % int(rbw / 1000))
+
+    async def resume(self) -> None:
+        """Resumes the tinySA Sweep"""
+        await self._send_command("resume\r")
+
+    async def pause(self) -> None:
+        """Pauses the tinySA sweep"""
+        await self._send_command("pause\r")
+
+    async def trigger(self, mode: str) -> None:
+        """Triggers the tinySA
+
+        Args:
+                mode (str): Modes are: 'auto', 'normal', 'single'
+        """
+        for m in ("auto", "normal", "single"):
+            if m in mode:
+                await self._send_command("trigger %s\r" % m)
+                return
+
+    async def wait(self) -> None:
+        """Triggers and waits for sweep to finish, other tasks run in the meantime.
+        Puts tinySA Ultra into 'pause' mode as a side effect.
+        """
+        await self._send_command('wait\r', SWEEP_WAIT_TIMEOUT)
+        await self._pace(WAIT_DELAY)
+
+    async def get_freq_data(self) -> np.ndarray:
+        """Gets the current sweep frequency array in Hz, computed from the cached
+        sweep settings, see 'tinySA.get_freq_data'.
+        """
+        if self.frequencies_cached and (self.sweep_start is None or not self.sweep_points):
+            await self.get_sweep()
+        freq = self._computed_frequencies()
+        if freq is None:
+            return await self._fetch_frequencies()
+
+        if self.frequency_validation == 'always' or (
+                self.frequency_validation == 'once' and not self._frequencies_validated):
+            actual = await self._fetch_frequencies()
+            if len(actual) != len(freq) or not np.allclose(actual, freq, rtol=0.0, atol=FREQUENCY_TOLERANCE):
+                self._reset_sweep_cache()
+                self.frequencies_cached = False
+                return actual
+            self._frequencies_validated = True
+        return freq
+
+    async def _fetch_frequencies(self) -> np.ndarray:
+        return self._count_nan(tsa.tinySA._parse_floats(await self._query_lines("frequencies\r")), "frequencies")
+
+    async def get_amp_data(self) -> np.ndarray:
+        """Gets the current amplitude array ('data 2') from the tinySA
+
+        Returns:
+                np.ndarray: Amplitude points in dBm, NaN for any point that could not be read
+        """
+        return self._count_nan(tsa.tinySA._parse_floats(await self._query_lines("data 2\r")), "data")
+
+    async def get_raw_scan(self, start: float, stop: float, points: int = 450) -> tuple[np.ndarray, np.ndarray]:
+        """Runs a single sweep and fetches it with the binary 'scanraw' transfer,
+        falls back to a normal sweep on older FW. See 'tinySA.get_raw_scan'.
+
+        Returns:
+                tuple[np.ndarray, np.ndarray]: (Frequency points in Hz, Amplitude points in dBm)
+        """
+        if self.scanraw_supported:
+            async with self._lock:
+                await self._write_command("scanraw %d %d %d\r" % (start, stop, points))
+                frame = await self._read_bytes(1, SWEEP_WAIT_TIMEOUT)
+                if frame == b"{":
+                    frame = await self._read_bytes(points * SCANRAW_DTYPE.itemsize + 1, SWEEP_WAIT_TIMEOUT)
+                    _ = await self._read_until(PROMPT, FETCH_DATA_TIMEOUT)
+                    if len(frame) == points * SCANRAW_DTYPE.itemsize + 1 and frame[-1:] == b"}":
+                        self._cache_sweep(int(start), int(stop))
+                        raw = np.frombuffer(frame, dtype=SCANRAW_DTYPE, count=points)
+                        amp = raw["value"] / 32.0 - SCANRAW_OFFSET
+                        return (np.linspace(start, stop, points), amp)
+                    return (np.linspace(start, stop, points), self._count_nan(np.full(points, np.nan), "scanraw"))
+
+                # Older FW, command not recognised: discard the error message
+                _ = await self._read_until(PROMPT, FETCH_DATA_TIMEOUT)
+                self.scanraw_supported = False
+
+        await self.set_start_stop(start, stop)
+        await self.wait()
+        return (await self.get_freq_data(), await self.get_amp_data())
+
+    async def get_marker_value(self, mk_num: int = 1) -> tuple[float, float]:
+        """Gets the marker amplitude value specified.
+
+        Returns:
+                tuple: [MarkerAmpl, MarkerFreq]
+        """
+        tries = 0
+        while tries <= 10:
+            lines = await self._query_lines("marker %d\r" % mk_num)
+            d = lines[0].strip().split(" ") if lines else []
+            if len(d) >= 4:
+                try:
+                    return (float(d[3]), float(d[2]))
+                except ValueError:
+                    pass
+            tries += 1
+            if self.stats is not None:
+                self.stats.retry('get_marker_value')
+        # print("@@@@@ TinySA DEBUG: get_marker_value() - Too many retries!")
+        if self.stats is not None:
+            self.stats.failure('get_marker_value')
+        return (float("nan"), float("nan"))
+
+    async def get_marker_peak(self) -> tuple[float, float]:
+        """(amplitude dBm, frequency Hz) of the maximum of the current trace."""
+        for _ in range(11):
+            freq = await self.get_freq_data()
+            amp = await self.get_amp_data()
+            if len(amp) and not np.all(np.isnan(amp)):
+                i = np.nanargmax(amp)
+                if i < len(freq) and not math.isnan(freq[i]):
+                    return (amp[i], freq[i])
+            if self.stats is not None:
+                self.stats.retry('get_marker_peak')
+        # print("@@@@@ tinySA DEBUG: get_marker_peak() - Too many retries!")
+        if self.stats is not None:
+            self.stats.failure('get_marker_peak')
+        return (float("nan"), float("nan"))
+
+    async def set_start_stop(self, start: float, stop: float) -> None:
+        """Sets the sweep Start and Stop frequencies in Hz"""
+        async with self.transaction():
+            await self._send_command("sweep start %d\r" % start)
+            await self._send_command("sweep stop %d\r" % stop)
+        self._cache_sweep(int(start), int(stop))
+        await self._pace(FREQUENCY_CHANGE_DELAY)
+
+    async def set_center_span(self, center: float, span: float) -> None:
+        """Sets the sweep Center and Span frequencies in Hz"""
+        async with self.transaction():
+            await self._send_command("sweep center %d\r" % center)
+            await self._send_command("sweep span %d\r" % span)
+        self._cache_sweep(int(center) - int(span) / 2, int(center) + int(span) / 2)
+        await self._pace(FREQUENCY_CHANGE_DELAY)
+
+    async def get_sweep(self) -> tuple[float, float, int]:
+        """Gets current sweep frequencies an number of points.
+
+        Returns:
+                tuple[float, float, int]: (Start Frequency Hz, Stop Frequency Hz, Number of Points)
+        """
+        for line in await self._query_lines("sweep\r"):
+            vals = line.split()
+            start, stop, points = (float(vals[0]), float(vals[1]), int(vals[2]))
+            self._cache_sweep(start, stop, points)
+            return (start, stop, points)
+        return (0, 0, 0)
+
+    async def set_lna(self, lna_on=1) -> None:
+        """Sets the LNA state, 1 = LNA ON, 0 = LNA OFF"""
+        await self._send_command("lna on\r" if lna_on == 1 else "lna off\r")
+
+    async def get_info(self) -> str:
+        """Returns tinySA device information."""
+        return await self._query("info\r")
+
+    async def get_version(self) -> str:
+        """Returns the tinySA version FW information."""
+        return await self._query("version\r")
+
+# ----- Fini -----
@@ -26,33 +26,80 @@ Version:
 0.1 - 30Apr24 - Initial Release
 
 """
-import csv
+from __future__ import annotations
 import time
+import queue
 import threading
-import numpy as np
-import matplotlib.pyplot as plt
+import importlib
+from typing import TYPE_CHECKING
 import FreeSimpleGUI as sg
-import savitzky_golay_filter as sgf
-import phase_noise
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Only the GUI is imported at startup, so the window shows straight away.
+# numpy, matplotlib, pyserial and the measurement code are imported where they
+# are first used. _preload() loads the non-GUI ones in the background while the
+# user sets up the tinySA. matplotlib.pyplot (and 'live_plot', which imports it)
+# picks its GUI backend on import and is not thread safe, so it is only ever
+# imported on the main thread, on the first Run.
+# 'benchmarks/bench_import_time.py --check' guards the startup imports.
+PRELOAD_MODULES = ('numpy', 'phase_noise', 'pn_analysis', 'pn_spurs', 'log_grid', 'savitzky_golay_filter')
 
 
 # * ----- Version Tag ---------------------------------------------------------
 VERSION = str(0.1)
 
+# Smoothing is done on a log frequency grid so it is uniform on the plot axis,
+# the window is in grid points: 21 points at 100 points / decade = 0.2 decade.
+PLOT_POINTS_PER_DECADE = 100
+PLOT_SMOOTH_WINDOW = 21
+
+# Plot offset axis, the raw trace is decimated to one min / max pair per pixel on it
+PLOT_F_START = 1e3
+PLOT_F_STOP = 1e6
+
+# Run archive directory, see 'pn_archive.py', in the directory the app runs in
+ARCHIVE_DIR = 'pn_archive'
+
 
 # * ----- Local Routines ------------------------------------------------------
 def update_status(window, message: str) -> None:
     window['-TEXTSTATUS-'].update(message)
 
 
-def plot(x_data: list[float], y_data: list[float], title: str, centerf: float, width: int, height: int) -> None:
-    # Plot Smooth - window size 601, polynomial order 3
-    y_data_smooth = sgf.savitzky_golay(np.array(y_data), 601, 3)
+def _preload() -> None:
+    """Imports the heavy non-GUI modules on a background thread, so they are ready when first used."""
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass    # Reported where it is used
+
+
+def plot(x_data: np.ndarray, y_data: np.ndarray, title: str, centerf: float, width: int, height: int,
+         spur_mask: np.ndarray | None = None) -> None:
+    import matplotlib.pyplot as plt
+    import savitzky_golay_filter as sgf
+    import log_grid
+    import pn_spurs
+
+    # Raw data as a min / max envelope, one bucket per pixel, so spurs stay visible
+    x_raw, y_raw = log_grid.decimate_log(x_data, y_data, width, PLOT_F_START, PLOT_F_STOP)
+
+    # Spurs are left out of the smoothed trace
+    y_clean = y_data if spur_mask is None else pn_spurs.remove_spurs(y_data, spur_mask)
+
+    # Power average onto a log grid, then smooth - polynomial order 3.
+    # The grid leaves out the NaN spur points, which the filter would spread.
+    x_grid, y_grid = log_grid.resample_log(x_data, y_clean, PLOT_POINTS_PER_DECADE)
+    window = min(PLOT_SMOOTH_WINDOW, (len(y_grid) - 1) // 2 * 2 - 1)
+    y_grid_smooth = sgf.savitzky_golay(y_grid, window, 3) if window >= 5 else y_grid
 
     px = 1/plt.rcParams['figure.dpi']  # pixel in inches
     plt.subplots(figsize=(width*px, height*px))
-    plt.plot(x_data, y_data)
-    plt.plot(x_data, y_data_smooth)
+    plt.plot(x_raw, y_raw)
+    plt.plot(x_grid, y_grid_smooth)
     plt.semilogx()
     plt.grid(which='both')
     plt.xlabel('Frequency Offset [Hz]')
@@ -61,28 +108,49 @@ def plot(x_data: list[float], y_data: list[float], title: str, centerf: float, w
     dt = time.strftime("%Y-%m-%d %H:%M")
     title_str = f'Center Frequency = {centerf} Hz.  {dt}'
     plt.title(title_str)
-    plt.xlim(1e3, 1e6)  # Hardcoded, not ideal
+    plt.xlim(PLOT_F_START, PLOT_F_STOP)  # Hardcoded, not ideal
     plt.show(block=False)
 
     # window.write_event_value('-PLOTCLOSED-', 'plot is finished')
 
 
-def save_to_csv(x_data: list[float], y_data: list[float], title: str) -> None:
+def save_to_csv(x_data: np.ndarray, y_data: np.ndarray, title: str, log_resample: bool = False) -> None:
+    import log_grid
+    import pn_results
+
     print('Writing Results to CSV File.')
-    dt = time.strftime("%Y-%m-%d %H%M")
-    output_file_name = title + ' (' + dt + ').csv'
+    if log_resample:
+        x_data, y_data = log_grid.resample_log(x_data, y_data, PLOT_POINTS_PER_DECADE)
 
     try:
-        with open(output_file_name, 'w', newline='', encoding='utf-8') as csvfile:
-            wr = csv.writer(csvfile)
-            # for i in range(len(phase_noise_freq)):
-            #     wr.writerow([phase_noise_freq[i], phase_noise_amp[i]])
-            for f, a in zip(x_data, y_data):
-                wr.writerow([f, a])
+        pn_results.write_csv(pn_results.result_file_name(title), x_data, y_data)
     except Exception as e:
         sg.popup_error('Could not create or write to CSV file.\nReason,\n' + str(e))
 
 
+def save_result_file(result, title: str) -> None:
+    """Writes the binary result file, trace data plus the run settings."""
+    import pn_results
+
+    print('Writing Result File.')
+    try:
+        pn_results.write_result_file(pn_results.result_file_name(title, pn_results.RESULT_EXTENSION), result)
+    except Exception as e:
+        sg.popup_error('Could not create or write to result file.\nReason,\n' + str(e))
+
+
+def save_to_archive(result) -> None:
+    """Adds the run to the run archive in ARCHIVE_DIR."""
+    import pn_archive
+
+    print(f'Adding Run to Archive: {ARCHIVE_DIR}')
+    try:
+        with pn_archive.RunArchive(ARCHIVE_DIR) as archive:
+            archive.add(result)
+    except Exception as e:
+        sg.popup_error('Could not add the run to the archive.\nReason,\n' + str(e))
+
+
 # * ----- GUI -----------------------------------------------------------------
 
 def app_gui():
@@ -98,10 +166,19 @@ D - Wait several sweeps until the tinySA Ultra autoscales the amplitude."""
     step2_text = """Set the following parameters for the phase noise test,"""
     block_step2 = [[sg.Text(step2_text)],
                    [sg.Text('Test Name:'), sg.Input(default_text='Phase Noise Test', key='-TESTNAME-')],
-                   [sg.Text('Trace Averaging:'), sg.Combo(['off', 'aver4', 'aver16'], default_value='aver16', key='-AVERAGING-')],
+                   [sg.Text('Trace Averaging:'), sg.Combo(['off', 'aver4', 'aver16', 'host4', 'host16', 'adaptive'], default_value='aver16', key='-AVERAGING-'),
+                    sg.Text('Time Budget:'), sg.Input('0', size=(6, 20), key='-BUDGET-'), sg.Text('min (adaptive, 0 = none)')],
                    [sg.Text('Plot Width x Height:'), sg.Input('800', size=(10, 20), key='-PLOTW-'), sg.Input('600', size=(10, 20), key='-PLOTH-'), sg.Text('pixels')],
-                   [sg.Checkbox('Recenter Center Frequency after each sweep?', default=False, key='-RECENTER-')],
-                   [sg.Checkbox('Write result to CSV file?', default=True, key='-WRITECSV-')]
+                   [sg.Checkbox('Recenter Center Frequency after each sweep?', default=False, key='-RECENTER-'),
+                    sg.Checkbox('Pipelined?', default=False, key='-PIPELINED-')],
+                   [sg.Checkbox('Save each band (checkpoint)?', default=False, key='-CHECKPOINT-'),
+                    sg.Checkbox('Resume last run?', default=False, key='-RESUME-')],
+                   [sg.Checkbox('Write result to CSV file?', default=True, key='-WRITECSV-'),
+                    sg.Checkbox('Resample CSV to log grid?', default=False, key='-CSVLOG-'),
+                    sg.Checkbox('Write result file?', default=True, key='-WRITEPNR-'),
+                    sg.Checkbox('Add to run archive?', default=False, key='-ARCHIVE-')],
+                   [sg.Checkbox('Live plot of each band while measuring?', default=True, key='-LIVEPLOT-'),
+                    sg.Checkbox('Remove spurs before smoothing?', default=False, key='-SPURS-')]
                    ]
 
     step3_text = """'Run' the phase noise test.\nPress 'Exit' to close the app."""
@@ -111,17 +188,20 @@ D - Wait several sweeps until the tinySA Ultra autoscales the amplitude."""
 
     layout = [
         [sg.Frame('Step 1', block_step1, size=(600, 115))],
-        [sg.Frame('Step 2', block_step2, size=(600, 215))],
+        [sg.Frame('Step 2', block_step2, size=(600, 240))],
         [sg.Frame('Step 3', block_step3, size=(600, 115))],
         [sg.Text('Status: Idle', relief=sg.RELIEF_GROOVE, border_width=1, size=(65, 1), key='-TEXTSTATUS-')]
         ]
 
     sg.set_options(dpi_awareness=True)
-    window = sg.Window(f'tinySA Ultra - Phase Noise Application - V{VERSION}', layout, size=(600, 520), finalize=True)
+    window = sg.Window(f'tinySA Ultra - Phase Noise Application - V{VERSION}', layout, size=(600, 545), finalize=True)
 
     timeout = None
     thread = None
+    live = None
+    band_queue = queue.Queue()
     update_status(window, "Idle.")
+    threading.Thread(target=_preload, daemon=True).start()
 
     # --------------------- EVENT LOOP ---------------------
     while True:
@@ -135,13 +215,41 @@ D - Wait several sweeps until the tinySA Ultra autoscales the amplitude."""
 
         # Run button
         if event in 'Run' and not thread:
+            # Check the numeric fields before anything is started
+            try:
+                time_budget = float(values['-BUDGET-'] or 0) * 60.0
+                plot_size = (int(values['-PLOTW-']), int(values['-PLOTH-']))
+                if time_budget < 0:
+                    raise ValueError
+            except ValueError:
+                sg.popup_error('Time Budget must be a number of minutes (0 = none),\n'
+                               'Plot Width and Height a number of pixels.')
+                continue
+
             # disable this button
             window['Run'].update(disabled=True)
+            update_status(window, 'Starting...')
+            import phase_noise
+            import live_plot    # pyplot, on the main thread (see PRELOAD_MODULES)
 
             # Set PN App Values
             phase_noise.PN_TEST_NAME = values['-TESTNAME-']
             phase_noise.PN_RECENTER = bool(values['-RECENTER-'])
-            phase_noise.PN_AVERAGE = values['-AVERAGING-']  # Valid values: 'off', 'aver4', 'aver16'
+            phase_noise.PN_PIPELINED = bool(values['-PIPELINED-'])
+            phase_noise.PN_RESUME = bool(values['-RESUME-'])
+            # Resuming needs the checkpoint, and keeps saving to it
+            checkpoint = values['-CHECKPOINT-'] or values['-RESUME-']
+            phase_noise.PN_CHECKPOINT = phase_noise.CHECKPOINT_FILE if checkpoint else ''
+            phase_noise.PN_SPURS = bool(values['-SPURS-'])
+
+            # Live plot, fed band by band through the queue
+            phase_noise.PN_BAND_QUEUE = None
+            if values['-LIVEPLOT-'] is True:
+                band_queue = queue.Queue()
+                phase_noise.PN_BAND_QUEUE = band_queue
+                live = live_plot.LivePlot(values['-TESTNAME-'], *plot_size)
+            phase_noise.PN_AVERAGE = values['-AVERAGING-']  # Valid values: 'off', 'aver4', 'aver16', 'host4', 'host16', 'adaptive'
+            phase_noise.PN_TIME_BUDGET = time_budget
 
             # Start PN App thread
             timeout = 100
@@ -149,6 +257,9 @@ D - Wait several sweeps until the tinySA Ultra autoscales the amplitude."""
             thread.start()
             sg.popup_animated(sg.DEFAULT_BASE64_LOADING_GIF, background_color='white', transparent_color='white', time_between_frames=100)
 
+        if live is not None:
+            live.update_from(band_queue)
+
         if thread is not None:
             sg.popup_animated(sg.DEFAULT_BASE64_LOADING_GIF, background_color='white', transparent_color='white', time_between_frames=100)
 
@@ -156,6 +267,17 @@ D - Wait several sweeps until the tinySA Ultra autoscales the amplitude."""
         if event in '-THREADMESSAGE-':
             update_status(window, str(values['-THREADMESSAGE-']))
 
+        # Thread failed, e.g. no tinySA found
+        if event in '-THREADERROR-':
+            thread.join(timeout=0)
+            sg.popup_animated(None)
+            thread = None
+            timeout = None
+            sg.popup_error(str(values['-THREADERROR-']))
+            live = None     # Left open, it shows the bands measured before the error
+            update_status(window, 'Idle.')
+            window['Run'].update(disabled=False)
+
         # Thread completed
         if event in '-THREADCOMPLETED-':         # Thread has completed
             thread.join(timeout=0)
@@ -163,6 +285,13 @@ D - Wait several sweeps until the tinySA Ultra autoscales the amplitude."""
             sg.popup_animated(None)     # stop animation in case one is running
             thread = None
             timeout = None
+            if live is not None:
+                live.close()
+                live = None
+
+            import phase_noise
+            import pn_analysis
+            import pn_spurs
 
             # Get the data / parameters
             x_data = phase_noise.PN_FREQ_DATA
@@ -174,9 +303,24 @@ D - Wait several sweeps until the tinySA Ultra autoscales the amplitude."""
 
             # Save to csv
             if values['-WRITECSV-'] is True:
-                save_to_csv(x_data, y_data, title)
-
-            plot(x_data, y_data, title, center_f, plot_width, plot_height)
+                save_to_csv(x_data, y_data, title, bool(values['-CSVLOG-']))
+            if values['-WRITEPNR-'] is True:
+                save_result_file(phase_noise.PN_RESULT, title)
+            if values['-ARCHIVE-'] is True:
+                save_to_archive(phase_noise.PN_RESULT)
+
+            spur_mask = None
+            if values['-SPURS-'] is True:
+                print(pn_spurs.format_spurs(phase_noise.PN_SPUR_TABLE))
+                spur_mask = phase_noise.PN_SPUR_MASK
+
+            try:
+                y_clean = y_data if spur_mask is None else pn_spurs.remove_spurs(y_data, spur_mask)
+                print(pn_analysis.analyze(x_data, y_clean, center_f).summary())
+            except ValueError as e:
+                print(f'No integrated figures: {e}')
+
+            plot(x_data, y_data, title, center_f, plot_width, plot_height, spur_mask)
 
             # Enable run button
             window['Run'].update(disabled=False)
@@ -0,0 +1,161 @@
+"""
+=====[ Host Side Trace Averaging ]=============================================
+
+Running per point statistics of spectrum analyzer traces, kept on the host
+instead of relying on the tinySA 'calc aver4/aver16' display averaging.
+
+Every sweep is folded in as it arrives with Welford's update, vectorized over
+the trace points. Averaging is done in the power domain (mW) which is the
+correct way to average noise, min / max hold are kept in dBm.
+
+From the running variance the standard error of the mean power of each point
+is known, so a measurement can stop as soon as the noise floor estimate is
+good enough, instead of always taking a fixed number of sweeps.
+AveragingScheduler uses that to pick the sweep count of each band, optionally
+within a time budget for the whole run.
+
+MIT License
+Copyright (c) 2024 Steven C. Hageman
+"""
+import time
+import numpy as np
+
+VERSION = str(0.1)
+
+# Normal distribution z value for a 95% confidence interval
+Z_95 = 1.96
+
+
+def dbm_to_mw(amp_dbm: np.ndarray) -> np.ndarray:
+    return np.power(10.0, np.asarray(amp_dbm, dtype=np.float64) / 10.0)
+
+
+def mw_to_dbm(amp_mw: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 10.0 * np.log10(amp_mw)
+
+
+class TraceStatistics:
+    """Streaming power domain mean, variance and min / max for each trace point.
+
+    NaN points (failed parses) are skipped, so every point keeps its own count.
+
+    Args:
+        points (int): Number of points in each trace.
+    """
+    def __init__(self, points: int):
+        self.sweeps = 0
+        self.count = np.zeros(points, dtype=np.int64)
+        self.mean = np.zeros(points)     # mW
+        self._m2 = np.zeros(points)      # sum of squared differences from the mean, mW^2
+        self.min_dbm = np.full(points, np.inf)
+        self.max_dbm = np.full(points, -np.inf)
+
+    def update(self, amp_dbm: np.ndarray) -> None:
+        """Folds one sweep (in dBm) into the statistics."""
+        amp_dbm = np.asarray(amp_dbm, dtype=np.float64)
+        valid = ~np.isnan(amp_dbm)
+        x = dbm_to_mw(np.where(valid, amp_dbm, 0.0))
+
+        self.sweeps += 1
+        self.count += valid
+        n = np.maximum(self.count, 1)
+        delta = np.where(valid, x - self.mean, 0.0)
+        self.mean += delta / n
+        self._m2 += delta * np.where(valid, x - self.mean, 0.0)
+
+        np.fmin(self.min_dbm, amp_dbm, out=self.min_dbm)
+        np.fmax(self.max_dbm, amp_dbm, out=self.max_dbm)
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Sample variance of each point in mW^2, NaN with less than 2 sweeps."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.count > 1, self._m2 / (self.count - 1), np.nan)
+
+    @property
+    def mean_dbm(self) -> np.ndarray:
+        """Power averaged trace in dBm."""
+        return np.where(self.count > 0, mw_to_dbm(self.mean), np.nan)
+
+    def uncertainty_db(self, z: float = Z_95) -> np.ndarray:
+        """Half width of the confidence interval of each averaged point, in dB.
+
+        Args:
+            z (float, optional): Normal z value of the interval. Defaults to 95%.
+
+        Returns:
+            np.ndarray: +dB uncertainty of each point of 'mean_dbm', NaN with less than 2 sweeps.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel_se = np.sqrt(self.variance / self.count) / self.mean
+            return 10.0 * np.log10(1.0 + z * rel_se)
+
+    def noise_floor_uncertainty_db(self, z: float = Z_95) -> float:
+        """Median point uncertainty in dB, a robust figure for the whole noise floor.
+        The median ignores the few points on a carrier skirt or a spur.
+        """
+        u = self.uncertainty_db(z)
+        if np.all(np.isnan(u)):
+            return float('inf')
+        return float(np.nanmedian(u))
+
+    def converged(self, target_db: float, min_sweeps: int = 2, z: float = Z_95) -> bool:
+        """True when the noise floor confidence interval is within 'target_db'."""
+        if self.sweeps < min_sweeps:
+            return False
+        return self.noise_floor_uncertainty_db(z) <= target_db
+
+
+class AveragingScheduler:
+    """Decides per band how many sweeps to average.
+
+    A band is swept until its noise floor is known to within 'target_db',
+    or 'max_sweeps' is reached. With a 'time_budget' each band may also use
+    no more than an equal share of the time left for the remaining bands,
+    time not used by a band that converged early goes to the bands after it.
+    The sweep count each band actually used is kept in 'band_sweeps'.
+
+    Args:
+        bands (int): Number of bands in the run.
+        max_sweeps (int): Most sweeps for any band.
+        target_db (float): Noise floor confidence interval to stop at, in dB.
+        time_budget (float, optional): Seconds for all bands, 0 = no limit.
+        min_sweeps (int, optional): Fewest sweeps for any band. Defaults to 2.
+    """
+    def __init__(self, bands: int, max_sweeps: int, target_db: float,
+                 time_budget: float = 0.0, min_sweeps: int = 2):
+        self.bands = bands
+        self.max_sweeps = max_sweeps
+        self.target_db = target_db
+        self.time_budget = time_budget
+        self.min_sweeps = min(min_sweeps, max_sweeps)
+        self.band_sweeps: list[int] = []
+        self.band_times: list[float] = []
+        self._band_start = 0.0
+
+    def start_band(self) -> None:
+        self._band_start = time.time()
+
+    def keep_going(self, stats: TraceStatistics) -> bool:
+        """True if the band needs another sweep, called after each sweep."""
+        if stats.sweeps >= self.max_sweeps:
+            return False
+        if stats.sweeps < self.min_sweeps:
+            return True
+        if stats.converged(self.target_db, self.min_sweeps):
+            return False
+        if self.time_budget > 0:
+            band_elapsed = time.time() - self._band_start
+            per_sweep = band_elapsed / stats.sweeps
+            bands_left = max(1, self.bands - len(self.band_sweeps))
+            share = (self.time_budget - sum(self.band_times)) / bands_left
+            if band_elapsed + per_sweep > share:
+                return False
+        return True
+
+    def end_band(self, stats: TraceStatistics) -> None:
+        self.band_sweeps.append(stats.sweeps)
+        self.band_times.append(time.time() - self._band_start)
+
+# ----- Fini -----
@@ -0,0 +1,40 @@
+"""
+=====[ tinySA Ultra / App Preload Tests ]======================================
+
+The app's background preload must not import matplotlib.pyplot (or
+'live_plot'), which may only be imported on the main thread. Run in a fresh
+interpreter, so the modules other tests imported do not count.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+pytest.importorskip('FreeSimpleGUI')
+
+PRELOAD = f'''
+import sys, json
+sys.path.insert(0, {SRC!r})
+import tinysa_ultra_phase_noise_app as app
+app._preload()
+print(json.dumps({{'preloaded': list(app.PRELOAD_MODULES), 'modules': sorted(sys.modules)}}))
+'''
+
+
+def test_preload_leaves_out_the_gui_modules():
+    out = subprocess.run([sys.executable, '-c', PRELOAD], capture_output=True, text=True, check=True).stdout
+    loaded = json.loads(out.splitlines()[-1])
+    modules = set(loaded['modules'])
+
+    assert set(loaded['preloaded']) <= modules
+    assert 'matplotlib' not in modules
+    assert 'live_plot' not in modules
+
+# ----- Fini -----
@@ -0,0 +1,107 @@
+"""
+=====[ tinySA Ultra / Driver Instrumentation Tests ]===========================
+
+NaN points must be counted under the command that returned them, in both
+drivers, although the points are parsed after the command's prompt was read.
+Retry loops must count every retry and give up, and close() must close the
+trace file.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import math
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tinysa_ultra as tsa  # noqa: E402
+import tinysa_ultra_async as tsa_async  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+
+
+class GarbledDataSimulator(sim.SimulatedTinySA):
+    """Answers 'data' with one unreadable point."""
+    def execute(self, line: str) -> tuple[bytes, float]:
+        response, exec_time = super().execute(line)
+        if line.startswith('data'):
+            lines = response.split(b'\r\n')
+            lines[0] = b'garbled'
+            response = b'\r\n'.join(lines)
+        return (response, exec_time)
+
+
+class NoMarkerSimulator(sim.SimulatedTinySA):
+    """Answers 'marker' with an empty reply."""
+    def execute(self, line: str) -> tuple[bytes, float]:
+        if line.startswith('marker'):
+            return (b'', 0.0)
+        return super().execute(line)
+
+
+def make_transport() -> sim.SimulatedSerial:
+    return sim.SimulatedSerial(GarbledDataSimulator(), time_scale=0)
+
+
+def test_nan_points_keyed_by_command():
+    sa = tsa.tinySA(transport=make_transport(), instrument=True)
+    sa.open()
+    sa.get_amp_data()
+    sa.get_amp_data()
+    sa._fetch_frequencies()
+    sa.close()
+
+    assert sa.snapshot()['nan_points'] == {'data': 2}
+
+
+def test_nan_points_keyed_by_command_async():
+    async def measure():
+        sa = tsa_async.AsyncTinySA(transport=make_transport(), instrument=True)
+        sa.open()
+        await sa.get_amp_data()
+        await sa._fetch_frequencies()
+        sa.close()
+        return sa.snapshot()
+
+    assert asyncio.run(measure())['nan_points'] == {'data': 1}
+
+
+def test_nan_trace_line_names_command(tmp_path):
+    trace = tmp_path / 'trace.jsonl'
+    sa = tsa.tinySA(transport=make_transport(), trace_file=str(trace))
+    sa.open()
+    sa.get_amp_data()
+    sa.close()
+
+    assert '"event": "nan", "cmd": "data", "count": 1' in trace.read_text(encoding='utf-8')
+
+
+def test_marker_retries_are_counted_and_limited():
+    sa = tsa.tinySA(transport=sim.SimulatedSerial(NoMarkerSimulator(), time_scale=0), instrument=True)
+    sa.open()
+    amplitude, frequency = sa.get_marker_value()
+    sa.close()
+
+    snap = sa.snapshot()
+    assert math.isnan(amplitude) and math.isnan(frequency)
+    assert snap['retries'] == {'get_marker_value': 11}
+    assert snap['failures'] == {'get_marker_value': 1}
+    assert snap['commands']['marker']['count'] == 11
+
+
+def test_close_closes_trace_file(tmp_path):
+    trace = tmp_path / 'trace.jsonl'
+    sa = tsa.tinySA(transport=make_transport(), trace_file=str(trace))
+    sa.open()
+    sa.get_sweep()
+    sa.close()
+    assert sa.stats._trace is None
+
+    # A new session appends to the same file
+    sa.open()
+    sa.get_sweep()
+    sa.close()
+    assert trace.read_text(encoding='utf-8').count('"cmd": "sweep"') == 2
+
+# ----- Fini -----
@@ -0,0 +1,123 @@
+"""
+=====[ tinySA Ultra / Measurement Checkpoint Tests ]===========================
+
+A run interrupted on the simulator resumes from its checkpoint: the saved
+bands come back unchanged, only the missing bands are measured, and the
+checkpoint is removed when the run completes. A checkpoint of other
+settings, or a carrier that moved, refuse to resume.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tinysa_ultra as tsa  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+import phase_noise  # noqa: E402
+
+BANDS = 4
+INTERRUPTED_AFTER = 2
+
+
+class Interrupted(Exception):
+    pass
+
+
+def simulated(**device_args) -> tsa.tinySA:
+    return tsa.tinySA(transport=sim.SimulatedSerial(sim.SimulatedTinySA(**device_args), time_scale=0))
+
+
+def make_job(checkpoint: str, **settings) -> phase_noise.PhaseNoiseJob:
+    return phase_noise.PhaseNoiseJob(test_name='DUT 1', average='host4', checkpoint=checkpoint,
+                                     offsets=phase_noise.FREQUENCY_OFFSET_LIST[:BANDS], **settings)
+
+
+def interrupted_run(job: phase_noise.PhaseNoiseJob) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """Runs 'job' until INTERRUPTED_AFTER bands are saved, returns them by band."""
+    saved = {}
+
+    def on_band(band, freq, amp, uncertainty):
+        saved[band] = (freq.copy(), amp.copy())
+        if len(saved) == INTERRUPTED_AFTER:
+            raise Interrupted
+
+    with pytest.raises(Interrupted):
+        phase_noise.measure_phase_noise(simulated(), job, progress=lambda msg: None, on_band=on_band)
+    return saved
+
+
+def test_resume_keeps_the_saved_bands(tmp_path):
+    checkpoint = str(tmp_path / 'run.checkpoint.jsonl')
+    saved = interrupted_run(make_job(checkpoint))
+    first = phase_noise.Checkpoint(checkpoint)
+    assert first.load(make_job(checkpoint))
+    assert sorted(first.bands) == list(range(INTERRUPTED_AFTER))
+
+    messages = []
+    result = phase_noise.measure_phase_noise(simulated(), make_job(checkpoint, resume=True),
+                                             progress=messages.append)
+
+    assert f'Resuming, {INTERRUPTED_AFTER} of {BANDS} bands were saved.' in messages
+    assert result.time_start == first.run['time_start']
+    assert result.band_sweeps == [4] * BANDS
+    band_start = np.concatenate(([0], np.cumsum(result.band_points)))
+    for band, (freq, amp) in saved.items():
+        band_slice = slice(band_start[band], band_start[band + 1])
+        assert np.array_equal(result.freq[band_slice], freq)
+        assert np.array_equal(result.amp[band_slice], amp)
+
+    # Only the missing bands were measured
+    assert sum(msg.startswith('Measuring offset') for msg in messages) == BANDS - INTERRUPTED_AFTER
+    assert not np.isnan(result.amp).any()
+    assert not os.path.exists(checkpoint)
+
+
+def test_resume_without_checkpoint_starts_over(tmp_path):
+    checkpoint = str(tmp_path / 'run.checkpoint.jsonl')
+    messages = []
+    result = phase_noise.measure_phase_noise(simulated(), make_job(checkpoint, resume=True),
+                                             progress=messages.append)
+
+    assert not any(msg.startswith('Resuming') for msg in messages)
+    assert result.band_sweeps == [4] * BANDS
+    assert not os.path.exists(checkpoint)
+
+
+def test_line_cut_short_is_ignored(tmp_path):
+    checkpoint = str(tmp_path / 'run.checkpoint.jsonl')
+    interrupted_run(make_job(checkpoint))
+    with open(checkpoint, 'a', encoding='utf-8') as f:
+        f.write('{"band": 2, "sweeps": 4, "freq": [1000.0, 10')
+
+    saved = phase_noise.Checkpoint(checkpoint)
+    assert saved.load(make_job(checkpoint))
+    assert sorted(saved.bands) == list(range(INTERRUPTED_AFTER))
+
+
+def test_other_settings_do_not_resume(tmp_path):
+    checkpoint = str(tmp_path / 'run.checkpoint.jsonl')
+    interrupted_run(make_job(checkpoint))
+
+    with pytest.raises(ValueError, match='other measurement settings'):
+        phase_noise.measure_phase_noise(simulated(), make_job(checkpoint, resume=True, acquisition='scanraw'),
+                                        progress=lambda msg: None)
+    assert os.path.exists(checkpoint)
+
+
+def test_moved_carrier_does_not_resume(tmp_path):
+    checkpoint = str(tmp_path / 'run.checkpoint.jsonl')
+    interrupted_run(make_job(checkpoint))
+
+    sa = simulated(carrier_amplitude=-20.0)
+    with pytest.raises(ValueError, match='Can not resume'):
+        phase_noise.measure_phase_noise(sa, make_job(checkpoint, resume=True), progress=lambda msg: None)
+    assert sa.serial is None
+    assert os.path.exists(checkpoint)
+
+# ----- Fini -----
@@ -0,0 +1,101 @@
+"""
+=====[ tinySA Ultra / Phase Noise Analysis Tests ]=============================
+
+The log-log integration is exact on a power law, whatever the point spacing,
+so the figures of 1/f^n curves are checked against their closed forms, and
+a run measured on the simulator against the phase noise profile it was
+given.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import math
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tinysa_ultra as tsa  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+import phase_noise  # noqa: E402
+import pn_analysis  # noqa: E402
+
+L_1K = -100.0           # dBc/Hz at 1 kHz
+F_LOW, F_HIGH = 1e3, 1e6
+
+
+def power_law(freq: np.ndarray, slope_db_per_decade: float) -> np.ndarray:
+    return L_1K + slope_db_per_decade * np.log10(freq / 1e3)
+
+
+@pytest.mark.parametrize('points', [4, 31, 1000])
+def test_one_over_f_squared(points):
+    freq = np.logspace(3, 6, points)
+    figures = pn_analysis.analyze(freq, power_law(freq, -20.0), 10e6, F_LOW, F_HIGH)
+
+    # L(f) = L1 * (f1 / f)^2
+    l1 = 10 ** (L_1K / 10)
+    noise = l1 * F_LOW ** 2 * (1 / F_LOW - 1 / F_HIGH)
+    assert figures.integrated_dbc == pytest.approx(10 * math.log10(noise), abs=1e-9)
+    assert figures.rms_phase_rad == pytest.approx(math.sqrt(2 * noise))
+    assert figures.rms_jitter_s == pytest.approx(math.sqrt(2 * noise) / (2 * math.pi * 10e6))
+    assert figures.residual_fm_hz == pytest.approx(math.sqrt(2 * l1 * F_LOW ** 2 * (F_HIGH - F_LOW)))
+
+
+def test_one_over_f_is_a_log():
+    freq = np.logspace(3, 6, 7)
+    noise = pn_analysis.integrated_noise(freq, power_law(freq, -10.0), F_LOW, F_HIGH)
+    assert noise == pytest.approx(10 ** (L_1K / 10) * F_LOW * math.log(F_HIGH / F_LOW))
+
+
+def test_flat_and_limits_inside_the_trace():
+    freq = np.linspace(100.0, 10e6, 5000)
+    noise = pn_analysis.integrated_noise(freq, np.full(len(freq), L_1K), 2e3, 20e3)
+    assert noise == pytest.approx(10 ** (L_1K / 10) * 18e3)
+
+
+def test_limits_are_clipped_to_the_trace():
+    freq = np.logspace(4, 5, 50)
+    figures = pn_analysis.analyze(freq, power_law(freq, -20.0), 10e6, F_LOW, F_HIGH)
+    assert (figures.f_low, figures.f_high) == pytest.approx((1e4, 1e5))
+
+
+def test_spot_noise():
+    freq = np.logspace(3, 6, 301)
+    amp = power_law(freq, -20.0)
+    assert pn_analysis.spot_noise(freq, amp, width=0) == pytest.approx([-100.0, -120.0, -140.0, -160.0])
+
+    # Power averaged over the window, a little above the line at its center
+    spots = pn_analysis.spot_noise(freq, amp, (1e4, 1e5))
+    assert spots == pytest.approx([-120.0, -140.0], abs=0.1)
+    assert np.isnan(pn_analysis.spot_noise(freq, amp, (100.0, 1e7))).all()
+
+
+def test_many_runs_at_once():
+    freq = np.logspace(3, 6, 61)
+    runs = np.vstack((power_law(freq, -20.0), power_law(freq, -20.0) - 10.0))
+    figures = pn_analysis.analyze(freq, runs, np.array([10e6, 20e6]), F_LOW, F_HIGH)
+    single = pn_analysis.analyze(freq, runs[0], 10e6, F_LOW, F_HIGH)
+
+    assert figures.integrated_dbc == pytest.approx([single.integrated_dbc, single.integrated_dbc - 10.0])
+    assert figures.rms_jitter_s[1] == pytest.approx(single.rms_jitter_s / math.sqrt(10) / 2)
+    assert figures.spot[1e4] == pytest.approx([single.spot[1e4], single.spot[1e4] - 10.0])
+
+
+def test_simulated_run_matches_its_profile():
+    device = sim.SimulatedTinySA(pn_profile=[(1e3, -95.0), (1e6, -155.0)], noise_floor=-200.0, seed=3)
+    sa = tsa.tinySA(transport=sim.SimulatedSerial(device, time_scale=0))
+    job = phase_noise.PhaseNoiseJob(test_name='DUT 1', average='host16')
+    result = phase_noise.measure_phase_noise(sa, job, progress=lambda msg: None)
+
+    # -20 dB / decade from -95 dBc/Hz at 1 kHz
+    spots = pn_analysis.spot_noise(result.freq, result.amp, (10e3, 100e3))
+    assert spots == pytest.approx([-115.0, -135.0], abs=1.0)
+    expected = pn_analysis.integrated_noise(np.array([1e3, 1e6]), np.array([-95.0, -155.0]), 10e3, 1e6)
+    figures = pn_analysis.analyze_result(result, 10e3, 1e6)
+    assert figures.integrated_dbc == pytest.approx(10 * math.log10(expected), abs=0.5)
+
+# ----- Fini -----
@@ -0,0 +1,75 @@
+"""
+=====[ tinySA Ultra / Run Archive Tests ]======================================
+
+Runs measured on the simulator go into an archive, spot values agree with
+'pn_analysis', and runs that stop short of a spot offset (NULL in the index)
+are listed, queried and trended without errors.
+
+Usage:
+    python -m pytest tests
+"""
+import io
+import os
+import sys
+import math
+import contextlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tinysa_ultra as tsa  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+import phase_noise  # noqa: E402
+import pn_analysis  # noqa: E402
+import pn_archive  # noqa: E402
+
+
+def measure(bands: int) -> phase_noise.PhaseNoiseResult:
+    sa = tsa.tinySA(transport=sim.SimulatedSerial(time_scale=0))
+    job = phase_noise.PhaseNoiseJob(test_name='DUT 1', average='off',
+                                    offsets=phase_noise.FREQUENCY_OFFSET_LIST[:bands])
+    with contextlib.redirect_stdout(io.StringIO()):
+        return phase_noise.measure_phase_noise(sa, job, progress=lambda msg: None)
+
+
+@pytest.fixture(scope='module')
+def runs() -> tuple[phase_noise.PhaseNoiseResult, phase_noise.PhaseNoiseResult]:
+    return (measure(len(phase_noise.FREQUENCY_OFFSET_LIST)), measure(2))
+
+
+def test_spot_values_match_analysis(tmp_path, runs):
+    full, _ = runs
+    with pn_archive.RunArchive(str(tmp_path)) as archive:
+        archive.add(full)
+        row = archive.query(test_name='DUT 1')[0]
+    expected = pn_analysis.spot_noise(full.freq, full.amp, list(pn_archive.SPOT_OFFSETS.values()))
+    assert [row[c] for c in pn_archive.SPOT_OFFSETS] == pytest.approx(list(expected))
+
+
+def test_short_run_has_null_spots(tmp_path, runs, capsys):
+    full, short = runs
+    with pn_archive.RunArchive(str(tmp_path)) as archive:
+        archive.add(full)
+        archive.add(short)
+        rows = archive.query()
+        times, dbc = archive.trend(1e6)
+
+    assert rows[1]['spot_1m'] is None
+    assert rows[1]['spot_1k'] is not None
+    assert len(times) == 2 and not math.isnan(dbc[0]) and math.isnan(dbc[1])
+
+    assert pn_archive.main([str(tmp_path)]) == 0
+    assert '2 runs' in capsys.readouterr().out
+
+
+def test_trace_round_trip(tmp_path, runs):
+    full, _ = runs
+    with pn_archive.RunArchive(str(tmp_path)) as archive:
+        run_id = archive.add(full)
+        with archive.load(run_id) as rf:
+            assert np.array_equal(rf.freq, full.freq)
+            assert np.array_equal(rf.amp, full.amp, equal_nan=True)
+
+# ----- Fini -----
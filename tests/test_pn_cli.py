@@ -0,0 +1,53 @@
+"""
+=====[ tinySA Ultra / Command Line Runner Tests ]==============================
+
+Per device progress of parallel runs on simulated analyzers, and checkpoint
+file names that keep jobs apart and inside the checkpoint directory.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import phase_noise  # noqa: E402
+import pn_cli  # noqa: E402
+import multi_analyzer  # noqa: E402
+
+
+def test_parallel_progress_is_prefixed_per_device(tmp_path, capsys):
+    registry = multi_analyzer.DeviceRegistry.simulated(2, time_scale=0)
+    jobs = [phase_noise.PhaseNoiseJob(test_name=f'DUT {i}', average='off',
+                                      offsets=phase_noise.FREQUENCY_OFFSET_LIST[:2]) for i in range(4)]
+    messages = []
+    lock = threading.Lock()
+
+    def progress(msg: str) -> None:
+        with lock:
+            messages.append(msg)
+
+    results = multi_analyzer.run_jobs_parallel(registry, jobs, str(tmp_path), progress=progress, csv=False)
+
+    assert sum(len(r) for r in results.values()) == 4
+    assert all(msg.startswith(('[sim0] ', '[sim1] ')) for msg in messages)
+    assert any('Center Frequency = ' in msg for msg in messages)
+    assert any('Sweeps averaged per band' in msg for msg in messages)
+    assert capsys.readouterr().out == ''
+
+
+def test_checkpoint_file_names(tmp_path):
+    jobs = [phase_noise.PhaseNoiseJob(test_name='DUT 1'),
+            phase_noise.PhaseNoiseJob(test_name='DUT 1'),
+            phase_noise.PhaseNoiseJob(test_name='../../escape/DUT: 2', device='/dev/ttyACM0')]
+    names = [pn_cli.checkpoint_file_name(job, i, str(tmp_path)) for i, job in enumerate(jobs)]
+
+    assert len(set(names)) == len(names)
+    for name in names:
+        assert os.path.dirname(name) == str(tmp_path)
+        assert name.endswith('.checkpoint.jsonl')
+    assert '/dev/ttyACM0' not in os.path.basename(names[2])
+
+# ----- Fini -----
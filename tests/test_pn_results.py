@@ -0,0 +1,110 @@
+"""
+=====[ tinySA Ultra / Result File Tests ]======================================
+
+A simulated run written as a '.pnr' file reads back through the memmaps
+unchanged, header, band table and data. Center drift is kept per band: a run
+resumed from a checkpoint has NaN drift for the restored bands and the drift
+of each band it measured in its own band table row.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import math
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tinysa_ultra as tsa  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+import phase_noise  # noqa: E402
+import pn_results  # noqa: E402
+
+BANDS = 4
+INTERRUPTED_AFTER = 2
+
+
+class Interrupted(Exception):
+    pass
+
+
+def simulated() -> tsa.tinySA:
+    return tsa.tinySA(transport=sim.SimulatedSerial(time_scale=0))
+
+
+def test_round_trip(tmp_path):
+    job = phase_noise.PhaseNoiseJob(test_name='DUT \u00b5 1', average='host4', pipelined=True,
+                                    offsets=phase_noise.FREQUENCY_OFFSET_LIST[:BANDS])
+    result = phase_noise.measure_phase_noise(simulated(), job, progress=lambda msg: None)
+    file_name = str(tmp_path / 'run.pnr')
+    pn_results.write_result_file(file_name, result)
+
+    with pn_results.ResultFile(file_name) as rf:
+        assert isinstance(rf.amp, np.memmap)
+        assert (rf.test_name, rf.average, rf.acquisition) == ('DUT \u00b5 1', 'host4', job.acquisition)
+        assert (rf.center_frequency, rf.center_amplitude) == (result.center_frequency, result.center_amplitude)
+        assert rf.time_start == result.time_start
+        assert rf.pipelined and not rf.recenter
+        assert rf.bands['sweeps'].tolist() == result.band_sweeps
+        assert rf.bands['points'].tolist() == result.band_points
+        assert rf.bands['start'].tolist() == [band[0] for band in job.offsets]
+        assert np.array_equal(rf.freq, result.freq)
+        assert np.array_equal(rf.amp, result.amp)
+        assert np.array_equal(rf.uncertainty, result.uncertainty, equal_nan=True)
+
+        freq, amp, _ = rf.band(1)
+        start = result.band_points[0]
+        assert np.array_equal(freq, result.freq[start:start + result.band_points[1]])
+        assert freq[0] >= job.offsets[1][0] - 1.0
+
+        csv_file = str(tmp_path / 'run.csv')
+        rf.export_csv(csv_file)
+    assert np.loadtxt(csv_file, delimiter=',') == pytest.approx(np.column_stack((result.freq, result.amp)))
+
+
+def test_not_a_result_file(tmp_path):
+    file_name = tmp_path / 'run.pnr'
+    file_name.write_bytes(b'frequency,amplitude\n' * 20)
+    with pytest.raises(ValueError, match='not a phase noise result file'):
+        pn_results.ResultFile(str(file_name))
+
+
+def test_truncated_file(tmp_path):
+    job = phase_noise.PhaseNoiseJob(test_name='DUT 1', average='off', offsets=phase_noise.FREQUENCY_OFFSET_LIST[:2])
+    result = phase_noise.measure_phase_noise(simulated(), job, progress=lambda msg: None)
+    file_name = tmp_path / 'run.pnr'
+    pn_results.write_result_file(str(file_name), result)
+    file_name.write_bytes(file_name.read_bytes()[:-8])
+
+    with pytest.raises(ValueError, match='truncated'):
+        pn_results.ResultFile(str(file_name))
+
+
+def test_resumed_drift_is_keyed_by_band(tmp_path):
+    checkpoint = str(tmp_path / 'run.checkpoint.jsonl')
+    job = phase_noise.PhaseNoiseJob(test_name='DUT 1', average='off', recenter=True, checkpoint=checkpoint,
+                                    offsets=phase_noise.FREQUENCY_OFFSET_LIST[:BANDS])
+
+    def on_band(band, *_):
+        if band == INTERRUPTED_AFTER - 1:
+            raise Interrupted
+
+    with pytest.raises(Interrupted):
+        phase_noise.measure_phase_noise(simulated(), job, progress=lambda msg: None, on_band=on_band)
+
+    job.resume = True
+    result = phase_noise.measure_phase_noise(simulated(), job, progress=lambda msg: None)
+    assert len(result.center_drift) == BANDS
+    assert all(math.isnan(d) for d in result.center_drift[:INTERRUPTED_AFTER])
+    assert not any(math.isnan(d) for d in result.center_drift[INTERRUPTED_AFTER:])
+
+    file_name = str(tmp_path / 'run.pnr')
+    pn_results.write_result_file(file_name, result)
+    with pn_results.ResultFile(file_name) as rf:
+        assert np.array_equal(rf.bands['center_drift'], result.center_drift, equal_nan=True)
+        assert (pn_results.RESULT_HEADER.size + BANDS * pn_results.BAND_DTYPE.itemsize) % 8 == 0
+
+# ----- Fini -----
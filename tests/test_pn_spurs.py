@@ -0,0 +1,91 @@
+"""
+=====[ tinySA Ultra / Spur Detection Tests ]===================================
+
+Spurs the simulator is given are found at their offset and power, in the
+run and again in the merged trace, noise alone gives none, and a bump wider
+than a spur is left to the noise shape. Removed spurs (NaN) must be resampled
+away before smoothing.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tinysa_ultra as tsa  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+import phase_noise  # noqa: E402
+import pn_spurs  # noqa: E402
+import log_grid  # noqa: E402
+import savitzky_golay_filter as sgf  # noqa: E402
+
+SPURS = [(20e3, -70.0), (150e3, -80.0)]     # (offset Hz, dBc)
+
+
+def measure(spurs=None, seed: int = 1) -> phase_noise.PhaseNoiseResult:
+    device = sim.SimulatedTinySA(spurs=spurs, seed=seed)
+    sa = tsa.tinySA(transport=sim.SimulatedSerial(device, time_scale=0))
+    job = phase_noise.PhaseNoiseJob(test_name='DUT 1', average='host4', spurs=True)
+    return phase_noise.measure_phase_noise(sa, job, progress=lambda msg: None)
+
+
+@pytest.fixture(scope='module')
+def run() -> phase_noise.PhaseNoiseResult:
+    return measure(SPURS)
+
+
+def test_simulated_spurs_are_found(run):
+    assert len(run.spurs) == len(SPURS)
+    for spur, (offset, dbc) in zip(run.spurs, SPURS):
+        # Within a point of the peak, the band of 150 kHz has 445 Hz spacing
+        assert spur['offset'] == pytest.approx(offset, abs=500.0)
+        assert spur['dbc'] == pytest.approx(dbc, abs=1.0)
+        assert spur['height'] >= pn_spurs.SPUR_THRESHOLD
+
+    assert len(run.spur_mask) == len(run.freq)
+    assert run.spur_mask.sum() < 0.02 * len(run.freq)
+    for offset, _ in SPURS:
+        assert run.spur_mask[np.argmin(np.abs(run.freq - offset))]
+
+
+def test_merged_trace_gives_the_same_spurs(run):
+    spurs, mask = pn_spurs.find_spurs_in_trace(run.freq, run.amp, run.job.offsets)
+    assert np.array_equal(spurs[['offset', 'dbc']], run.spurs[['offset', 'dbc']])
+    # A point on a band edge goes to the lower band, the spacing (and so widths) can differ a little
+    assert spurs['width'] == pytest.approx(run.spurs['width'], rel=0.01)
+    assert np.array_equal(mask, run.spur_mask)
+
+
+def test_no_spurs_in_noise():
+    assert len(measure(seed=2).spurs) == 0
+
+
+def test_tone_and_wide_bump():
+    rng = np.random.default_rng(1)
+    freq = np.linspace(10e3, 30e3, 450)
+    amp = -110.0 + rng.normal(0.0, 0.5, len(freq))
+    amp[100:103] += [15.0, 25.0, 15.0]                  # A spur, 3 points
+    amp[300:360] += 20.0                                # Noise shape, 60 points
+
+    spurs, mask = pn_spurs.find_spurs(freq, amp)
+    assert spurs['offset'].tolist() == [freq[101]]
+    assert spurs['dbc'][0] == pytest.approx(amp[101])
+    assert np.flatnonzero(mask).tolist() == [99, 100, 101, 102, 103]
+
+    clean = pn_spurs.remove_spurs(amp, mask)
+    assert np.isnan(clean[mask]).all()
+    assert np.array_equal(clean[~mask], amp[~mask])
+
+def test_removed_spurs_are_resampled_before_smoothing(run):
+    clean = pn_spurs.remove_spurs(run.amp, run.spur_mask)
+    assert np.isnan(sgf.savitzky_golay(clean, 31, 3)).sum() > run.spur_mask.sum()
+
+    _, y_grid = log_grid.resample_log(run.freq, clean, 100)
+    assert not np.isnan(sgf.savitzky_golay(y_grid, 31, 3)).any()
+
+# ----- Fini -----
@@ -0,0 +1,207 @@
+"""
+=====[ tinySA Ultra / Driver Tests ]===========================================
+
+The driver against the simulated tinySA: transactions go out in bursts and
+every response is read up to its own 'ch>' prompt, the frequency axis is
+computed from the cached sweep settings and checked once against the
+tinySA, and 'scanraw' frames are decoded (or fall back on older FW).
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import asyncio
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tinysa_ultra as tsa  # noqa: E402
+import tinysa_ultra_async as tsa_async  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+
+
+class RecordingSerial(sim.SimulatedSerial):
+    """Keeps every write, so the bursts can be checked."""
+    def __init__(self, device=None):
+        super().__init__(device, time_scale=0)
+        self.writes = []
+
+    def write(self, data: bytes) -> int:
+        self.writes.append(data)
+        return super().write(data)
+
+
+class ShiftedFrequenciesSimulator(sim.SimulatedTinySA):
+    """Answers 'frequencies' with an axis 1 kHz off the sweep settings."""
+    def _cmd_frequencies(self, args) -> tuple[bytes, float]:
+        return (''.join(f'{int(f + 1e3)}\r\n' for f in self.frequencies()).encode(), 0.0)
+
+
+class RecordingScanSimulator(sim.SimulatedTinySA):
+    """Keeps the last trace it measured, in dBm."""
+    def spectrum(self, freqs: np.ndarray) -> np.ndarray:
+        self.last_scan = super().spectrum(freqs)
+        return self.last_scan
+
+
+class BadFrameSimulator(sim.SimulatedTinySA):
+    """Ends the 'scanraw' frame with the wrong byte."""
+    def _cmd_scanraw(self, args) -> tuple[bytes, float]:
+        response, exec_time = super()._cmd_scanraw(args)
+        return (response[:-1] + b']', exec_time)
+
+
+class OldFirmwareSimulator(sim.SimulatedTinySA):
+    """FW without 'scanraw'."""
+    _cmd_scanraw = None
+
+
+def open_driver(device=None, **driver_args) -> tuple[tsa.tinySA, RecordingSerial]:
+    transport = RecordingSerial(device)
+    sa = tsa.tinySA(transport=transport, instrument=True, **driver_args)
+    sa.open()
+    return (sa, transport)
+
+
+# * ===== Transactions ==========================================================
+def test_transaction_is_one_burst():
+    sa, transport = open_driver()
+    with sa.transaction() as responses:
+        sa.set_rbw(0)
+        sa.calc('off')
+        sa.pause()
+        assert transport.writes == []
+
+    assert transport.writes == [b'rbw auto\rcalc off\rpause\r']
+    assert responses == ['', '', '']
+    assert sa.snapshot()['commands']['pause']['count'] == 1
+
+    # The prompts were all read, the next query is framed right
+    assert sa.get_sweep() == (9999000.0, 10001000.0, 450)
+
+
+def test_transaction_flushes_before_a_query():
+    sa, transport = open_driver()
+    with sa.transaction() as responses:
+        sa.set_start_stop(10.1e6, 10.2e6)
+        start, stop, _ = sa.get_sweep()
+        sa._send_command('bogus\r')
+
+    assert (start, stop) == (10.1e6, 10.2e6)
+    assert transport.writes == [b'sweep start 10100000\rsweep stop 10200000\r', b'sweep\r', b'bogus\r']
+    assert responses == ['', '', 'bogus?']
+
+
+def test_transaction_bursts_are_split():
+    sa, transport = open_driver()
+    with sa.transaction() as responses:
+        for _ in range(20):
+            sa.wait()
+
+    assert len(responses) == 20
+    assert len(transport.writes) > 1
+    assert all(len(burst) <= tsa.TRANSACTION_BURST for burst in transport.writes)
+    assert b''.join(transport.writes) == b'wait\r' * 20
+
+
+def test_transactions_off_sends_one_by_one():
+    sa, transport = open_driver(transactions=False)
+    with sa.transaction():
+        sa.calc('off')
+        sa.pause()
+
+    assert transport.writes == [b'calc off\r', b'pause\r']
+
+
+def test_async_transaction_is_one_burst():
+    async def setup(sa):
+        async with sa.transaction() as responses:
+            await sa.set_rbw(0)
+            await sa.calc('off')
+            await sa.pause()
+        return (responses, await sa.get_sweep())
+
+    transport = RecordingSerial()
+    sa = tsa_async.AsyncTinySA(transport=transport)
+    sa.open()
+    responses, sweep = asyncio.run(setup(sa))
+    sa.close()
+
+    assert transport.writes[0] == b'rbw auto\rcalc off\rpause\r'
+    assert responses == ['', '', '']
+    assert sweep == (9999000.0, 10001000.0, 450)
+
+
+# * ===== Frequency axis ========================================================
+def test_frequency_axis_is_computed_and_validated_once():
+    sa, transport = open_driver()
+    sa.set_start_stop(10.01e6, 10.03e6)
+    sa.get_sweep()
+    expected = transport.device.frequencies()
+
+    for _ in range(3):
+        assert np.array_equal(sa.get_freq_data(), expected)
+
+    assert sa.snapshot()['commands']['frequencies']['count'] == 1
+    assert sa.frequencies_cached
+
+
+def test_frequency_axis_follows_the_cached_settings():
+    sa, transport = open_driver(frequency_validation='off')
+    sa.get_sweep()
+    sa.set_start_stop(10.1e6, 10.3e6)
+
+    assert np.array_equal(sa.get_freq_data(), np.round(np.linspace(10.1e6, 10.3e6, 450)))
+    assert 'frequencies' not in sa.snapshot()['commands']
+
+
+def test_wrong_computed_axis_is_dropped():
+    sa, transport = open_driver(ShiftedFrequenciesSimulator())
+    sa.get_sweep()
+
+    freq = sa.get_freq_data()
+    assert np.array_equal(freq, transport.device.frequencies() + 1e3)
+    assert not sa.frequencies_cached
+
+    # Fetched from the tinySA for the rest of the session
+    sa.get_freq_data()
+    assert sa.snapshot()['commands']['frequencies']['count'] == 2
+
+
+# * ===== scanraw ===============================================================
+def test_scanraw_is_decoded():
+    device = RecordingScanSimulator()
+    sa, transport = open_driver(device)
+    freq, amp = sa.get_raw_scan(10.01e6, 10.03e6, 290)
+
+    assert np.array_equal(freq, np.linspace(10.01e6, 10.03e6, 290))
+    # The FW sends 1/32 dB steps
+    assert amp == pytest.approx(device.last_scan, abs=1 / 64)
+    assert (sa.sweep_start, sa.sweep_stop) == (10.01e6, 10.03e6)
+    # The binary frame and its prompt were read, the next query is framed right
+    assert sa.get_sweep() == (10.01e6, 10.03e6, 450)
+
+
+def test_bad_scanraw_frame_is_nan():
+    sa, transport = open_driver(BadFrameSimulator())
+    _, amp = sa.get_raw_scan(10.01e6, 10.03e6, 100)
+
+    assert np.isnan(amp).all()
+    assert sa.snapshot()['nan_points'] == {'scanraw': 100}
+
+
+def test_scanraw_falls_back_on_old_firmware():
+    sa, transport = open_driver(OldFirmwareSimulator())
+    freq, amp = sa.get_raw_scan(10.01e6, 10.03e6)
+
+    assert not sa.scanraw_supported
+    assert len(freq) == len(amp) == 450
+    assert not np.isnan(amp).any()
+
+    sa.get_raw_scan(10.01e6, 10.03e6)
+    assert sa.snapshot()['commands']['scanraw']['count'] == 1
+
+# ----- Fini -----
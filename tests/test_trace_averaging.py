@@ -0,0 +1,111 @@
+"""
+=====[ tinySA Ultra / Host Averaging Tests ]===================================
+
+Power domain averaging, and the AveragingScheduler stopping each band on
+its sweep limits, on convergence and on its share of the time budget.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import itertools
+import types
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import trace_averaging as tav  # noqa: E402
+import tinysa_simulator as sim  # noqa: E402
+
+POINTS = 450
+
+
+class Clock:
+    """Stands in for time.time(), moved on by hand."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def noisy_sweeps(seed: int = 1):
+    """Endless single sweeps of the simulator noise floor."""
+    device = sim.SimulatedTinySA(seed=seed)
+    freqs = device.frequencies(device.carrier_frequency + 100e3, device.carrier_frequency + 300e3)
+    while True:
+        yield device.spectrum(freqs)
+
+
+def run_band(scheduler: tav.AveragingScheduler, sweeps, clock: Clock | None = None,
+             sweep_time: float = 1.0) -> tav.TraceStatistics:
+    """Sweeps one band for as long as the scheduler asks."""
+    stats = tav.TraceStatistics(POINTS)
+    scheduler.start_band()
+    while True:
+        if clock is not None:
+            clock.now += sweep_time
+        stats.update(next(sweeps))
+        if not scheduler.keep_going(stats):
+            break
+    scheduler.end_band(stats)
+    return stats
+
+
+def test_power_average_and_nan_points():
+    stats = tav.TraceStatistics(2)
+    stats.update([-10.0, np.nan])
+    stats.update([-20.0, -30.0])
+
+    assert stats.mean_dbm == pytest.approx([10 * np.log10((0.1 + 0.01) / 2), -30.0])
+    assert stats.count.tolist() == [2, 1]
+    assert stats.min_dbm.tolist() == [-20.0, -30.0]
+    assert np.isnan(stats.uncertainty_db()[1])
+
+
+def test_stops_at_max_sweeps():
+    scheduler = tav.AveragingScheduler(bands=2, max_sweeps=8, target_db=1e-3)
+    sweeps = noisy_sweeps()
+    for _ in range(2):
+        run_band(scheduler, sweeps)
+
+    assert scheduler.band_sweeps == [8, 8]
+
+
+def test_stops_when_converged():
+    scheduler = tav.AveragingScheduler(bands=1, max_sweeps=256, target_db=0.5)
+    stats = run_band(scheduler, noisy_sweeps())
+
+    assert 2 <= scheduler.band_sweeps[0] < 256
+    assert stats.noise_floor_uncertainty_db() <= 0.5
+
+
+def test_min_sweeps_before_converging():
+    flat = itertools.repeat(np.full(POINTS, -100.0))
+    scheduler = tav.AveragingScheduler(bands=1, max_sweeps=16, target_db=1.0, min_sweeps=3)
+    run_band(scheduler, flat)
+
+    assert scheduler.band_sweeps == [3]
+
+
+def test_stops_on_time_budget(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tav, 'time', types.SimpleNamespace(time=clock))
+    scheduler = tav.AveragingScheduler(bands=2, max_sweeps=100, target_db=1e-3, time_budget=10.0)
+    sweeps = noisy_sweeps()
+
+    # An equal share, 5 s of 1 s sweeps
+    run_band(scheduler, sweeps, clock)
+    assert scheduler.band_sweeps == [5]
+
+    # Time a band does not use goes to the bands after it, a noise free band converges at once
+    scheduler = tav.AveragingScheduler(bands=3, max_sweeps=100, target_db=1e-3, time_budget=12.0)
+    run_band(scheduler, itertools.repeat(np.full(POINTS, -100.0)), clock)
+    run_band(scheduler, sweeps, clock)
+    assert scheduler.band_sweeps == [2, 5]
+    assert sum(scheduler.band_times) <= 12.0
+
+# ----- Fini -----